@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_engine
+from clean import iter_clean_table
+from detecteur import data_fingerprint, save_detector, score_detector
+from codes_barres import flag_barcodes
+
+###############################################################################
+# Scoring d'anomalies hors mémoire : la table est parcourue par blocs
+###############################################################################
+# Passe 1 : le scaler est ajusté bloc par bloc (partial_fit) et un échantillon réservoir
+#           de taille fixe est constitué ; l'Isolation Forest (et l'autoencodeur) sont
+#           appris sur cet échantillon.
+# Passe 2 : la table est relue et scorée bloc par bloc, les résultats écrits au fil de l'eau.
+# La mémoire dépend de la taille des blocs et du réservoir, plus l'ensemble des empreintes
+# de lignes du dédoublonnage (iter_clean_table), qui croît avec le nombre de lignes distinctes.
+CHUNKSIZE = 100_000
+RESERVOIR_SIZE = 200_000
+AUTOENC_QUANTILE = 0.95
+
+class QuantileSketch:
+    """
+    Sketch de quantiles à erreur relative bornée (principe de DDSketch) : chaque valeur
+    non nulle est comptée, selon son signe, dans un intervalle géométrique de sa valeur
+    absolue ]gamma^(k-1), gamma^k]. La mémoire dépend du logarithme de l'étendue des
+    valeurs, pas de leur nombre, et deux sketchs se fusionnent en additionnant leurs compteurs.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.bins = {}
+        self.negative_bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _add_bins(self, bins, values):
+        keys, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, n in zip(keys.tolist(), counts.tolist()):
+            bins[key] = bins.get(key, 0) + n
+
+    def add(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        negative = -values[values < 0]
+        self._add_bins(self.bins, positive)
+        self._add_bins(self.negative_bins, negative)
+        self.zero_count += len(values) - len(positive) - len(negative)
+        self.count += len(values)
+
+    def merge(self, other):
+        for bins, other_bins in ((self.bins, other.bins), (self.negative_bins, other.negative_bins)):
+            for key, n in other_bins.items():
+                bins[key] = bins.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float("nan")
+        rank = q * (self.count - 1)
+        # Valeurs croissantes : négatives (de la plus grande valeur absolue à la plus petite), zéros, positives
+        cumulated = 0
+        for key in sorted(self.negative_bins, reverse=True):
+            cumulated += self.negative_bins[key]
+            if cumulated > rank:
+                return -self._value(key)
+        cumulated += self.zero_count
+        if rank < cumulated:
+            return 0.0
+        for key in sorted(self.bins):
+            cumulated += self.bins[key]
+            if cumulated > rank:
+                return self._value(key)
+        return self._value(max(self.bins)) if self.bins else 0.0
+
+def _reservoir_update(reservoir, values, seen, size, rng):
+    """
+    Échantillonnage réservoir (algorithme R) vectorisé sur un bloc : chaque ligne vue a la
+    même probabilité size / seen de figurer dans l'échantillon final.
+    """
+    n_fill = max(0, min(size - len(reservoir), len(values)))
+    if n_fill:
+        reservoir = np.vstack([reservoir, values[:n_fill]])
+    rest = values[n_fill:]
+    positions = seen + n_fill + np.arange(1, len(rest) + 1)
+    slots = (rng.random(len(rest)) * positions).astype(np.int64)
+    kept = slots < size
+    reservoir[slots[kept]] = rest[kept]
+    return reservoir, seen + len(values)
+
+def _numeric_values(chunk, features):
+    """Valeurs float64 des lignes complètes du bloc (index conservé)."""
+    X = chunk[features].apply(pd.to_numeric, errors='coerce').dropna()
+    return X, X.to_numpy(dtype="float64")
+
+def fit_streaming(engine, table="codebarre", chunksize=CHUNKSIZE, reservoir_size=RESERVOIR_SIZE,
+                  contamination=0.01, autoencoder=False, random_state=42):
+    """
+    Passe 1 sur la table : scaler ajusté par partial_fit sur toutes les lignes complètes,
+    Isolation Forest (et autoencodeur) appris sur un réservoir de `reservoir_size` lignes.
+    Renvoie un détecteur au format de detecteur.py (sauvegardé), plus l'autoencodeur éventuel ;
+    (None, None) si la table n'a aucune ligne complète.
+    """
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(random_state)
+    chunks = iter_clean_table(engine, table, chunksize)
+    first = next(chunks, None)
+    if first is None:
+        print(f"Table {table} vide : aucun modèle appris")
+        return None, None
+    features = first.select_dtypes(include=[np.number]).columns.tolist()
+
+    scaler = StandardScaler()
+    reservoir, seen = np.empty((0, len(features))), 0
+    for chunk in itertools.chain([first], chunks):
+        _, values = _numeric_values(chunk, features)
+        if len(values) == 0:
+            continue
+        scaler.partial_fit(values)
+        reservoir, seen = _reservoir_update(reservoir, values, seen, reservoir_size, rng)
+    print(f"Passe 1 : {seen} lignes vues, réservoir de {len(reservoir)} lignes")
+    if seen == 0:
+        print(f"Table {table} sans ligne complète : aucun modèle appris")
+        return None, None
+
+    params = {"contamination": contamination, "n_estimators": 100, "max_samples": "auto"}
+    X_sample = scaler.transform(reservoir)
+    model = IsolationForest(n_jobs=-1, random_state=random_state, **params).fit(X_sample)
+    detector = {
+        "table": table,
+        "features": features,
+        "params": params,
+        "fingerprint": data_fingerprint(pd.DataFrame(reservoir)),
+        "scaler": scaler,
+        "model": model,
+        "fitted_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    save_detector(detector)
+
+    autoenc = None
+    if autoencoder:
+        from autoencodeur import get_autoencoder
+        autoenc = get_autoencoder(X_sample, table, features, scaler=scaler)
+    return detector, autoenc
+
+def score_streaming(engine, detector, output_path, autoencoder=None, chunksize=CHUNKSIZE,
+                    quantile=AUTOENC_QUANTILE, baseline=None):
+    """
+    Passe 2 : relit la table par blocs et écrit chaque bloc scoré dans `output_path` (CSV) :
+    score et label Isolation Forest, et erreur de reconstruction de l'autoencodeur. Le
+    seuil de l'autoencodeur (quantile `quantile` des erreurs) vient d'un sketch alimenté
+    bloc par bloc ; le label "autoenc" est ajouté ensuite par une relecture du fichier.
+    Si la table a une colonne CodeBarre, sa validité (clé de contrôle, longueur) est
+    ajoutée comme anomalie à base de règles (code_barre_valide, motif_code_barre).
+    Avec `baseline` (statistiques de filtre_statistique.py), les colonnes du filtre sont
+    ajoutées et les lignes qu'il signale (filtre = 1) sont des anomalies d'office : les
+    modèles ne scorent que les autres lignes (iforest_score et autoenc_mse vides, iforest = 0
+    pour les premières), et elles sont comptées à part dans anomalies_filtre.
+    """
+    if autoencoder is not None:
+        from autoencodeur import reconstruction_errors
+    if baseline is not None:
+        from filtre_statistique import baseline_scores
+    sketch = QuantileSketch()
+    n_rows = n_iforest = n_invalid = n_filtered = 0
+    features = detector["features"]
+    for i, chunk in enumerate(iter_clean_table(engine, detector["table"], chunksize)):
+        chunk = chunk.copy()
+        chunk[features] = chunk[features].apply(pd.to_numeric, errors='coerce')
+        modelled = chunk
+        if baseline is not None:
+            chunk = chunk.join(baseline_scores(chunk, baseline))
+            modelled = chunk[~chunk["anomalie_stat"]]
+            n_filtered += int(chunk["anomalie_stat"].sum())
+        scores = score_detector(detector, modelled)
+        chunk["iforest_score"] = scores["score"]
+        chunk["iforest"] = (scores["anomaly"].reindex(chunk.index) == -1).astype(int)
+        if baseline is not None:
+            chunk["filtre"] = chunk["anomalie_stat"].astype(int)
+        chunk = flag_barcodes(chunk)
+        if autoencoder is not None:
+            X, values = _numeric_values(modelled, features)
+            X_scaled = detector["scaler"].transform(values)
+            mse = reconstruction_errors(autoencoder, X_scaled)
+            chunk["autoenc_mse"] = pd.Series(mse, index=X.index)
+            sketch.add(mse)
+        chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        n_rows += len(chunk)
+        n_iforest += int(chunk["iforest"].sum())
+        if "code_barre_valide" in chunk:
+            n_invalid += int((~chunk["code_barre_valide"]).sum())
+
+    summary = {"lignes": n_rows, "anomalies_iforest": n_iforest, "codes_barres_invalides": n_invalid}
+    if baseline is not None:
+        summary["anomalies_filtre"] = n_filtered
+    if autoencoder is not None:
+        threshold = sketch.quantile(quantile)
+        summary["seuil_autoenc"] = threshold
+        summary["anomalies_autoenc"] = _label_autoencoder(output_path, threshold, chunksize)
+    with open(os.path.splitext(output_path)[0] + "_resume.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def _label_autoencoder(path, threshold, chunksize):
+    """Ajoute la colonne autoenc (mse > seuil) au fichier de résultats, bloc par bloc."""
+    tmp_path = path + ".tmp"
+    n_anomalies = 0
+    for i, chunk in enumerate(pd.read_csv(path, chunksize=chunksize)):
+        chunk["autoenc"] = (chunk["autoenc_mse"] > threshold).astype(int)
+        n_anomalies += int(chunk["autoenc"].sum())
+        chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+    os.replace(tmp_path, path)
+    return n_anomalies
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scoring d'anomalies par blocs de la table codebarre")
+    parser.add_argument("--sortie", default="anomalies_codebarre.csv")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--reservoir", type=int, default=RESERVOIR_SIZE)
+    parser.add_argument("--autoencodeur", action="store_true", help="ajouter le score de l'autoencodeur")
+    parser.add_argument("--filtre", action="store_true",
+                        help="filtre statistique avant les modèles (deux passes de lecture en plus)")
+    args = parser.parse_args()
+
+    detector, autoenc = fit_streaming(get_engine(), "codebarre", args.chunksize, args.reservoir,
+                                      autoencoder=args.autoencodeur)
+    if detector is None:
+        sys.exit(0)
+    baseline = None
+    if args.filtre:
+        from filtre_statistique import fit_baseline_streaming
+        baseline = fit_baseline_streaming(get_engine(), "codebarre", args.chunksize)
+    summary = score_streaming(get_engine(), detector, args.sortie, autoenc, args.chunksize, baseline=baseline)
+    print(f"🔍 {summary['anomalies_iforest']} anomalies Isolation Forest sur {summary['lignes']} lignes")
+    if baseline is not None:
+        print(f"📏 {summary['anomalies_filtre']} anomalies évidentes écartées par le filtre statistique")
+    print(f"🏷️ {summary['codes_barres_invalides']} codes-barres invalides (clé de contrôle, longueur, caractères)")
+    if autoenc is not None:
+        print(f"🤖 {summary['anomalies_autoenc']} anomalies autoencodeur (seuil {summary['seuil_autoenc']:.4g})")
+    print(f"Résultats écrits dans {args.sortie}")
@@ -0,0 +1,238 @@
+import os
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+
+import glob
+import json
+import time
+import hashlib
+from contextlib import nullcontext
+import numpy as np
+
+from detecteur import MODEL_DIR, SCORE_BATCH_SIZE, prune_versions
+from instrumentation import LOG_DIR, instrumented, stage
+
+###############################################################################
+# Autoencodeur partagé : apprentissage sur CPU, sauvegarde des poids, scoring par lots
+###############################################################################
+# Même architecture Dense 16-8-16 que les scripts historiques, mais :
+#   - lots adaptés à la taille des données (au lieu de batch_size=32) ;
+#   - entrée tf.data découpée en lots, remélangée à chaque époque et préchargée (prefetch) ;
+#   - arrêt anticipé sur un jeu de validation (max_epochs reste la borne haute) ;
+#   - nombre de threads TensorFlow réglable (PFE_TF_INTRA_OP / PFE_TF_INTER_OP) ;
+#   - poids sauvegardés sous MODEL_DIR et réutilisés tant que les données ne changent pas ;
+#   - erreur de reconstruction calculée par blocs de SCORE_BATCH_SIZE lignes.
+# Chaque apprentissage et chaque scoring est ajouté à TRAINING_LOG (une ligne JSON).
+DEFAULT_AUTOENC_PARAMS = {
+    "layers": [16, 8, 16],
+    "learning_rate": 0.001,
+    "max_epochs": 30,
+    "patience": 3,
+    "validation_split": 0.1,
+}
+# Quantile des erreurs de validation retenu comme seuil d'anomalie (sauvegardé avec les poids)
+THRESHOLD_QUANTILE = 0.95
+MIN_BATCH_SIZE = 256
+MAX_BATCH_SIZE = 8192
+TRAINING_LOG = os.path.join(LOG_DIR, "entrainements_autoencodeur.jsonl")
+
+_threads_configured = False
+
+def configure_threads(intra_op=None, inter_op=None):
+    """
+    Threads TensorFlow (0 = choix automatique). À appeler avant toute opération TensorFlow :
+    ensuite le runtime est initialisé et le réglage est ignoré.
+    """
+    global _threads_configured
+    if _threads_configured:
+        return
+    import tensorflow as tf
+
+    intra_op = int(os.environ.get("PFE_TF_INTRA_OP", 0)) if intra_op is None else intra_op
+    inter_op = int(os.environ.get("PFE_TF_INTER_OP", 0)) if inter_op is None else inter_op
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError:
+        print("Threads TensorFlow déjà initialisés : réglage ignoré")
+    _threads_configured = True
+
+def adaptive_batch_size(n_rows):
+    """Puissance de 2 proche de n_rows / 100, bornée à [MIN_BATCH_SIZE, MAX_BATCH_SIZE]."""
+    size = 2 ** int(round(np.log2(max(n_rows, 1) / 100))) if n_rows > 100 else MIN_BATCH_SIZE
+    return int(min(max(size, MIN_BATCH_SIZE), MAX_BATCH_SIZE))
+
+def matrix_fingerprint(X):
+    return hashlib.sha1(np.ascontiguousarray(X, dtype="float32").tobytes()).hexdigest()[:12]
+
+def _autoencoder_path(table, features, params, fingerprint, directory=MODEL_DIR):
+    key = hashlib.sha1(repr((list(features), sorted(params.items()))).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(directory, f"{table}-autoenc-{key}-{fingerprint}")
+
+def _log(entry):
+    os.makedirs(os.path.dirname(TRAINING_LOG), exist_ok=True)
+    with open(TRAINING_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def build_autoencoder(input_dim, layers, learning_rate):
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.layers import Input, Dense
+    from tensorflow.keras.optimizers import Adam
+
+    input_layer = Input(shape=(input_dim,))
+    hidden = input_layer
+    for units in layers:
+        hidden = Dense(units, activation='relu')(hidden)
+    output_layer = Dense(input_dim)(hidden)
+    model = Model(inputs=input_layer, outputs=output_layer)
+    model.compile(optimizer=Adam(learning_rate), loss='mse')
+    return model
+
+def _dataset(X, batch_size, shuffle, seed=42):
+    """
+    Lots découpés directement dans un tenseur : l'ordre des lots est remélangé à chaque
+    époque, les lignes ayant été permutées une fois en amont. Un mélange ligne à ligne
+    (Dataset.shuffle sur les lignes) coûte plus cher sur CPU que l'apprentissage lui-même.
+    """
+    import tensorflow as tf
+
+    data = tf.constant(X)
+    n_batches = -(-len(X) // batch_size)
+    ds = tf.data.Dataset.range(n_batches)
+    if shuffle:
+        ds = ds.shuffle(n_batches, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(lambda i: (data[i * batch_size:(i + 1) * batch_size],) * 2, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+@instrumented("apprentissage_autoencodeur")
+def train_autoencoder(X, table=None, features=None, batch_size=None, random_state=42, **params):
+    """
+    Apprend l'autoencodeur sur `X` (déjà standardisé). Une fraction `validation_split`
+    des lignes, tirée au hasard, sert à l'arrêt anticipé (meilleurs poids restaurés).
+    Renvoie un dict {table, features, params, fingerprint, model, epochs, seuil}, seuil
+    étant le quantile THRESHOLD_QUANTILE des erreurs de reconstruction de validation.
+    """
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    configure_threads()
+    params = {**DEFAULT_AUTOENC_PARAMS, **params}
+    X = np.ascontiguousarray(X, dtype="float32")
+    batch_size = batch_size or adaptive_batch_size(len(X))
+    order = np.random.default_rng(random_state).permutation(len(X))
+    n_val = int(len(X) * params["validation_split"])
+    train, val = X[order[n_val:]], X[order[:n_val]]
+
+    model = build_autoencoder(X.shape[1], params["layers"], params["learning_rate"])
+    callbacks = []
+    if n_val:
+        callbacks.append(EarlyStopping(monitor="val_loss", patience=params["patience"], restore_best_weights=True))
+    start = time.perf_counter()
+    history = model.fit(_dataset(train, batch_size, shuffle=True, seed=random_state),
+                        validation_data=_dataset(val, batch_size, shuffle=False) if n_val else None,
+                        epochs=params["max_epochs"], callbacks=callbacks, verbose=0)
+    seconds = time.perf_counter() - start
+    epochs = len(history.history["loss"])
+    reference = val if n_val else train
+    errors = np.mean(np.square(reference - model.predict(reference, batch_size=MAX_BATCH_SIZE, verbose=0)), axis=1)
+    _log({"etape": "apprentissage", "table": table, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+          "lignes": len(X), "batch_size": batch_size, "epoques": epochs, "secondes": round(seconds, 3),
+          "val_loss": min(history.history["val_loss"]) if n_val else None})
+    return {
+        "table": table,
+        "features": list(features) if features is not None else list(range(X.shape[1])),
+        "params": params,
+        "fingerprint": matrix_fingerprint(X),
+        "model": model,
+        "epochs": epochs,
+        "seuil": float(np.quantile(errors, THRESHOLD_QUANTILE)),
+    }
+
+def save_autoencoder(autoenc, directory=MODEL_DIR):
+    """Écrit les poids (.weights.h5) et de quoi reconstruire le réseau (.json)."""
+    os.makedirs(directory, exist_ok=True)
+    path = _autoencoder_path(autoenc["table"], autoenc["features"], autoenc["params"], autoenc["fingerprint"], directory)
+    autoenc["model"].save_weights(path + ".weights.h5")
+    meta = {key: value for key, value in autoenc.items() if key != "model"}
+    meta["input_dim"] = int(autoenc["model"].input_shape[-1])
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    # Versions antérieures (autres données) : mêmes règles que les détecteurs
+    prefix = path[:path.rindex("-") + 1]
+    for old in prune_versions(prefix + "*.json"):
+        prune_versions(old[:-len(".json")] + ".weights.h5", keep=0)
+    return path
+
+def load_autoencoder(table, features, fingerprint, directory=MODEL_DIR, **params):
+    """Autoencodeur sauvegardé pour ces features, paramètres et données ; None s'il n'existe pas."""
+    params = {**DEFAULT_AUTOENC_PARAMS, **params}
+    path = _autoencoder_path(table, features, params, fingerprint, directory)
+    if not (os.path.exists(path + ".json") and os.path.exists(path + ".weights.h5")):
+        return None
+    os.utime(path + ".json")  # date d'utilisation, pour l'élagage des versions
+    configure_threads()
+    return _load_weights(path)
+
+def _load_weights(path):
+    with open(path + ".json", encoding="utf-8") as f:
+        meta = json.load(f)
+    model = build_autoencoder(meta.pop("input_dim"), meta["params"]["layers"], meta["params"]["learning_rate"])
+    model.load_weights(path + ".weights.h5")
+    return {**meta, "model": model}
+
+def latest_autoencoder(table, features, directory=MODEL_DIR):
+    """Autoencodeur le plus récent de `table` appris sur exactement ces features ; None si aucun."""
+    candidates = []
+    for meta_path in glob.glob(os.path.join(directory, f"{table}-autoenc-*.json")):
+        with open(meta_path, encoding="utf-8") as f:
+            if json.load(f)["features"] == list(features):
+                candidates.append(meta_path[:-len(".json")])
+    candidates = [path for path in candidates if os.path.exists(path + ".weights.h5")]
+    if not candidates:
+        return None
+    configure_threads()
+    return _load_weights(max(candidates, key=lambda path: os.path.getmtime(path + ".json")))
+
+def get_autoencoder(X, table, features, scaler=None, **params):
+    """
+    Autoencodeur appris sur exactement ces données : rechargé s'il existe, sinon appris et
+    sauvegardé. `scaler` (StandardScaler ajusté) est celui qui a produit `X` : il est
+    sauvegardé avec les poids, pour qu'un autre programme (service_scoring.py) standardise
+    ses lignes comme à l'apprentissage.
+    """
+    autoenc = load_autoencoder(table, features, matrix_fingerprint(X), **params)
+    if autoenc is None:
+        autoenc = train_autoencoder(X, table, features, **params)
+        if scaler is not None:
+            autoenc["scaler"] = {"moyenne": scaler.mean_.tolist(), "echelle": scaler.scale_.tolist()}
+        save_autoencoder(autoenc)
+    elif scaler is not None and "scaler" not in autoenc:
+        # Poids antérieurs à la sauvegarde du scaler : complétés
+        autoenc["scaler"] = {"moyenne": scaler.mean_.tolist(), "echelle": scaler.scale_.tolist()}
+        save_autoencoder(autoenc)
+    return autoenc
+
+def scale_inputs(autoenc, X):
+    """Standardise `X` (valeurs brutes des features) avec le scaler sauvegardé avec l'autoencodeur."""
+    scaler = autoenc["scaler"]
+    return (np.asarray(X, dtype="float64") - np.asarray(scaler["moyenne"])) / np.asarray(scaler["echelle"])
+
+def reconstruction_errors(autoenc, X, batch_size=SCORE_BATCH_SIZE, log=True):
+    """
+    Erreur quadratique moyenne de reconstruction de chaque ligne, calculée par blocs.
+    Avec log=False (micro-lots du service), rien n'est écrit : ni TRAINING_LOG ni étape instrumentée.
+    """
+    model = autoenc["model"]
+    X = np.asarray(X, dtype="float32")
+    errors = np.empty(len(X))
+    start = time.perf_counter()
+    with stage("scoring_autoencodeur", len(X), table=autoenc["table"]) if log else nullcontext({}) as record:
+        for i in range(0, len(X), batch_size):
+            block = X[i:i + batch_size]
+            errors[i:i + batch_size] = np.mean(np.square(block - model(block, training=False).numpy()), axis=1)
+        record["lignes_sortie"] = len(errors)
+    seconds = time.perf_counter() - start
+    if not log:
+        return errors
+    _log({"etape": "scoring", "table": autoenc["table"], "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+          "lignes": len(X), "secondes": round(seconds, 3),
+          "lignes_par_seconde": round(len(X) / seconds) if seconds else None})
+    return errors
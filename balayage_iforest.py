@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_engine
+from cache_tables import cached_clean
+from detecteur import DEFAULT_PARAMS, MODEL_DIR, SCORE_BATCH_SIZE, save_tuned_params
+from iso import TABLE_FEATURES
+import stockage_annotations as store
+
+###############################################################################
+# Balayage des paramètres de l'Isolation Forest, table par table, sur tous les cœurs
+###############################################################################
+# Chaque combinaison de la grille est apprise sur N_FOLDS plis (apprentissage sur les
+# autres plis, score de toutes les lignes). La matrice standardisée de chaque table est
+# écrite une fois en .npy et ouverte en mémoire mappée par les workers : elle n'est pas
+# sérialisée pour chaque tâche, et les pages sont partagées entre processus.
+GRID = {
+    "contamination": [0.005, 0.01, 0.02, 0.05, 0.1],
+    "n_estimators": [100, 200, 400],
+    "max_samples": ["auto", 1024, 4096],
+}
+N_FOLDS = 3
+RESULTS_FILE = "balayage_iforest.csv"
+# Annotations manuelles (annotateur_fournisseur.py, stockage_annotations.py) : 1 = anomalie, 0 = normal
+ANNOTATED_TABLES = {"fournisseur": store.KEY}
+
+_MATRICES = {}
+
+def _matrix(path):
+    # Une ouverture par processus ; les tâches suivantes du même worker la réutilisent
+    if path not in _MATRICES:
+        _MATRICES[path] = np.load(path, mmap_mode="r")
+    return _MATRICES[path]
+
+def _fold_ids(n_rows, n_folds, random_state):
+    return np.random.default_rng(random_state).permutation(n_rows) % n_folds
+
+def fit_fold(path, params, fold, n_folds, labelled, random_state=42):
+    """
+    Apprend l'Isolation Forest sur les plis autres que `fold` (tous si n_folds == 1) et
+    score toutes les lignes par lots. Renvoie les labels d'anomalie compressés (packbits),
+    le taux d'anomalies sur le pli de test, les scores des lignes annotées et la durée.
+    """
+    from sklearn.ensemble import IsolationForest
+
+    start = time.perf_counter()
+    X = _matrix(path)
+    folds = _fold_ids(len(X), n_folds, random_state)
+    train = folds != fold if n_folds > 1 else np.ones(len(X), dtype=bool)
+    model = IsolationForest(n_jobs=1, random_state=random_state + fold, **params).fit(X[train])
+    scores = np.concatenate([model.decision_function(X[i:i + SCORE_BATCH_SIZE])
+                             for i in range(0, len(X), SCORE_BATCH_SIZE)])
+    anomalies = scores < 0
+    test_rate = float(anomalies[~train].mean()) if n_folds > 1 else float(anomalies.mean())
+    return np.packbits(anomalies), test_rate, scores[labelled], time.perf_counter() - start
+
+def prepare_matrix(df, features, directory):
+    """Standardise les lignes complètes de `features` et les écrit dans `directory`. Renvoie (chemin, lignes)."""
+    from sklearn.preprocessing import StandardScaler
+
+    X = df[features].apply(pd.to_numeric, errors='coerce').dropna()
+    values = StandardScaler().fit_transform(X.to_numpy(dtype="float64"))
+    path = os.path.join(directory, f"{len(os.listdir(directory))}.npy")
+    np.save(path, values)
+    return path, X.index
+
+def load_labels(table, index, df):
+    """Positions des lignes annotées dans la matrice et leurs labels, ou (None, None)."""
+    if table not in ANNOTATED_TABLES or not (os.path.exists(store.ANNOTATION_DB) or os.path.exists(store.LEGACY_CSV)):
+        return None, None
+    key = ANNOTATED_TABLES[table]
+    with closing(store.connect()) as conn:
+        annotations = store.load_annotations(conn).set_index(key)["annotation"]
+    if annotations.empty:
+        return None, None
+    keys = df.loc[index, key].to_numpy()
+    labelled = np.flatnonzero(pd.Series(keys).isin(annotations.index).to_numpy())
+    return labelled, annotations.loc[keys[labelled]].to_numpy(dtype=int)
+
+def _jaccard_stability(packed, n_rows):
+    """Similarité de Jaccard moyenne des ensembles d'anomalies entre plis."""
+    sets = [np.unpackbits(p, count=n_rows).astype(bool) for p in packed]
+    values = []
+    for a, b in itertools.combinations(sets, 2):
+        union = (a | b).sum()
+        values.append((a & b).sum() / union if union else 1.0)
+    return float(np.mean(values)) if values else 1.0
+
+def _evaluate(scores, labels):
+    """Précision, rappel et F1 du vote des plis, AUC du score moyen (classe 1 = anomalie)."""
+    from sklearn.metrics import precision_recall_fscore_support, roc_auc_score
+
+    mean_score = np.mean(scores, axis=0)
+    predicted = (mean_score < 0).astype(int)
+    precision, recall, f1, _ = precision_recall_fscore_support(labels, predicted, average="binary", zero_division=0)
+    auc = roc_auc_score(labels, -mean_score) if len(set(labels)) == 2 else np.nan
+    return {"precision": precision, "rappel": recall, "f1": f1, "auc": auc}
+
+def choose_params(results):
+    """
+    Paramètres retenus par table : meilleur F1 (puis AUC) s'il y a des annotations. Sans
+    annotations, la contamination ne peut pas être estimée : on garde celle de
+    DEFAULT_PARAMS (la plus proche dans la grille) et on retient la combinaison la plus
+    stable entre plis, à stabilité égale la moins coûteuse.
+    """
+    choices = {}
+    for table, group in results.groupby("table"):
+        if "f1" in group and group["f1"].notna().any():
+            best = group.sort_values(["f1", "auc", "secondes"], ascending=[False, False, True]).iloc[0]
+        else:
+            target = min(group["contamination"], key=lambda c: abs(c - DEFAULT_PARAMS["contamination"]))
+            group = group[group["contamination"] == target]
+            best = group.sort_values(["stabilite", "secondes"], ascending=[False, True]).iloc[0]
+        choices[table] = {key: best[key] for key in GRID}
+        choices[table] = {key: (value.item() if hasattr(value, "item") else value)
+                          for key, value in choices[table].items()}
+    return choices
+
+def run_sweep(tables=None, grid=GRID, n_folds=N_FOLDS, max_workers=None, engine=None, work_dir=None):
+    """
+    Balaye `grid` pour chaque table (features de iso.TABLE_FEATURES présentes et
+    numériques). Toutes les tâches (table, combinaison, pli) partagent un même pool de
+    processus. Renvoie le DataFrame des résultats, une ligne par (table, combinaison).
+    """
+    tables = list(tables or TABLE_FEATURES)
+    engine = engine or get_engine()
+    combos = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    work_dir = tempfile.mkdtemp(prefix="balayage_", dir=work_dir)
+    tasks = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for table in tables:
+                df = cached_clean(engine, table)
+                features = [f for f in TABLE_FEATURES[table]
+                            if f in df.columns and pd.api.types.is_numeric_dtype(df[f])]
+                path, index = prepare_matrix(df, features, work_dir)
+                labelled, labels = load_labels(table, index, df)
+                print(f"{table:<12} {len(index):>10} lignes  features : {', '.join(features)}"
+                      + (f"  ({len(labelled)} lignes annotées)" if labelled is not None else ""))
+                for i, params in enumerate(combos):
+                    for fold in range(n_folds):
+                        future = executor.submit(fit_fold, path, params, fold, n_folds,
+                                                 labelled if labelled is not None else np.empty(0, dtype=int))
+                        tasks[future] = (table, i, len(index), labels)
+
+            outputs = {}
+            for n_done, future in enumerate(as_completed(tasks), 1):
+                table, i, n_rows, labels = tasks[future]
+                outputs.setdefault((table, i), {"n_rows": n_rows, "labels": labels, "folds": []})["folds"].append(future.result())
+                if n_done % 50 == 0 or n_done == len(tasks):
+                    print(f"  {n_done}/{len(tasks)} apprentissages terminés")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    rows = []
+    for (table, i), out in outputs.items():
+        packed, test_rates, scores, seconds = zip(*out["folds"])
+        row = {"table": table, **combos[i], "lignes": out["n_rows"],
+               "taux_test": float(np.mean(test_rates)),
+               "stabilite": _jaccard_stability(packed, out["n_rows"]),
+               "secondes": float(np.sum(seconds))}
+        if out["labels"] is not None and len(out["labels"]):
+            row.update(_evaluate(scores, out["labels"]))
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values(["table", "contamination", "n_estimators"], kind="stable")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Balayage des paramètres de l'Isolation Forest par table")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLE_FEATURES))
+    parser.add_argument("--workers", type=int, default=None, help="processus (défaut : un par cœur)")
+    parser.add_argument("--plis", type=int, default=N_FOLDS)
+    parser.add_argument("--sortie", default=RESULTS_FILE)
+    parser.add_argument("--sans-enregistrer", action="store_true",
+                        help=f"ne pas écrire les paramètres retenus dans {MODEL_DIR}")
+    args = parser.parse_args()
+
+    results = run_sweep(args.tables, n_folds=args.plis, max_workers=args.workers)
+    results.to_csv(args.sortie, index=False)
+    choices = choose_params(results)
+    for table, params in choices.items():
+        print(f"{table:<12} {params}")
+    if not args.sans_enregistrer:
+        print(f"Paramètres retenus écrits dans {save_tuned_params(choices)}")
+    print(f"Résultats complets : {args.sortie}")
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark : fix_nan_in_all_text_cols (version Arrow, un seul passage pour toutes
+les colonnes texte) contre la version historique (boucle par colonne, astype(str) + regex).
+
+Usage : python benchmarks/bench_fix_nan.py --rows 1000000 --cols 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clean import fix_nan_in_all_text_cols
+
+# Valeurs typiques des tables source : espaces parasites, "nan" texte, vides et vrais NULL
+VALUES = np.array(
+    ["REF-001", "  Tunis ", "nan", "NaN", "", "   ", None, np.nan, "Coton 100%", "XL", "Bleu marine "],
+    dtype=object,
+)
+
+def fix_nan_historique(df):
+    """Version d'origine de clean.py, conservée ici comme référence."""
+    text_columns = df.select_dtypes(include=['object']).columns
+    for col in text_columns:
+        df[col] = df[col].astype(str).str.strip()
+        df[col] = df[col].replace("", np.nan)
+        df[col] = df[col].replace(r'(?i)^nan$', np.nan, regex=True)
+    return df
+
+def make_frame(n_rows, n_cols, seed=42):
+    rng = np.random.default_rng(seed)
+    data = {f"txt_{i}": rng.choice(VALUES, n_rows) for i in range(n_cols)}
+    data["id"] = np.arange(n_rows)
+    return pd.DataFrame(data)
+
+def timed(func, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--cols", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.cols)
+    print(f"DataFrame synthétique : {args.rows} lignes x {args.cols} colonnes texte")
+
+    t_old = timed(fix_nan_historique, df, args.repeat)
+    t_new = timed(fix_nan_in_all_text_cols, df, args.repeat)
+    print(f"Version historique : {t_old:8.2f} s")
+    print(f"Version Arrow      : {t_new:8.2f} s  (x{t_old / t_new:.1f})")
+
+    # Seule différence voulue : les vrais NULL restent manquants (avant : chaîne "None")
+    old = fix_nan_historique(df.copy()).replace("None", np.nan)
+    new = fix_nan_in_all_text_cols(df.copy())
+    pd.testing.assert_frame_equal(old, new)
+    print("Résultats identiques (hors NULL -> 'None' de la version historique)")
@@ -0,0 +1,73 @@
+"""
+Benchmark du temps d'import (démarrage à froid) des modules du pipeline.
+
+Chaque module est importé dans un interpréteur neuf avec `-X importtime` : on mesure le
+temps total et on liste les dépendances les plus coûteuses. Le nettoyage et l'Isolation
+Forest ne doivent charger ni TensorFlow, ni plotly, ni matplotlib, ni ydata_profiling :
+un module qui dépasse le budget fait échouer le script (code de sortie 1).
+
+Usage : python benchmarks/bench_imports.py [--modules clean iso] [--budget 1.5]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Modules des chemins « nettoyage seul » et « Isolation Forest seul »
+MODULES = ["config", "clean", "cache_tables", "nettoyage_incremental", "detecteur", "iso", "anomalies_streaming"]
+# Temps d'import maximal par module, en secondes (pandas et sqlalchemy en prennent déjà l'essentiel)
+IMPORT_BUDGET = 1.5
+# Dépendances lourdes qui ne doivent jamais être chargées à l'import de ces modules
+HEAVY_MODULES = ["tensorflow", "plotly", "matplotlib", "ydata_profiling"]
+
+# Ligne « import time: self | cumulé | nom » ; l'indentation du nom donne la profondeur
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (.*)$")
+
+def measure_import(module, runs=3):
+    """
+    Meilleur temps d'import de `module` (en secondes) sur `runs` interpréteurs neufs,
+    modules de premier niveau les plus coûteux (temps cumulé) et dépendances lourdes chargées.
+    """
+    check = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", check], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True)
+        entries = []
+        for line in proc.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                cumulated, name = int(match.group(2)), match.group(3)
+                entries.append((cumulated, name))
+        total = sum(cumulated for cumulated, name in entries if not name.startswith(" "))
+        if best is None or total < best[0]:
+            # Dépendances directes du module mesuré (profondeur 1)
+            top = sorted(((c, n.strip()) for c, n in entries if n.startswith("  ") and not n.startswith("   ")),
+                         reverse=True)[:5]
+            best = (total, top, [m for m in proc.stdout.strip().split(",") if m])
+    total, top, heavy = best
+    return total / 1e6, top, heavy
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Temps d'import à froid des modules du pipeline")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET, help="temps d'import maximal (s)")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        seconds, top, heavy = measure_import(module, args.runs)
+        flag = ""
+        if seconds > args.budget or heavy:
+            failures.append(module)
+            flag = "  HORS BUDGET" if seconds > args.budget else ""
+            flag += f"  charge : {', '.join(heavy)}" if heavy else ""
+        print(f"{module:<24} {seconds:7.3f} s{flag}")
+        for cumulated, name in top:
+            print(f"    {name:<40} {cumulated / 1e6:7.3f} s")
+    sys.exit(1 if failures else 0)
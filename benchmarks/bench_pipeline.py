@@ -0,0 +1,151 @@
+"""
+Benchmark du pipeline (nettoyage et détection d'anomalies) sur une base SQLite synthétique.
+
+Chaque étape tourne dans un processus neuf : on mesure son temps et son pic mémoire (RSS),
+la préparation (lecture des données d'entrée) étant exclue du chronomètre. Les résultats
+sont ajoutés à benchmarks/resultats.jsonl et comparés à la mesure précédente de la même
+étape à la même échelle pour signaler les régressions.
+
+Usage : python benchmarks/bench_pipeline.py --lignes 10000 100000 [--etapes clean_codebarre ...]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+from clean import CLEANERS, TABLE_SPECS, fix_nan_in_all_text_cols, iter_clean_table
+from donnees_synthetiques import build_database
+
+try:
+    import resource
+except ImportError:  # Windows : pas de mesure du pic mémoire
+    resource = None
+
+RESULTS_FILE = os.path.join(BENCH_DIR, "resultats.jsonl")
+# Écart relatif au-delà duquel une étape est signalée comme régression
+REGRESSION_THRESHOLD = 0.20
+STAGES = (["fix_nan_in_all_text_cols"] + [f"clean_{table}" for table in CLEANERS]
+          + ["iter_clean_codebarre", "detect_anomalies", "rapport_comparatif"])
+# Taille des blocs de la lecture en streaming : son pic mémoire ne doit pas croître avec l'échelle
+STREAM_CHUNKSIZE = 10_000
+CODEBARRE_FEATURES = [col for col, kind in TABLE_SPECS["codebarre"]["dtypes"].items() if kind == "numeric"]
+
+def _rss_mb(field):
+    """Mémoire résidente (Mo) : actuelle (VmRSS) ou pic (VmHWM) ; ru_maxrss hors Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss est en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+
+def _reset_peak_rss():
+    # Le worker forké hérite du pic du processus parent : il est remis au niveau actuel
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _prepare(stage, engine):
+    """Données d'entrée de l'étape et fonction à chronométrer."""
+    if stage == "fix_nan_in_all_text_cols":
+        raw = pd.read_sql("SELECT * FROM article", con=engine)
+        return lambda: fix_nan_in_all_text_cols(raw)
+    if stage == "iter_clean_codebarre":
+        return lambda: sum(len(chunk) for chunk in iter_clean_table(engine, "codebarre", STREAM_CHUNKSIZE))
+    if stage.startswith("clean_"):
+        return lambda: CLEANERS[stage[len("clean_"):]](engine)
+    codebarre = CLEANERS["codebarre"](engine)
+    if stage == "detect_anomalies":
+        from iso import detect_anomalies
+        return lambda: detect_anomalies(codebarre, CODEBARRE_FEATURES)[0]
+    if stage == "rapport_comparatif":
+        from rapport_comparatif_anomalies import build_comparative_report
+        output_path = os.path.join(BENCH_DIR, "rapport_comparatif_bench.html")
+        return lambda: build_comparative_report(codebarre, output_path, table="bench_codebarre")
+    raise ValueError(f"Étape inconnue : {stage}")
+
+def run_stage(stage, db_path):
+    """Exécute une étape (dans un processus dédié) et renvoie ses mesures."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    func = _prepare(stage, engine)
+    _reset_peak_rss()
+    rss_before = _rss_mb("VmRSS")
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    rss_peak = _rss_mb("VmHWM")
+    engine.dispose()
+    return {
+        "etape": stage,
+        "secondes": round(seconds, 4),
+        "pic_memoire_mo": round(rss_peak, 1) if rss_peak is not None else None,
+        "pic_etape_mo": round(rss_peak - rss_before, 1) if rss_peak is not None else None,
+        "lignes_sortie": result if isinstance(result, int) else len(result),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCH_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _previous_results():
+    """Dernière mesure connue par (échelle, étape)."""
+    previous = {}
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                previous[(r["lignes"], r["etape"])] = r
+    return previous
+
+def run_benchmarks(scales, stages=STAGES):
+    previous = _previous_results()
+    commit = _git_commit()
+    # Les modèles appris pendant le benchmark ne doivent pas se mêler aux modèles de production
+    os.environ["PFE_MODEL_DIR"] = os.path.join(BENCH_DIR, "modeles")
+    results = []
+    for n_rows in scales:
+        db_path = os.path.join(BENCH_DIR, f"bench_{n_rows}.db")
+        if not os.path.exists(db_path):
+            print(f"Génération de la base synthétique ({n_rows} lignes) : {db_path}")
+            build_database(db_path, n_rows)
+        print(f"\n=== Échelle : {n_rows} lignes ===")
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+                r = executor.submit(run_stage, stage, db_path).result()
+            r.update({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "lignes": n_rows})
+            before = previous.get((n_rows, stage))
+            flag = ""
+            if before and r["secondes"] > before["secondes"] * (1 + REGRESSION_THRESHOLD):
+                flag = f"  RÉGRESSION (avant : {before['secondes']:.3f} s, {before.get('commit')})"
+            print(f"  {stage:<26} {r['secondes']:9.3f} s  {r['pic_memoire_mo']} Mo "
+                  f"(+{r['pic_etape_mo']} Mo)  {r['lignes_sortie']:>10} lignes{flag}")
+            results.append(r)
+    with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps(r) + "\n")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline sur données synthétiques")
+    parser.add_argument("--lignes", type=int, nargs="+", default=[10_000, 100_000],
+                        help="échelles à mesurer (lignes de codebarre, 10k à 10M)")
+    parser.add_argument("--etapes", nargs="+", choices=STAGES, default=STAGES)
+    args = parser.parse_args()
+    run_benchmarks(args.lignes, args.etapes)
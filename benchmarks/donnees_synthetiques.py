@@ -0,0 +1,116 @@
+"""
+Génération de tables synthétiques (ar_sfamille, arfamille, article, codebarre, fournisseur,
+saison, tailles) dans une base SQLite locale, avec les défauts des tables réelles : espaces
+parasites, "nan" / "NaN" / "" en texte, vrais NULL, valeurs hors règles métier et doublons.
+
+Usage : python benchmarks/donnees_synthetiques.py --lignes 100000 --base bench.db
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clean import TABLE_KEYS, TABLE_SPECS
+
+# Nombre de lignes de chaque table, en proportion de codebarre (la plus grande)
+TABLE_RATIOS = {
+    "codebarre": 1.0,
+    "article": 0.2,
+    "fournisseur": 0.02,
+    "tailles": 0.01,
+    "ar_sfamille": 0.005,
+    "arfamille": 0.001,
+    "saison": 0.001,
+    "grille": 0.0005,
+}
+MIN_ROWS = 50
+DUPLICATE_RATE = 0.02
+WRITE_CHUNKSIZE = 200_000
+
+TEXT_NOISE = np.array(["nan", "NaN", "", "  ", None], dtype=object)
+
+def _text(rng, n, prefix, noise=0.05):
+    values = np.char.add(prefix, rng.integers(0, max(n // 3, 10), n).astype(str)).astype(object)
+    padded = rng.random(n) < 0.1
+    values[padded] = np.char.add(" ", values[padded].astype(str))
+    noisy = rng.random(n) < noise
+    values[noisy] = rng.choice(TEXT_NOISE, noisy.sum())
+    return values
+
+def _flag(rng, n, invalid=0.02):
+    """Indicateur 0/1 avec quelques valeurs hors règle (2) et NULL."""
+    values = rng.integers(0, 2, n).astype("float64")
+    values[rng.random(n) < invalid] = 2
+    values[rng.random(n) < invalid / 2] = np.nan
+    return values
+
+def _ids(rng, n, offset=0, missing=0.01):
+    values = np.arange(offset + 1, offset + n + 1, dtype="float64")
+    values[rng.random(n) < missing] = np.nan
+    return values
+
+def make_table(table, n, rng, offset=0):
+    """
+    DataFrame brut de `table` : colonnes de la spécification + colonnes supprimées au
+    nettoyage. La clé (première colonne requise numérique) part de `offset` + 1.
+    """
+    spec = TABLE_SPECS[table]
+    key = next(col for col in spec["required"] if col in spec["dtypes"])
+    data = {}
+    for col, kind in spec["dtypes"].items():
+        if kind == "datetime":
+            data[col] = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 5 * 365 * 86400, n), unit="s")
+        elif col in spec.get("allowed", {}):
+            data[col] = _flag(rng, n)
+        elif col == key:
+            data[col] = _ids(rng, n, offset)
+        elif col.upper().startswith("ID"):
+            data[col] = rng.integers(1, 500, n)
+        else:
+            data[col] = np.round(rng.lognormal(3, 1, n) * rng.choice([1, 1, 1, -1], n), 2)
+    for col in spec["required"]:
+        if col not in data:
+            data[col] = _text(rng, n, col[:3].upper() + "-")
+    if "Ordre" in spec.get("ranges", {}):
+        data["Ordre"] = rng.integers(-5, 300, n)
+    for i, col in enumerate(spec["drop"]):
+        data[col] = _text(rng, n, "x", noise=0.3) if i % 4 == 0 else rng.integers(0, 1000, n)
+    # Quelques colonnes texte libres supplémentaires
+    for col in ("Libelle", "Designation", "Observation"):
+        data.setdefault(col, _text(rng, n, col[:4] + " ", noise=0.2))
+    df = pd.DataFrame(data)
+    duplicates = df.sample(frac=DUPLICATE_RATE, random_state=int(rng.integers(1 << 31)))
+    return pd.concat([df, duplicates], ignore_index=True)
+
+def build_database(path, n_rows, seed=42):
+    """Crée (ou remplace) la base SQLite `path` ; codebarre compte `n_rows` lignes."""
+    rng = np.random.default_rng(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    sizes = {}
+    for table, ratio in TABLE_RATIOS.items():
+        n = max(int(n_rows * ratio), MIN_ROWS)
+        written = 0
+        # Écriture par tranches pour borner la mémoire aux grandes échelles
+        while written < n:
+            part = min(WRITE_CHUNKSIZE, n - written)
+            df = make_table(table, part, rng, offset=written)
+            df.to_sql(table, engine, index=False, if_exists="replace" if written == 0 else "append")
+            written += part
+        # Index sur la clé de parcours (clé primaire côté MySQL) : lecture par blocs paginée
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX idx_{table}_cle ON {table} ({TABLE_KEYS[table]})"))
+        sizes[table] = written
+    engine.dispose()
+    return sizes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Base SQLite synthétique pour les benchmarks")
+    parser.add_argument("--lignes", type=int, default=100_000, help="lignes de codebarre (10k à 10M)")
+    parser.add_argument("--base", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.db"))
+    args = parser.parse_args()
+    for table, n in build_database(args.base, args.lignes).items():
+        print(f"{table:<12} {n:>10} lignes")
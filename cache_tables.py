@@ -0,0 +1,173 @@
+import os
+import sys
+import hashlib
+import argparse
+from contextlib import contextmanager
+import pandas as pd
+from sqlalchemy import inspect, text
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_engine
+from clean import CLEANERS, TABLE_SPECS
+from instrumentation import stage
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+###############################################################################
+# Cache local (Parquet) des tables nettoyées
+###############################################################################
+# Un fichier par table et par état de la table source : <table>-<empreinte>.parquet.
+# Tant que la table source ne change pas, les scripts relisent le fichier au lieu de
+# réinterroger MySQL et de tout renettoyer. Un fichier peut avoir un rapport associé
+# (<table>-<empreinte>_integrite.json), supprimé avec lui. Les instantanés du nettoyage
+# incrémental (incremental/<table>.parquet) sont soumis aux mêmes invalidation et éviction.
+CACHE_DIR = os.environ.get("PFE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_pfe"))
+INCREMENTAL_DIR = os.path.join(CACHE_DIR, "incremental")
+# Taille maximale du cache ; au-delà, les fichiers les moins récemment utilisés sont supprimés
+MAX_CACHE_BYTES = int(os.environ.get("PFE_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# À incrémenter quand le format des tables nettoyées change (types de compact_dtypes...)
+CACHE_VERSION = 2
+
+# Lignes lues par bloc pour l'empreinte du contenu des tables sans ModifieLe hors MySQL
+CONTENT_CHUNKSIZE = 100_000
+
+def _content_digest(conn, table):
+    """
+    Empreinte du contenu de la table : somme (modulo 2^64) des hachages de ses lignes, lue
+    par blocs. Indépendante de l'ordre des lignes ; coûte une lecture complète de la table.
+    """
+    digest = 0
+    for chunk in pd.read_sql(text(f"SELECT * FROM {table}"), conn, chunksize=CONTENT_CHUNKSIZE):
+        digest = (digest + int(pd.util.hash_pandas_object(chunk, index=False).sum())) % 2 ** 64
+    return digest
+
+def table_fingerprint(engine, table):
+    """
+    Empreinte de l'état de la table source : nombre de lignes, MAX(ModifieLe) si la colonne
+    existe, sinon CHECKSUM TABLE (MySQL) ou un hachage du contenu (autres bases : le nombre
+    de lignes seul ne voit pas les modifications). La spécification de nettoyage et
+    CACHE_VERSION font partie de l'empreinte : modifier les règles invalide le cache.
+    """
+    columns = {col["name"] for col in inspect(engine).get_columns(table)}
+    parts = [CACHE_VERSION, repr(TABLE_SPECS[table])]
+    with engine.connect() as conn:
+        parts.append(conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar())
+        if "ModifieLe" in columns:
+            parts.append(conn.execute(text(f"SELECT MAX(ModifieLe) FROM {table}")).scalar())
+        elif engine.dialect.name == "mysql":
+            parts.append(conn.execute(text(f"CHECKSUM TABLE {table}")).fetchone()[1])
+        else:
+            parts.append(_content_digest(conn, table))
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+def _cache_files(table=None):
+    """Fichiers Parquet en cache de `table` (ou de toutes), instantanés incrémentaux compris."""
+    files = []
+    if os.path.isdir(CACHE_DIR):
+        prefix = f"{table}-" if table else ""
+        files += [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+                  if name.startswith(prefix) and name.endswith(".parquet")]
+    if os.path.isdir(INCREMENTAL_DIR):
+        files += [os.path.join(INCREMENTAL_DIR, name) for name in os.listdir(INCREMENTAL_DIR)
+                  if name.endswith(".parquet") and (table is None or name == f"{table}.parquet")]
+    return files
+
+def _cache_table(path):
+    name = os.path.basename(path)
+    if os.path.dirname(path) == INCREMENTAL_DIR:
+        return os.path.splitext(name)[0]
+    return name.rsplit("-", 1)[0]
+
+@contextmanager
+def table_lock(table):
+    """
+    Verrou exclusif (fichier <table>.lock, flock) sur le cache de `table`, entre threads et
+    processus : une seule exécution nettoie et écrit la table, les autres attendent puis
+    relisent son fichier. Non réentrant ; sans effet sous Windows.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, f"{table}.lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def cached_clean(engine, table, refresh=False):
+    """
+    Table nettoyée, lue depuis le cache si la table source n'a pas changé depuis l'écriture
+    du fichier (lecture mappée en mémoire), sinon nettoyée puis mise en cache.
+    """
+    with stage("chargement_table", table=table) as record, table_lock(table):
+        path = os.path.join(CACHE_DIR, f"{table}-{table_fingerprint(engine, table)}.parquet")
+        df = None
+        if os.path.exists(path) and not refresh:
+            try:
+                os.utime(path)  # date d'accès pour l'éviction LRU
+                df = pd.read_parquet(path, memory_map=True)
+            except FileNotFoundError:
+                pass  # évincé entre-temps par la mise en cache d'une autre table
+        record["cache"] = df is not None
+        if df is None:
+            df = CLEANERS[table](engine)
+            _remove(_cache_files(table))  # les versions précédentes de la table sont obsolètes
+            tmp_path = path + ".tmp"
+            df.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+            evict()
+        record["lignes_sortie"] = len(df)
+    return df
+
+def _remove(files):
+    """Supprime ces fichiers et leurs rapports d'intégrité. Renvoie le nombre de fichiers supprimés."""
+    removed = 0
+    for path in files:
+        for target in (path, os.path.splitext(path)[0] + "_integrite.json"):
+            try:
+                os.remove(target)
+                removed += target == path
+            except FileNotFoundError:
+                pass  # déjà supprimé par une autre exécution (ou pas de rapport)
+    return removed
+
+def invalidate(table=None):
+    """Supprime les fichiers en cache d'une table (ou de toutes). Renvoie le nombre supprimé."""
+    tables = [table] if table else sorted({_cache_table(path) for path in _cache_files()})
+    removed = 0
+    for name in tables:
+        with table_lock(name):
+            removed += _remove(_cache_files(name))
+    return removed
+
+def evict(max_bytes=None):
+    """Supprime les fichiers les moins récemment utilisés jusqu'à repasser sous `max_bytes`."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    files = []
+    for path in _cache_files():
+        try:
+            files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except FileNotFoundError:
+            pass
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    while files and total > max_bytes:
+        _, size, path = files.pop(0)
+        total -= size
+        _remove([path])
+    return total
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gestion du cache des tables nettoyées")
+    parser.add_argument("--remplir", nargs="*", choices=list(TABLE_SPECS), help="nettoyer et mettre en cache ces tables (défaut : toutes)")
+    parser.add_argument("--invalider", nargs="*", choices=list(TABLE_SPECS), help="vider le cache de ces tables (défaut : toutes)")
+    args = parser.parse_args()
+
+    if args.invalider is not None:
+        n_files = sum(invalidate(table) for table in (args.invalider or [None]))
+        print(f"{n_files} fichier(s) supprimé(s) de {CACHE_DIR}")
+    if args.remplir is not None:
+        for table in args.remplir or TABLE_SPECS:
+            print(f"{table:<12} {len(cached_clean(get_engine(), table)):>10} lignes")
+    for path in sorted(_cache_files()):
+        print(f"{os.path.relpath(path, CACHE_DIR):<40} {os.path.getsize(path) / 1024 ** 2:8.2f} Mo")
@@ -1,306 +1,683 @@
 import pandas as pd
 import numpy as np
-import re
-from sqlalchemy import create_engine
+from functools import lru_cache
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy import table as sa_table, column as sa_column
 import os
-import matplotlib.pyplot as plt
-from ydata_profiling import ProfileReport
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
-# --- Paramètres de connexion (modifiez ces valeurs selon votre configuration) ---
-username = 'root'
-password = 'louzisql'
-host = 'localhost'
-port = '3306'
-database = 'pfe'
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # repli pandas pur dans fix_nan_in_all_text_cols
+    pa = None
 
-# Création de la connexion à la base de données MySQL
-engine = create_engine(f'mysql+mysqlconnector://{username}:{password}@{host}:{port}/{database}')
+# --- Paramètres de connexion : voir config.py (environnement PFE_DB_* ou pfe.ini) ---
+from config import database_url, get_engine
+from instrumentation import instrumented, stage
+
+def __getattr__(name):
+    # Compatibilité : `clean.engine` crée l'engine partagé au premier accès seulement
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def make_engine(pool_size=5, url=None):
+    """
+    Engine dont le pool couvre `pool_size` connexions simultanées (une par table nettoyée
+    en parallèle) ; pas de débordement, et connexions vérifiées avant réutilisation.
+    """
+    return create_engine(url or database_url(), pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
 
 ###############################################################################
 # Fonction utilitaire pour corriger toutes les colonnes texte d'un DataFrame
 ###############################################################################
+@instrumented()
 def fix_nan_in_all_text_cols(df):
     """
-    Pour chaque colonne de type 'object' (texte), on :
-      1) Convertit la colonne en str et strip() les espaces.
+    Pour toutes les colonnes texte ('object' / 'string') à la fois, on :
+      1) Enlève les espaces autour des valeurs (les non-textes sont convertis en str).
       2) Remplace les chaînes vides ("") par np.nan.
       3) Remplace "nan" (ignorer la casse) par np.nan.
+    Les vraies valeurs manquantes (None / NaN) restent manquantes.
+    Les colonnes sont mises bout à bout dans un seul tableau Arrow : strip et détection
+    de "" / "nan" sont faits par deux noyaux pyarrow.compute pour toute la table.
     """
-    text_columns = df.select_dtypes(include=['object']).columns
+    text_columns = df.select_dtypes(include=['object', 'string']).columns
+    if len(text_columns) == 0:
+        return df
+    if pa is None:
+        return _fix_nan_in_text_cols_pandas(df, text_columns)
+
+    # Colonne après colonne (ordre Fortran) dans un seul tableau
+    block = df[text_columns].to_numpy(dtype=object).ravel(order='F')
+    try:
+        values = pa.array(block, type=pa.string(), from_pandas=True)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Cellules non texte (nombres, Decimal, dates...) : converties en str, sauf les manquants
+        block = block.copy()
+        present = ~pd.isna(block)
+        block[present] = block[present].astype(str)
+        values = pa.array(block, type=pa.string(), from_pandas=True)
+
+    values = pc.utf8_trim_whitespace(values)
+    is_blank = pc.match_substring_regex(values, '^(nan)?$', ignore_case=True)
+    values = pc.if_else(is_blank, pa.scalar(None, type=pa.string()), values)
+
+    out = values.to_numpy(zero_copy_only=False)
+    out[pc.is_null(values).to_numpy(zero_copy_only=False)] = np.nan
+    df[text_columns] = out.reshape((len(df), len(text_columns)), order='F')
+    return df
+
+def _fix_nan_in_text_cols_pandas(df, text_columns):
+    """Même traitement, colonne par colonne en pandas (si pyarrow n'est pas installé)."""
     for col in text_columns:
-        # 1. Convertir en str et enlever les espaces autour
-        df[col] = df[col].astype(str).str.strip()
-        # 2. Remplacer la chaîne vide par NaN
-        df[col].replace("", np.nan, inplace=True)
-        # 3. Remplacer "nan" (ignorer la casse) par NaN
-        df[col].replace(r'(?i)^nan$', np.nan, regex=True, inplace=True)
+        values = df[col].astype(str).str.strip().where(df[col].notna())
+        df[col] = values.replace(r'(?i)^(nan)?$', np.nan, regex=True)
     return df
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "ar_sfamille" ---
+# --- Spécifications déclaratives des tables
 ###############################################################################
-def clean_ar_sfamille(engine):
-    df = pd.read_sql("SELECT * FROM ar_sfamille", con=engine)
-    
-    # Corriger toutes les colonnes texte
-    df = fix_nan_in_all_text_cols(df)
-    
-    # Suppression des colonnes non nécessaires
-    df.drop(['IDChaineMontage', 'IDCategorieOFpardefaut'], axis=1, inplace=True)
-    
-    # Conversion en numérique pour les colonnes critiques
-    numeric_cols = ['IDArSousFamille', 'Etat', 'IDArFamille']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Suppression des lignes où ces colonnes sont NULL
-    df.dropna(subset=numeric_cols, inplace=True)
-    
-    # Règle métier : Etat doit être 0 ou 1
-    df = df[df['Etat'].isin([0, 1])]
-    
-    # Suppression des doublons
-    df.drop_duplicates(inplace=True)
-    
-    return df
+# Pour chaque table :
+#   drop     : colonnes inutiles (jamais lues : elles sont exclues du SELECT)
+#   dtypes   : colonnes à convertir ("numeric" ou "datetime")
+#   required : colonnes essentielles, la ligne est supprimée si l'une est manquante
+#   allowed  : valeurs autorisées par colonne (règles métier 0/1)
+#   ranges   : bornes inclusives (min, max) ; None = pas de borne
+#   positive : colonnes qui doivent être strictement positives
+# Les règles allowed / ranges / positive / required sont aussi poussées dans le WHERE
+# de la requête SQL ; elles restent appliquées en pandas (les valeurs texte "nan", ""
+# ou non numériques ne peuvent être détectées qu'après lecture).
+TABLE_SPECS = {
+    "ar_sfamille": {
+        "drop": ['IDChaineMontage', 'IDCategorieOFpardefaut'],
+        "dtypes": {'IDArSousFamille': "numeric", 'Etat': "numeric", 'IDArFamille': "numeric"},
+        "required": ['IDArSousFamille', 'Etat', 'IDArFamille'],
+        "allowed": {'Etat': [0, 1]},
+    },
+    "arfamille": {
+        "drop": ['IDChaineMontage', 'QtePPP', 'Type', 'CodeDouane'],
+        "dtypes": {'IDArFamille': "numeric", 'Etat': "numeric", 'SaisonObligatoire': "numeric"},
+        "required": ['IDArFamille', 'Etat', 'SaisonObligatoire'],
+        "allowed": {'Etat': [0, 1], 'SaisonObligatoire': [0, 1]},
+    },
+    "article": {
+        "drop": [
+            "IDGamme", "IDClient", "TempsClient", "IdProcess", "prixMP", "Valeur",
+            "Cadence", "IdArticleBase", "SemiFini", "ValeurTissu", "ValeurFourniture",
+            "ValeurMP", "TypeTarif", "IdMeilleurOF", "BaseStylisme", "IDTypeMatiereBase",
+            "IDVarianteModele", "IDGenre", "IDBroderie", "IDSerigraphie", "IDGarniture",
+            "IDTypeAccessoire", "IDTransfert", "IDCouleurGarniture", "IDCouleurBroderie",
+            "IDCouleurSerigraphie", "PrixEmballage", "StockMin", "StockAlerte", "ValeurMPEuro",
+            "ValeurMPAutre", "ValeurMPTunisie", "ValeurMPEuromed", "AQL", "AQLMineur",
+            "IDNiveauControle", "AQLCritique", "IDCategorie", "IDCategoriereclamation",
+            "IDCartouche", "IDArticleParent", "isParent", "QteFils", "Dimensions",
+            "TempsAtelier", "TempsFinitions", "IDTypeMatelassage", "IDMP", "IsMP",
+            "IDDecorArticle", "IsSemiFini", "TempsUnitaire", "TauxSondageQlte", "IDNorme",
+            "DDV", "FraisTransport", "AutresFrais", "IDArticleEtqEntretien", "Ecologique",
+            "TauxDefectueux", "Publier", "Ordre", "TauxCommissionCA", "CODE_OLD", "PrixEtude",
+            "CodeDouane", "Observations", "NomenclatureValidePar", "NbrPiecesColis", "NbrColisPalette",
+            "PoidsEmballage", "IDcomplexite", "IDAr_Theme", "Emballage", "Boutonnage",
+            "SupportArt", "ReseauArt", "ReferenceFssr", "IDFibreComposition", "PrixOutlet", "IDPlanComptable"
+        ],
+        "dtypes": {
+            "IDArticle": "numeric", "Etat": "numeric", "TauxTVA": "numeric", "NumInterne": "numeric",
+            "IDSaison": "numeric", "SaisiLe": "datetime", "ModifieLe": "datetime",
+        },
+        "required": ["IDArticle", "Code"],
+        "allowed": {"Etat": [0, 1]},
+    },
+    "codebarre": {
+        "drop": ["Indice", "IDSerieArticle", "NumInterne"],
+        "dtypes": {
+            'IDCodeBarre': "numeric", 'IdEntite': "numeric", 'IdTaille': "numeric", 'IDAr_Couleur': "numeric",
+            'Prix': "numeric", 'isSynchronized': "numeric", 'isSynchronizedWeb': "numeric",
+        },
+        "required": ['IDCodeBarre', 'CodeBarre'],
+        "allowed": {'isSynchronized': [0, 1], 'isSynchronizedWeb': [0, 1]},
+        "positive": ["Prix"],
+    },
+    "fournisseur": {
+        "drop": [
+            "isFournisseur", "Note", "Type", "FournitMP", "FournitMB", "NumInterne",
+            "TauxRetenueSource", "ExonerationRS", "IsPDR", "Timbre", "ToleranceMAxAccepte",
+            "IDBanque", "AdresseBanque", "VilleBanque", "NumCompte", "CodeSwift", "IBAN",
+            "NonAssujettiTVA", "DelaisLivraison", "Reference", "IDFournisseurParent", "Difference",
+            "AppliqueFodec", "Login_FRS", "IDPlanComptable", "DateExonerationRS", "Echeance",
+            "IDConditionReglement"
+        ],
+        "dtypes": {
+            col: "numeric" for col in ["IDFournisseur", "Chiffre", "Reglements", "Solde", "IDDevise", "IDCategorie",
+                                       "IDPays", "Etat", "IDCGAFournisseur", "IsMP", "IsPF"]
+        },
+        "required": ["IDFournisseur", "Fournisseur", "Code"],
+        "allowed": {"Etat": [0, 1]},
+    },
+    # Pas de règle de valeurs connue pour grille : seulement les types, la clé et le libellé
+    "grille": {
+        "drop": [],
+        "dtypes": {'IDGrille': "numeric", 'isCompose': "numeric", 'LargeurVariante': "numeric", 'parDefaut': "numeric"},
+        "required": ['IDGrille', 'Grille'],
+    },
+    "saison": {
+        "drop": ["DateDebut", "DateFin"],
+        "dtypes": {'IDSaison': "numeric", 'Etat': "numeric", 'IDTypeSaison': "numeric"},
+        "required": ['IDSaison', 'Saison', 'Code'],
+        "allowed": {"Etat": [0, 1]},
+    },
+    "tailles": {
+        "drop": ["LibTailleAR", "LibTailleAutre", "LibTailleGER", "LibTailleUSA", "LibTailleSP", "LibTailleGRK"],
+        "dtypes": {'IDGrille': "numeric", 'IdTaille': "numeric", 'Ordre': "numeric", 'isMilieu': "numeric"},
+        "required": ['LibTaille', 'IdTaille'],
+        "allowed": {"isMilieu": [0, 1]},
+        "ranges": {"Ordre": (0, 255)},
+    },
+}
+
+# Clé de parcours de chaque table pour la lecture par blocs (clé primaire déclarée de la
+# table si elle existe, sinon celle-ci) ; elle doit être indexée côté MySQL
+TABLE_KEYS = {
+    "ar_sfamille": "IDArSousFamille",
+    "arfamille": "IDArFamille",
+    "article": "IDArticle",
+    "codebarre": "IDCodeBarre",
+    "fournisseur": "IDFournisseur",
+    "grille": "IDGrille",
+    "saison": "IDSaison",
+    "tailles": "IdTaille",
+}
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "arfamille" ---
+# --- Règles de validation compilées à partir des spécifications
 ###############################################################################
-def clean_arfamille(engine):
-    df = pd.read_sql("SELECT * FROM arfamille", con=engine)
-    
-    # Corriger toutes les colonnes texte
-    df = fix_nan_in_all_text_cols(df)
-    
-    # Suppression des colonnes non nécessaires
-    df.drop(['IDChaineMontage', 'QtePPP', 'Type', 'CodeDouane'], axis=1, inplace=True)
-    
-    # Conversion en numérique pour les colonnes critiques
-    numeric_cols = ['IDArFamille', 'Etat', 'SaisonObligatoire']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    df.dropna(subset=numeric_cols, inplace=True)
-    
-    # Règle métier : Etat doit être 0 ou 1, SaisonObligatoire doit être 0 ou 1
-    df = df[df['Etat'].isin([0, 1])]
-    df = df[df['SaisonObligatoire'].isin([0, 1])]
-    
-    df.drop_duplicates(inplace=True)
-    return df
+# Chaque règle de la spécification devient (nom, fonction df -> masque des lignes valides).
+# Tous les masques sont combinés en un seul ET logique : le DataFrame n'est filtré
+# qu'une fois, et chaque règle compte ses lignes rejetées (une ligne peut en violer plusieurs).
+REJECT_SAMPLE_SIZE = 5
+
+def compile_rules(spec):
+    rules = []
+    for col, values in spec.get("allowed", {}).items():
+        rules.append((f"allowed:{col}", lambda df, col=col, values=values: df[col].isin(values).to_numpy()))
+    for col, (low, high) in spec.get("ranges", {}).items():
+        def in_range(df, col=col, low=low, high=high):
+            values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+            valid = ~np.isnan(values)
+            if low is not None:
+                valid &= values >= low
+            if high is not None:
+                valid &= values <= high
+            return valid
+        rules.append((f"ranges:{col}", in_range))
+    for col in spec.get("positive", []):
+        rules.append((f"positive:{col}", lambda df, col=col: (df[col] > 0).to_numpy(dtype=bool, na_value=False)))
+    for col in spec["required"]:
+        rules.append((f"required:{col}", lambda df, col=col: df[col].notna().to_numpy()))
+    return rules
+
+_COMPILED_RULES = {}
+
+def _rules_for(spec):
+    # Une compilation par spécification (les spécifications sont des constantes du module)
+    cached = _COMPILED_RULES.get(id(spec))
+    if cached is None or cached[0] is not spec:
+        cached = _COMPILED_RULES[id(spec)] = (spec, compile_rules(spec))
+    return cached[1]
+
+def apply_rules(df, rules, sample_size=REJECT_SAMPLE_SIZE):
+    """
+    Masque combiné des lignes valides et rapport {règle: {"rejetees", "exemples"}},
+    "exemples" étant les `sample_size` premières lignes rejetées par la règle.
+    """
+    valid = np.ones(len(df), dtype=bool)
+    report = {}
+    for name, rule in rules:
+        ok = rule(df)
+        valid &= ok
+        rejected = np.flatnonzero(~ok)
+        report[name] = {"rejetees": len(rejected), "exemples": df.iloc[rejected[:sample_size]]}
+    return valid, report
+
+def merge_reports(total, report, sample_size=REJECT_SAMPLE_SIZE):
+    """Ajoute le rapport d'un bloc au rapport cumulé (comptes additionnés, exemples complétés)."""
+    for name, entry in report.items():
+        if name not in total:
+            total[name] = entry
+            continue
+        total[name]["rejetees"] += entry["rejetees"]
+        if len(total[name]["exemples"]) < sample_size and len(entry["exemples"]):
+            total[name]["exemples"] = pd.concat([total[name]["exemples"], entry["exemples"]]).head(sample_size)
+    return total
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "article" ---
+# --- Nettoyage d'un bloc selon la spécification de sa table
 ###############################################################################
-def clean_article(engine):
-    df = pd.read_sql("SELECT * FROM article", con=engine)
-    
+def clean_chunk(df, spec, with_report=False):
+    """
+    Applique à un DataFrame (table complète ou bloc) les étapes décrites par `spec` :
+    correction du texte, suppression des colonnes, conversions, puis règles métier et
+    lignes essentielles manquantes en un seul filtre. Le dédoublonnage est fait par
+    l'appelant. Avec `with_report`, renvoie aussi le rapport de rejets par règle.
+    """
     # Corriger toutes les colonnes texte
     df = fix_nan_in_all_text_cols(df)
-    
-    # Liste combinée des colonnes à supprimer
-    drop_columns = [
-        "IDGamme", "IDClient", "TempsClient", "IdProcess", "prixMP", "Valeur", 
-        "Cadence", "IdArticleBase", "SemiFini", "ValeurTissu", "ValeurFourniture", 
-        "ValeurMP", "TypeTarif", "IdMeilleurOF", "BaseStylisme", "IDTypeMatiereBase", 
-        "IDVarianteModele", "IDGenre", "IDBroderie", "IDSerigraphie", "IDGarniture", 
-        "IDTypeAccessoire", "IDTransfert", "IDCouleurGarniture", "IDCouleurBroderie", 
-        "IDCouleurSerigraphie", "PrixEmballage", "StockMin", "StockAlerte", "ValeurMPEuro", 
-        "ValeurMPAutre", "ValeurMPTunisie", "ValeurMPEuromed", "AQL", "AQLMineur", 
-        "IDNiveauControle", "AQLCritique", "IDCategorie", "IDCategoriereclamation", 
-        "IDCartouche", "IDArticleParent", "isParent", "QteFils", "Dimensions", 
-        "TempsAtelier", "TempsFinitions", "IDTypeMatelassage", "IDMP", "IsMP", 
-        "IDDecorArticle", "IsSemiFini", "TempsUnitaire", "TauxSondageQlte", "IDNorme", 
-        "DDV", "FraisTransport", "AutresFrais", "IDArticleEtqEntretien", "Ecologique", 
-        "TauxDefectueux", "Publier", "Ordre", "TauxCommissionCA", "CODE_OLD", "PrixEtude",
-        "CodeDouane", "Observations", "NomenclatureValidePar", "NbrPiecesColis", "NbrColisPalette",
-        "PoidsEmballage", "IDcomplexite", "IDAr_Theme", "Emballage", "Boutonnage", 
-        "SupportArt", "ReseauArt", "ReferenceFssr", "IDFibreComposition", "PrixOutlet", "IDPlanComptable"
-    ]
-    df.drop(columns=drop_columns, inplace=True)
-    
-    # Conversion en numérique pour quelques colonnes critiques
-    numeric_cols = ["IDArticle", "Etat", "TauxTVA", "NumInterne", "IDSaison"]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Règle métier : Etat doit être 0 ou 1
-    df = df[df["Etat"].isin([0, 1])]
-    
-    # Conversion des colonnes de type date
-    date_cols = ["SaisiLe", "ModifieLe"]
-    for col in date_cols:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    
-    # Suppression des lignes essentielles manquantes
-    essential_cols = ["IDArticle", "Code"]
-    df.dropna(subset=essential_cols, inplace=True)
-    
-    # Suppression des doublons éventuels
-    df.drop_duplicates(inplace=True)
-    
-    return df
+
+    # Suppression des colonnes non nécessaires (absentes si la projection a été faite en SQL)
+    df = df.drop(columns=spec["drop"], errors='ignore')
+
+    # Conversion des colonnes critiques (numériques et dates)
+    with stage("conversion_types", len(df)):
+        for col, kind in spec["dtypes"].items():
+            if col not in df.columns:
+                continue
+            if kind == "datetime":
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+            else:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Règles métier (valeurs autorisées, bornes, positivité) et lignes essentielles manquantes
+    with stage("regles", len(df)) as record:
+        valid, report = apply_rules(df, _rules_for(spec))
+        df = df[valid]
+        record["lignes_sortie"] = len(df)
+
+    return (df, report) if with_report else df
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "codebarre" ---
+# --- Types compacts pour les tables nettoyées
 ###############################################################################
-def clean_codebarre(engine):
-    df = pd.read_sql("SELECT * FROM codebarre", con=engine)
-    
-    # Corriger toutes les colonnes texte
-    df = fix_nan_in_all_text_cols(df)
-    
-    # Supprimer les colonnes non nécessaires
-    df.drop(columns=["Indice", "IDSerieArticle","NumInterne"], inplace=True)
-    
-    # Conversion en numérique pour les colonnes critiques
-    numeric_cols = ['IDCodeBarre', 'IdEntite', 'IdTaille', 'IDAr_Couleur', 'Prix', 'isSynchronized', 'isSynchronizedWeb']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Règle métier : isSynchronized et isSynchronizedWeb doivent être 0 ou 1
-    for col in ['isSynchronized', 'isSynchronizedWeb']:
-        df = df[df[col].isin([0, 1])]
-    
-    # Règle métier additionnelle : Prix doit être > 0
-    df = df[df["Prix"] > 0]
-    
-    # Traitement des valeurs manquantes dans les colonnes essentielles
-    df.dropna(subset=['IDCodeBarre', 'CodeBarre'], inplace=True)
-    
-    # Suppression des doublons éventuels
-    df.drop_duplicates(inplace=True)
-    
-    return df
+# Une colonne texte devient catégorielle si elle a au plus CATEGORY_MAX_RATIO valeurs
+# distinctes par valeur présente ; les autres passent en chaînes Arrow.
+CATEGORY_MAX_RATIO = 0.5
+INTEGER_DTYPES = ["Int8", "Int16", "Int32", "Int64"]
+
+def memory_mb(df):
+    """Mémoire occupée par le DataFrame (contenu des chaînes compris), en Mo."""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+def _is_flag(col, values, spec):
+    allowed = spec.get("allowed", {}).get(col)
+    if allowed is not None:
+        return set(allowed) <= {0, 1}
+    return col.lower().startswith("is") and values.isin([0, 1]).all()
+
+def _is_integer_column(col, spec):
+    return col.lower().startswith("id") or col in spec.get("ranges", {})
+
+def _compact_integer(series):
+    """Plus petit entier signé ; entier nullable (Int8...Int64) s'il manque des valeurs."""
+    values = series.dropna()
+    if len(values) == 0 or not (values == np.round(values)).all():
+        return series
+    if len(values) == len(series):
+        return pd.to_numeric(series, downcast="integer")
+    low, high = values.min(), values.max()
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return series.astype(dtype)
+    return series
+
+@instrumented()
+def compact_dtypes(df, spec):
+    """
+    Dernière étape du nettoyage : types compacts, sans changer les valeurs.
+      - indicateurs 0/1 : int8 (Int8 nullable s'il manque des valeurs ; pas de boolean,
+        que select_dtypes(include=[np.number]) écarterait des features) ;
+      - identifiants (ID...) et colonnes bornées : plus petit entier (nullable si besoin) ;
+      - texte peu varié : category ; autre texte : chaînes Arrow.
+    Les indicateurs restent numériques : ils sont toujours retenus comme features des modèles.
+    """
+    dtypes = {}
+    for col, kind in spec["dtypes"].items():
+        if col not in df.columns or kind != "numeric" or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        values = df[col].dropna()
+        if len(values) and _is_flag(col, values, spec):
+            dtypes[col] = "int8" if len(values) == len(df) else "Int8"
+        elif _is_integer_column(col, spec):
+            compacted = _compact_integer(df[col])
+            if compacted.dtype != df[col].dtype:
+                dtypes[col] = compacted.dtype
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        n_present = df[col].notna().sum()
+        if n_present and df[col].nunique() <= CATEGORY_MAX_RATIO * n_present:
+            dtypes[col] = "category"
+        elif pa is not None and df[col].dtype != "string[pyarrow]":
+            dtypes[col] = "string[pyarrow]"
+    return df.astype(dtypes) if dtypes else df
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "fournisseur" ---
+# --- Projection des colonnes et filtres poussés dans la requête SQL
 ###############################################################################
-def clean_fournisseur(engine):
-    df = pd.read_sql("SELECT * FROM fournisseur", con=engine)
-    
-    # Corriger toutes les colonnes texte
-    df = fix_nan_in_all_text_cols(df)
-    
-    drop_columns = [
-        "isFournisseur", "Note", "Type", "FournitMP", "FournitMB", "NumInterne",
-        "TauxRetenueSource", "ExonerationRS", "IsPDR", "Timbre", "ToleranceMAxAccepte",
-        "IDBanque", "AdresseBanque", "VilleBanque", "NumCompte", "CodeSwift", "IBAN",
-        "NonAssujettiTVA", "DelaisLivraison", "Reference", "IDFournisseurParent", "Difference",
-        "AppliqueFodec", "Login_FRS", "IDPlanComptable", "DateExonerationRS", "Echeance",
-        "IDConditionReglement"
-    ]
-    df.drop(columns=drop_columns, inplace=True)
-    
-    # Conversion en numérique pour les colonnes critiques restantes
-    numeric_columns = ["IDFournisseur", "Chiffre", "Reglements", "Solde", "IDDevise", "IDCategorie", "IDPays", "Etat", "IDCGAFournisseur", "IsMP", "IsPF"]
-    for col in numeric_columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Règle métier : Etat doit être 0 ou 1
-    df = df[df["Etat"].isin([0, 1])]
-    # Règle métier : FournitPF doit être 0 ou 1 (si la colonne est conservée)
-    
-    # Suppression des lignes essentielles manquantes
-    essential_cols = ["IDFournisseur", "Fournisseur", "Code"]
-    df.dropna(subset=essential_cols, inplace=True)
-    
-    # Suppression des doublons éventuels
-    df.drop_duplicates(inplace=True)
-    
-    return df
+@lru_cache(maxsize=None)
+def _table_columns(engine, table):
+    """Colonnes de la table dans l'ordre de la base (lues une seule fois par engine)."""
+    return tuple(col["name"] for col in inspect(engine).get_columns(table))
+
+def build_select(engine, table, pushdown=True, filters=True):
+    """
+    Requête de lecture d'une table. Avec `pushdown`, seules les colonnes conservées par la
+    spécification sont sélectionnées et les règles métier sont ajoutées au WHERE (sauf si
+    `filters` est faux) ; sinon on renvoie l'historique SELECT * (le nettoyage pandas fait
+    alors tout le travail).
+    """
+    if not pushdown:
+        return text(f"SELECT * FROM {table}")
+    spec = TABLE_SPECS[table]
+    dropped = set(spec["drop"])
+    columns = [col for col in _table_columns(engine, table) if col not in dropped]
+    t = sa_table(table, *[sa_column(col) for col in columns])
+    if not filters:
+        return select(*t.c)
+
+    conditions = [t.c[col].in_(values) for col, values in spec.get("allowed", {}).items()]
+    for col, (low, high) in spec.get("ranges", {}).items():
+        if low is not None:
+            conditions.append(t.c[col] >= low)
+        if high is not None:
+            conditions.append(t.c[col] <= high)
+    conditions += [t.c[col] > 0 for col in spec.get("positive", [])]
+    conditions += [t.c[col].isnot(None) for col in spec["required"]]
+    return select(*t.c).where(*conditions)
+
+def verify_pushdown(engine, table):
+    """
+    Vérifie que la lecture projetée et filtrée en SQL donne le même résultat que le
+    chemin pandas historique (SELECT * puis nettoyage). Lève AssertionError sinon.
+    Les types peuvent différer (int64 / float64 selon les NULL écartés par le WHERE).
+    """
+    expected = _clean_table(engine, table, pushdown=False).reset_index(drop=True)
+    result = _clean_table(engine, table, pushdown=True).reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, result, check_dtype=False)
+    return True
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "saison" ---
+# --- Fonctions de nettoyage par table
 ###############################################################################
-def clean_saison(engine):
-    df = pd.read_sql("SELECT * FROM saison", con=engine)
-    
-    # Corriger toutes les colonnes texte
-    df = fix_nan_in_all_text_cols(df)
-    
-    # Supprimer les colonnes DateDebut et DateFin
-    df.drop(columns=["DateDebut", "DateFin"], inplace=True)
-    
-    # Conversion en numérique pour les colonnes critiques
-    numeric_cols = ['IDSaison', 'Etat', 'IDTypeSaison']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Règle métier : Etat doit être 0 ou 1
-    df = df[df["Etat"].isin([0, 1])]
-    
-    # Suppression des lignes essentielles manquantes
-    df.dropna(subset=['IDSaison', 'Saison', 'Code'], inplace=True)
-    
-    # Suppression des doublons
-    df.drop_duplicates(inplace=True)
-    
-    return df
+def clean_ar_sfamille(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "ar_sfamille", chunksize, pushdown, compact)
+
+def clean_arfamille(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "arfamille", chunksize, pushdown, compact)
+
+def clean_article(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "article", chunksize, pushdown, compact)
+
+def clean_codebarre(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "codebarre", chunksize, pushdown, compact)
+
+def clean_fournisseur(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "fournisseur", chunksize, pushdown, compact)
+
+def clean_grille(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "grille", chunksize, pushdown, compact)
+
+def clean_saison(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "saison", chunksize, pushdown, compact)
+
+def clean_tailles(engine, chunksize=None, pushdown=True, compact=True):
+    return _clean_table(engine, "tailles", chunksize, pushdown, compact)
 
 ###############################################################################
-# --- Fonction de nettoyage pour la table "tailles" ---
+# --- Lecture par blocs (streaming) et nettoyage incrémental
 ###############################################################################
-def clean_tailles(engine):
-    df = pd.read_sql("SELECT * FROM tailles", con=engine)
-    
-    # Corriger toutes les colonnes texte
-    df = fix_nan_in_all_text_cols(df)
-    
-    # Supprimer les colonnes non nécessaires
-    drop_columns = ["LibTailleAR", "LibTailleAutre", "LibTailleGER", "LibTailleUSA", "LibTailleSP", "LibTailleGRK"]
-    df.drop(columns=drop_columns, inplace=True)
-    
-    # Conversion en numérique pour les colonnes critiques
-    numeric_cols = ['IDGrille', 'IdTaille', 'Ordre', 'isMilieu']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Suppression des lignes essentielles manquantes
-    df.dropna(subset=['LibTaille', 'IdTaille'], inplace=True)
-    
-    # Règle métier : isMilieu doit être 0 ou 1
-    df = df[df["isMilieu"].isin([0, 1])]
-    
-    # Validation pour Ordre (ici, on vérifie qu'il est dans la plage 0-255)
-    df = df[(df["Ordre"] >= 0) & (df["Ordre"] <= 255)]
-    
-    # Suppression des doublons
-    df.drop_duplicates(inplace=True)
-    
+def _scan_key(engine, table):
+    primary = inspect(engine).get_pk_constraint(table)["constrained_columns"]
+    return primary[0] if len(primary) == 1 else TABLE_KEYS[table]
+
+def read_table_chunks(engine, table, chunksize, pushdown=True, filters=True):
+    """
+    Lit la table par blocs d'au plus `chunksize` lignes, par pagination sur la clé
+    (WHERE clé > dernière ORDER BY clé LIMIT n) : chaque requête ne renvoie qu'un bloc,
+    quel que soit le pilote (mysqlconnector ignore stream_results et charge tout le
+    résultat). Les lignes qui partagent la clé de fin d'un bloc passent au bloc suivant
+    (ou forment leur propre bloc si elles le remplissent), celles de clé NULL forment le
+    dernier bloc. L'index de chaque bloc est décalé pour correspondre à la position de la
+    ligne lue.
+    """
+    if pushdown:
+        query = build_select(engine, table, pushdown, filters)
+    else:
+        query = select(*sa_table(table, *[sa_column(col) for col in _table_columns(engine, table)]).c)
+    key_name = _scan_key(engine, table)
+    key = sa_column(key_name)
+    offset, condition = 0, key.isnot(None)
+    with engine.connect() as conn:
+        while condition is not None:
+            chunk = pd.read_sql(query.where(condition).order_by(key).limit(chunksize), con=conn)
+            if len(chunk) < chunksize:
+                condition = None
+            else:
+                last = chunk[key_name].iloc[-1]
+                last = last.item() if isinstance(last, np.generic) else last
+                tail = (chunk[key_name] == last).to_numpy()
+                if tail.all():
+                    # Une seule clé remplit le bloc : toutes ses lignes sont lues d'un coup
+                    chunk, condition = pd.read_sql(query.where(key == last), con=conn), key > last
+                else:
+                    chunk, condition = chunk[~tail], key >= last
+            if condition is None:
+                tables = [chunk, pd.read_sql(query.where(key.is_(None)), con=conn)]
+            else:
+                tables = [chunk]
+            for chunk in tables:
+                if len(chunk):
+                    chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                    offset += len(chunk)
+                    yield chunk
+
+def _row_digests(df):
+    """
+    Empreinte 64 bits de chaque ligne (toutes colonnes, hors index).
+    Les colonnes numériques sont hachées en float64 : une même ligne doit avoir la même
+    empreinte qu'elle tombe dans un bloc int64 (sans NULL) ou float64 (avec NULL).
+    """
+    num_cols = df.select_dtypes(include=['number', 'bool']).columns
+    if len(num_cols):
+        df = df.astype({col: 'float64' for col in num_cols})
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def _drop_seen_duplicates(df, seen):
+    """
+    Équivalent de drop_duplicates() sur l'ensemble des blocs : on garde la première
+    occurrence de chaque ligne, `seen` mémorise les empreintes des blocs précédents.
+    """
+    digests = _row_digests(df)
+    keep = ~pd.Series(digests).duplicated().to_numpy()
+    keep &= np.fromiter((h not in seen for h in digests.tolist()), dtype=bool, count=len(digests))
+    seen.update(digests[keep].tolist())
+    return df[keep]
+
+def iter_clean_table(engine, table, chunksize=100_000, pushdown=True):
+    """
+    Générateur : lit et nettoie la table bloc par bloc, et renvoie chaque bloc nettoyé.
+    Les doublons sont supprimés aussi entre blocs (ensemble d'empreintes de lignes) : seule
+    cette partie de la mémoire croît avec la table (benchmarks/bench_pipeline.py,
+    iter_clean_codebarre).
+    """
+    spec = TABLE_SPECS[table]
+    seen = set()
+    for chunk in read_table_chunks(engine, table, chunksize, pushdown):
+        yield _drop_seen_duplicates(clean_chunk(chunk, spec), seen)
+
+def write_clean_table(engine, table, path, chunksize=100_000, pushdown=True):
+    """
+    Nettoie la table en streaming et écrit le résultat au fur et à mesure dans un CSV.
+    Retourne le nombre de lignes écrites.
+    """
+    n_rows = 0
+    for i, chunk in enumerate(iter_clean_table(engine, table, chunksize, pushdown)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        n_rows += len(chunk)
+    return n_rows
+
+def _clean_table(engine, table, chunksize=None, pushdown=True, compact=True):
+    """
+    Nettoie une table complète. Sans `chunksize`, la table est chargée d'un bloc ; avec
+    `chunksize`, elle est lue et nettoyée par blocs puis réassemblée. Avec `compact`, les
+    colonnes reçoivent ensuite des types compacts (voir compact_dtypes).
+    """
+    spec = TABLE_SPECS[table]
+    with stage("nettoyage", table=table, blocs=chunksize) as record:
+        if chunksize is None:
+            with stage("lecture_sql", table=table) as read:
+                df = pd.read_sql(build_select(engine, table, pushdown), con=engine)
+                read["lignes_sortie"] = len(df)
+            record["lignes_entree"] = len(df)
+            df = clean_chunk(df, spec)
+            # Suppression des doublons
+            with stage("drop_duplicates", len(df), table=table) as dedup:
+                df.drop_duplicates(inplace=True)
+                dedup["lignes_sortie"] = len(df)
+        else:
+            chunks = list(iter_clean_table(engine, table, chunksize, pushdown))
+            if not chunks:
+                # Aucune ligne lue : la lecture d'un bloc renvoie un DataFrame vide mais typé
+                return _clean_table(engine, table, None, pushdown, compact)
+            # Les types compacts sont choisis sur la table réassemblée, pas bloc par bloc
+            df = pd.concat(chunks)
+        df = compact_dtypes(df, spec) if compact else df
+        record["lignes_sortie"] = len(df)
     return df
 
+def rejection_report(engine, table, chunksize=None, sample_size=REJECT_SAMPLE_SIZE):
+    """
+    Nettoie `table` en lisant toutes ses lignes (projection SQL sans WHERE, pour que les
+    règles voient les lignes qu'elles rejettent) et renvoie (DataFrame nettoyé, rapport),
+    le rapport donnant pour chaque règle le nombre de lignes rejetées et des exemples.
+    """
+    spec = TABLE_SPECS[table]
+    if chunksize is None:
+        chunks = [pd.read_sql(build_select(engine, table, filters=False), con=engine)]
+    else:
+        chunks = read_table_chunks(engine, table, chunksize, filters=False)
+    seen, report, cleaned, n_valid = set(), {}, [], 0
+    for chunk in chunks:
+        chunk, chunk_report = clean_chunk(chunk, spec, with_report=True)
+        merge_reports(report, chunk_report, sample_size)
+        n_valid += len(chunk)
+        cleaned.append(_drop_seen_duplicates(chunk, seen))
+    if not cleaned:
+        return rejection_report(engine, table, None, sample_size)
+    df = pd.concat(cleaned)
+    report["doublons"] = {"rejetees": n_valid - len(df), "exemples": df.iloc[:0]}
+    return df, report
+
+###############################################################################
+# --- Nettoyage parallèle de plusieurs tables
+###############################################################################
+CLEANERS = {
+    "ar_sfamille": clean_ar_sfamille,
+    "arfamille": clean_arfamille,
+    "article": clean_article,
+    "codebarre": clean_codebarre,
+    "fournisseur": clean_fournisseur,
+    "grille": clean_grille,
+    "saison": clean_saison,
+    "tailles": clean_tailles,
+}
+
+def _timed_clean(table, engine, chunksize=None):
+    start = time.perf_counter()
+    df = CLEANERS[table](engine, chunksize=chunksize, compact=False)
+    before = memory_mb(df)
+    df = compact_dtypes(df, TABLE_SPECS[table])
+    return df, time.perf_counter() - start, (before, memory_mb(df))
+
+def _timed_clean_in_process(table, url, chunksize=None):
+    # Un engine ne se transmet pas entre processus : chaque worker ouvre le sien
+    worker_engine = make_engine(pool_size=1, url=url)
+    try:
+        return _timed_clean(table, worker_engine, chunksize)
+    finally:
+        worker_engine.dispose()
+
+def clean_all_tables(tables=None, max_workers=None, chunksize=None, use_processes=False, engine=None):
+    """
+    Nettoie plusieurs tables en même temps et renvoie {nom de table: DataFrame nettoyé}.
+    Par défaut, un thread par table (la lecture MySQL et les noyaux Arrow libèrent le GIL)
+    sur un engine dont le pool a autant de connexions que de workers ; `use_processes`
+    utilise un pool de processus (un engine par worker). Le temps, le nombre de lignes et
+    la mémoire de chaque table avant / après compact_dtypes sont affichés : le total doit
+    approcher le temps de la table la plus lente.
+    """
+    tables = list(tables or TABLE_SPECS)
+    max_workers = max_workers or len(tables)
+    own_engine = engine is None and not use_processes
+    if own_engine:
+        engine = make_engine(pool_size=max_workers)
+
+    results = {}
+    start = time.perf_counter()
+    if use_processes:
+        url = database_url() if engine is None else engine.url.render_as_string(hide_password=False)
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        futures = {executor.submit(_timed_clean_in_process, table, url, chunksize): table for table in tables}
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {executor.submit(_timed_clean, table, engine, chunksize): table for table in tables}
+    try:
+        with executor:
+            for future in as_completed(futures):
+                table = futures[future]
+                df, elapsed, (before, after) = future.result()
+                results[table] = df
+                print(f"  {table:<12} {len(df):>10} lignes  {elapsed:8.2f} s  "
+                      f"{before:8.1f} Mo -> {after:.1f} Mo")
+    finally:
+        if own_engine:
+            engine.dispose()
+    print(f"  {'total':<12} {sum(len(df) for df in results.values()):>10} lignes  "
+          f"{time.perf_counter() - start:8.2f} s (mur)")
+
+    return {table: results[table] for table in tables}
+
 ###############################################################################
 # --- Exécution du nettoyage et génération des rapports pour toutes les tables
 ###############################################################################
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Nettoyage des tables et rapports exploratoires")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLE_SPECS), help="tables à nettoyer (défaut : toutes)")
+    parser.add_argument("--workers", type=int, default=None, help="nettoyages simultanés (défaut : une par table)")
+    parser.add_argument("--chunksize", type=int, default=None, help="lecture par blocs de N lignes")
+    parser.add_argument("--processes", action="store_true", help="pool de processus au lieu de threads")
+    parser.add_argument("--sans-rapports", action="store_true", help="ne pas générer les rapports HTML")
+    parser.add_argument("--rejets", action="store_true",
+                        help="afficher les lignes rejetées par règle et écrire des exemples (rejets_<table>.csv)")
+    parser.add_argument("--profil", choices=["minimal", "sampled", "full"], default="minimal",
+                        help="minimal : stats par colonne ; sampled : ydata sur échantillon ; full : ydata complet")
+    args = parser.parse_args()
+    
     print("=== Début du nettoyage des tables ===\n")
     
-    df_ar_sfamille_clean = clean_ar_sfamille(engine)
-    df_arfamille_clean = clean_arfamille(engine)
-    df_article_clean = clean_article(engine)
-    df_codebarre_clean = clean_codebarre(engine)
-    df_fournisseur_clean = clean_fournisseur(engine)
-    df_saison_clean = clean_saison(engine)
-    df_tailles_clean = clean_tailles(engine)
+    # Contrôle optionnel : la lecture projetée/filtrée en SQL doit égaler le chemin pandas
+    if os.environ.get("PFE_VERIFY_PUSHDOWN") == "1":
+        for table in TABLE_SPECS:
+            verify_pushdown(get_engine(), table)
+            print(f"Pushdown vérifié pour '{table}'")
+    
+    # Rapport optionnel des rejets : combien de lignes chaque règle écarte, avec des exemples
+    if args.rejets:
+        for table in args.tables or TABLE_SPECS:
+            _, report = rejection_report(get_engine(), table, args.chunksize)
+            print(f"Rejets pour '{table}' :")
+            for rule, entry in report.items():
+                print(f"  {rule:<28} {entry['rejetees']:>10}")
+            examples = [entry["exemples"].assign(regle=rule) for rule, entry in report.items() if len(entry["exemples"])]
+            if examples:
+                pd.concat(examples).to_csv(f"rejets_{table}.csv", index=False)
+        print()
+
+    results = clean_all_tables(args.tables, args.workers, args.chunksize, args.processes)
     
-    # Génération des rapports pour chaque table
-    ProfileReport(df_ar_sfamille_clean, title="Rapport Exploratoire - ar_sfamille", explorative=True)\
-        .to_file("rapport_ar_sfamille.html")
-    ProfileReport(df_arfamille_clean, title="Rapport Exploratoire - arfamille", explorative=True)\
-        .to_file("rapport_arfamille.html")
-    ProfileReport(df_article_clean, title="Rapport Exploratoire - article", explorative=True)\
-        .to_file("rapport_article.html")
-    ProfileReport(df_codebarre_clean, title="Rapport Exploratoire - codebarre", explorative=True)\
-        .to_file("rapport_codebarre.html")
-    ProfileReport(df_fournisseur_clean, title="Rapport Exploratoire - fournisseur", explorative=True)\
-        .to_file("rapport_fournisseur.html")
-    ProfileReport(df_saison_clean, title="Rapport Exploratoire - saison", explorative=True)\
-        .to_file("rapport_saison.html")
-    ProfileReport(df_tailles_clean, title="Rapport Exploratoire - tailles", explorative=True)\
-        .to_file("rapport_tailles.html")
+    # Génération des rapports pour chaque table, en parallèle
+    if not args.sans_rapports:
+        from profilage import profile_tables
+        profile_tables(results, mode=args.profil, max_workers=args.workers)
     
     print("\nLes rapports HTML ont été générés dans le répertoire :", os.getcwd())
     print("\n=== Fin du nettoyage et de l'analyse exploratoire ===")
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+###############################################################################
+# Validation structurelle des codes-barres (EAN-8, UPC-A, EAN-13, GTIN-14)
+###############################################################################
+# Tout est calculé sur les tampons Arrow de la colonne (offsets + octets UTF-8), sans
+# boucle Python par ligne : les chiffres sont lus depuis la fin de chaque chaîne, ce qui
+# aligne tous les formats GTIN à droite. La clé de contrôle GS1 est la même pour toutes
+# les longueurs : pondérations 3, 1, 3, … en partant du chiffre qui précède la clé. Les
+# 16 derniers octets de chaque chaîne sont lus en deux mots de 64 bits et sommés mot par
+# mot (masques et multiplications), tous formats confondus.
+#   motif "manquant"   : valeur absente ou vide
+#   motif "caracteres" : autre chose que des chiffres
+#   motif "longueur"   : ni 8, 12, 13 ni 14 chiffres
+#   motif "cle"        : chiffre de contrôle incorrect
+#   motif "zeros"      : que des zéros (clé valide, mais code de remplissage)
+# Les préfixes 20 à 29 (EAN-13) sont réservés à la diffusion restreinte (codes internes
+# du magasin) : ils restent valides et sont signalés dans la colonne "interne".
+# Les codes UPC-E (8 chiffres compressés) ne se distinguent pas d'un EAN-8 sans contexte :
+# ils sont contrôlés comme des EAN-8.
+BARCODE_TYPES = {8: "EAN-8", 12: "UPC-A", 13: "EAN-13", 14: "GTIN-14"}
+MAX_DIGITS = max(BARCODE_TYPES)
+REASONS = ["manquant", "caracteres", "longueur", "cle", "zeros"]
+
+# Type de chaque longueur (-1 : aucun format) ; au-delà de MAX_DIGITS, -1
+TYPE_BY_LENGTH = np.full(MAX_DIGITS + 2, -1, dtype=np.int8)
+TYPE_BY_LENGTH[list(BARCODE_TYPES)] = np.arange(len(BARCODE_TYPES))
+
+# Somme pondérée par mots de 64 bits (petit-boutiste : le dernier octet lu est l'octet de poids fort)
+WORD_BYTES = 8
+EVEN_BYTES = np.uint64(0x00FF00FF00FF00FF)
+LANE_SUM = np.uint64(0x0001000100010001)
+# Pour une chaîne de k octets (k <= 16), octets à garder dans le dernier mot (les k de poids
+# fort, au plus 8) et dans le mot précédent (les k - 8 de poids fort) : les autres
+# appartiennent aux chaînes précédentes
+_KEEP = [((1 << 8 * k) - 1) << (64 - 8 * k) for k in range(WORD_BYTES + 1)]
+LAST_WORD_MASKS = np.array([_KEEP[min(k, WORD_BYTES)] for k in range(2 * WORD_BYTES + 1)], dtype=np.uint64)
+PREVIOUS_WORD_MASKS = np.array([_KEEP[max(k - WORD_BYTES, 0)] for k in range(2 * WORD_BYTES + 1)], dtype=np.uint64)
+# Somme pondérée des codes ASCII de k zéros (48 = '0'), retirée de celle des octets bruts
+ZERO_SUMS = np.array([48 * (k + 2 * (k // 2)) for k in range(2 * WORD_BYTES + 1)], dtype=np.int16)
+
+def _arrow_strings(values):
+    """Colonne en large_string Arrow (un seul bloc)."""
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        arr = values
+    elif isinstance(values, pd.Series) and values.dtype == "string[pyarrow]":
+        arr = pa.array(values.array)  # tampons Arrow de la colonne, sans copie
+    else:
+        values = pd.Series(values)
+        try:
+            # Chaînes Python (object) converties directement par Arrow, sans passer par StringDtype
+            arr = pa.array(values.to_numpy(), from_pandas=True, type=pa.string())
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            arr = pa.array(values.astype("string"), from_pandas=True, type=pa.string())  # nombres, mélanges
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    return arr.cast(pa.large_string())
+
+def _buffers(arr):
+    """Offsets (int64, à partir de 0) et octets de la plage couverte par la colonne."""
+    n = len(arr)
+    offsets = np.frombuffer(arr.buffers()[1], dtype=np.int64)[arr.offset:arr.offset + n + 1]
+    data = np.frombuffer(arr.buffers()[2], dtype=np.uint8) if arr.buffers()[2] is not None else np.zeros(0, np.uint8)
+    return offsets - offsets[0], data[offsets[0]:offsets[-1]]
+
+def _weighted_sums(data, offsets, lengths):
+    """
+    Somme pondérée GS1 des chiffres de chaque chaîne (la clé, à droite, a le poids 1, puis
+    3, 1, 3, …), sur ses 16 derniers octets : ceux de deux mots de 64 bits lus à la fin de
+    la chaîne (lecture non alignée dans le tampon), limités à la chaîne par les masques.
+    Les deux mots sont additionnés octet par octet ; les octets de poids fort de chaque
+    paire (rangs impairs depuis la fin) ont le poids 1, les autres le poids 3, et les
+    quatre paires sont additionnées par une multiplication. Le poids des codes ASCII de
+    '0' est retiré à la fin. Valeur sans signification (int16) pour une chaîne qui n'est
+    pas faite de chiffres ou qui en a plus de 16.
+    """
+    padded = np.zeros(2 * WORD_BYTES + len(data), dtype=np.uint8)
+    padded[2 * WORD_BYTES:] = data
+    words = np.ndarray((len(padded) - WORD_BYTES + 1,), dtype="<u8", buffer=padded, strides=(1,))
+    # Dans `padded`, la chaîne se termine en offsets[1:] + 16 : mots en offsets[1:] + 8 et offsets[1:]
+    short = np.minimum(lengths, 2 * WORD_BYTES)
+    pairs = words[offsets[1:] + WORD_BYTES] & LAST_WORD_MASKS[short]
+    pairs += words[offsets[1:]] & PREVIOUS_WORD_MASKS[short]
+    odd = pairs >> np.uint64(8)
+    odd &= EVEN_BYTES
+    pairs &= EVEN_BYTES
+    pairs *= np.uint64(3)
+    pairs += odd
+    pairs *= LANE_SUM
+    pairs >>= np.uint64(48)
+    return pairs.astype(np.int16) - ZERO_SUMS[short]
+
+def validate_barcodes(values):
+    """
+    Valide chaque code-barre de `values` (Series, liste ou tableau Arrow de chaînes ;
+    espaces aux extrémités ignorés). Renvoie un DataFrame (index de `values` si c'est une
+    Series) : longueur, type, interne, code_barre_valide et motif (catégoriels, NaN si valide).
+    """
+    arr = _arrow_strings(values)
+    present = ~arr.is_null().to_numpy(zero_copy_only=False)
+    all_digits = pc.fill_null(pc.ascii_is_decimal(arr), False).to_numpy(zero_copy_only=False)
+    suspects = arr.filter(~all_digits & present)
+    if len(suspects) and pc.any(pc.not_equal(pc.utf8_trim_whitespace(suspects), suspects)).as_py():
+        # Espaces présents : retirés aux extrémités (les chaînes de chiffres sont recalculées)
+        arr = pc.utf8_trim_whitespace(arr)
+        all_digits = pc.fill_null(pc.ascii_is_decimal(arr), False).to_numpy(zero_copy_only=False)
+    offsets, data = _buffers(arr)
+    lengths = np.diff(offsets)
+
+    # Clé de contrôle de toutes les chaînes en une passe ; format d'après la longueur
+    weighted = _weighted_sums(data, offsets, lengths)
+    type_codes = np.where(all_digits, TYPE_BY_LENGTH[np.minimum(lengths, MAX_DIGITS + 1)], -1).astype(np.int8)
+    # Motif : les conditions sont appliquées de la moins à la plus prioritaire
+    reason = np.full(len(arr), -1, dtype=np.int8)
+    reason[weighted == 0] = 4
+    reason[weighted % 10 != 0] = 3
+    reason[type_codes < 0] = 2
+    reason[~all_digits] = 1
+    reason[~present | (lengths == 0)] = 0
+    # Préfixe 2x d'un EAN-13 : premier caractère de la chaîne
+    internal = (lengths == 13) & (reason < 0)
+    internal[internal] = data[offsets[:-1][internal]] == ord("2")
+
+    index = values.index if isinstance(values, pd.Series) else None
+    return pd.DataFrame({
+        "longueur": np.where(present, lengths, 0),
+        "type": pd.Categorical.from_codes(type_codes, list(BARCODE_TYPES.values())),
+        "interne": internal,
+        "code_barre_valide": reason < 0,
+        "motif": pd.Categorical.from_codes(reason, REASONS),
+    }, index=index)
+
+def flag_barcodes(df, column="CodeBarre"):
+    """Ajoute code_barre_valide et motif_code_barre à `df` (copie) ; inchangé si la colonne est absente."""
+    if column not in df.columns:
+        return df
+    result = validate_barcodes(df[column])
+    return df.assign(code_barre_valide=result["code_barre_valide"].to_numpy(),
+                     motif_code_barre=result["motif"].to_numpy())
+
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import get_engine
+    from cache_tables import cached_clean
+
+    parser = argparse.ArgumentParser(description="Validation des codes-barres de la table codebarre")
+    parser.add_argument("--sortie", default="codes_barres_invalides.csv")
+    args = parser.parse_args()
+
+    df = cached_clean(get_engine(), "codebarre")
+    start = time.perf_counter()
+    result = validate_barcodes(df["CodeBarre"])
+    elapsed = time.perf_counter() - start
+    print(f"{len(df)} codes-barres validés en {elapsed:.3f} s "
+          f"({len(df) / elapsed / 1e6:.1f} M/s)" if elapsed else "")
+    print(result["motif"].value_counts(dropna=False).rename(index={np.nan: "valide"}).to_string())
+    print(f"Codes internes (préfixe 2x) : {int(result['interne'].sum())}")
+    invalid = df.loc[~result["code_barre_valide"]].join(result[["type", "motif"]])
+    invalid.to_csv(args.sortie, index=False)
+    print(f"Codes-barres invalides écrits dans {args.sortie}")
@@ -0,0 +1,40 @@
+import os
+import configparser
+from functools import lru_cache
+
+###############################################################################
+# Paramètres de connexion à la base MySQL
+###############################################################################
+# Ordre de priorité : variables d'environnement PFE_DB_*, puis section [mysql] du
+# fichier pfe.ini (chemin modifiable via PFE_CONFIG), puis valeurs par défaut.
+# PFE_DATABASE_URL remplace l'ensemble (utile pour pointer vers une autre base).
+CONFIG_FILE = os.environ.get("PFE_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pfe.ini"))
+
+DEFAULT_SETTINGS = {
+    "username": "root",
+    "password": "louzisql",
+    "host": "localhost",
+    "port": "3306",
+    "database": "pfe",
+}
+
+def db_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    parser = configparser.ConfigParser()
+    if parser.read(CONFIG_FILE, encoding="utf-8") and parser.has_section("mysql"):
+        settings.update(parser["mysql"])
+    for key in settings:
+        settings[key] = os.environ.get(f"PFE_DB_{key.upper()}", settings[key])
+    return settings
+
+def database_url():
+    if os.environ.get("PFE_DATABASE_URL"):
+        return os.environ["PFE_DATABASE_URL"]
+    s = db_settings()
+    return f"mysql+mysqlconnector://{s['username']}:{s['password']}@{s['host']}:{s['port']}/{s['database']}"
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Engine partagé, créé au premier appel (et non à l'import des modules)."""
+    from sqlalchemy import create_engine
+    return create_engine(database_url())
@@ -0,0 +1,176 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+
+###############################################################################
+# Détecteur d'anomalies réutilisable : apprentissage, sauvegarde, scoring par lots
+###############################################################################
+# Un détecteur est un dict {table, features, params, fingerprint, scaler, model}
+# sauvegardé avec joblib sous MODEL_DIR/<table>-<features+params>-<données>.joblib.
+# Un modèle appris sur un sous-ensemble de la table (variante, par exemple les lignes
+# retenues par le filtre statistique) est rangé sous <table>@<variante>-... : il n'est
+# jamais pris pour le modèle de la table. Seules les MAX_MODEL_VERSIONS versions les plus
+# récemment utilisées (données différentes) sont gardées par table, features et paramètres.
+MODEL_DIR = os.environ.get("PFE_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "modeles"))
+SCORE_BATCH_SIZE = 100_000
+MAX_MODEL_VERSIONS = int(os.environ.get("PFE_MODEL_VERSIONS", 3))
+DEFAULT_PARAMS = {"contamination": 0.05, "n_estimators": 100, "max_samples": "auto"}
+# Paramètres retenus par table à l'issue du balayage (balayage_iforest.py)
+TUNED_PARAMS_FILE = os.path.join(MODEL_DIR, "parametres_retenus.json")
+
+def tuned_params(table):
+    """Paramètres de l'Isolation Forest pour `table` : ceux du balayage s'il y en a, sinon DEFAULT_PARAMS."""
+    params = dict(DEFAULT_PARAMS)
+    if table is not None and os.path.exists(TUNED_PARAMS_FILE):
+        with open(TUNED_PARAMS_FILE, encoding="utf-8") as f:
+            params.update(json.load(f).get(table, {}))
+    return params
+
+def save_tuned_params(choices):
+    """Fusionne {table: paramètres} dans le fichier des paramètres retenus."""
+    saved = {}
+    if os.path.exists(TUNED_PARAMS_FILE):
+        with open(TUNED_PARAMS_FILE, encoding="utf-8") as f:
+            saved = json.load(f)
+    saved.update(choices)
+    os.makedirs(os.path.dirname(TUNED_PARAMS_FILE), exist_ok=True)
+    with open(TUNED_PARAMS_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(TUNED_PARAMS_FILE + ".tmp", TUNED_PARAMS_FILE)
+    return TUNED_PARAMS_FILE
+
+def data_fingerprint(X):
+    """Empreinte du jeu d'apprentissage (valeurs des colonnes, hors index)."""
+    digests = pd.util.hash_pandas_object(X, index=False).to_numpy()
+    return hashlib.sha1(digests.tobytes()).hexdigest()[:12]
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+def prune_versions(pattern, keep=None):
+    """
+    Supprime les fichiers qui correspondent à `pattern` (glob) au-delà des `keep` plus
+    récemment écrits ou chargés. Renvoie les chemins supprimés.
+    """
+    keep = MAX_MODEL_VERSIONS if keep is None else keep
+    removed = sorted(glob.glob(pattern), key=_mtime, reverse=True)[keep:]
+    for path in removed:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # déjà supprimé par une autre exécution
+    return removed
+
+def _model_key(features, params):
+    return hashlib.sha1(repr((list(features), sorted(params.items()))).encode("utf-8")).hexdigest()[:10]
+
+def _model_prefix(table, variant=None):
+    return f"{table}@{variant}" if variant else table
+
+def _model_path(table, features, params, fingerprint, directory=MODEL_DIR, variant=None):
+    return os.path.join(directory, f"{_model_prefix(table, variant)}-{_model_key(features, params)}-{fingerprint}.joblib")
+
+@instrumented("apprentissage_iforest")
+def fit_detector(df, table, features, contamination=0.05, n_estimators=100, max_samples="auto", random_state=42,
+                 variant=None):
+    """
+    Apprend le scaler et l'Isolation Forest sur les lignes complètes de `features`.
+    Les arbres sont construits sur tous les cœurs (n_jobs=-1), chacun sur `max_samples`
+    lignes tirées au hasard ("auto" : 256).
+    """
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+
+    params = {"contamination": contamination, "n_estimators": n_estimators, "max_samples": max_samples}
+    X = df[features].dropna()
+    values = X.to_numpy(dtype="float64")
+    scaler = StandardScaler().fit(values)
+    model = IsolationForest(n_jobs=-1, random_state=random_state, **params).fit(scaler.transform(values))
+    return {
+        "table": table,
+        "features": list(features),
+        "params": params,
+        "fingerprint": data_fingerprint(X),
+        "variant": variant,
+        "scaler": scaler,
+        "model": model,
+        "fitted_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def save_detector(detector, directory=MODEL_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = _model_path(detector["table"], detector["features"], detector["params"], detector["fingerprint"], directory,
+                       detector.get("variant"))
+    joblib.dump(detector, path)
+    # Versions antérieures (autres données) de ce modèle : seules les plus récentes sont gardées
+    prune_versions(os.path.join(directory, f"{_model_prefix(detector['table'], detector.get('variant'))}-"
+                                           f"{_model_key(detector['features'], detector['params'])}-*.joblib"))
+    return path
+
+def load_detector(table, features, fingerprint=None, directory=MODEL_DIR, variant=None, **params):
+    """
+    Charge le détecteur de `table` (ou de sa `variant`) pour ces features et paramètres :
+    celui appris sur les données d'empreinte `fingerprint`, ou à défaut le plus récent.
+    None si aucun.
+    """
+    params = {**DEFAULT_PARAMS, **params}
+    if fingerprint is not None:
+        path = _model_path(table, features, params, fingerprint, directory, variant)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # date d'utilisation : la version n'est pas élaguée tant qu'elle sert
+        return joblib.load(path)
+    paths = glob.glob(os.path.join(directory, f"{_model_prefix(table, variant)}-{_model_key(features, params)}-*.joblib"))
+    return joblib.load(max(paths, key=os.path.getmtime)) if paths else None
+
+def latest_detector(table, features, fingerprint=None, directory=MODEL_DIR, **params):
+    """
+    Détecteur de la table entière pour exactement ces features et paramètres (ceux de
+    tuned_params par défaut) : celui des données `fingerprint` si elle est donnée, sinon
+    le plus récent. Les variantes (sous-ensembles) ne sont jamais renvoyées. None si aucun.
+    """
+    return load_detector(table, features, fingerprint, directory, **{**tuned_params(table), **params})
+
+def get_detector(df, table, features, variant=None, **params):
+    """Détecteur appris sur exactement ces données : rechargé s'il existe, sinon appris et sauvegardé."""
+    params = {**DEFAULT_PARAMS, **params}
+    detector = load_detector(table, features, data_fingerprint(df[features].dropna()), variant=variant, **params)
+    if detector is None:
+        detector = fit_detector(df, table, features, variant=variant, **params)
+        save_detector(detector)
+    return detector
+
+@instrumented("scoring_iforest")
+def score_detector(detector, df, batch_size=SCORE_BATCH_SIZE):
+    """
+    Score les lignes de `df` par lots, sans réapprentissage. Renvoie un DataFrame aligné
+    sur `df` : "score" (decision_function, négatif = anomalie) et "anomaly" (1 = normal,
+    -1 = anomalie) ; NaN pour les lignes auxquelles il manque une feature.
+    """
+    X = df[detector["features"]]
+    complete = X.notna().all(axis=1).to_numpy()
+    values = X.to_numpy(dtype="float64")[complete]
+    scores = np.empty(len(values))
+    for start in range(0, len(values), batch_size):
+        batch = detector["scaler"].transform(values[start:start + batch_size])
+        scores[start:start + batch_size] = detector["model"].decision_function(batch)
+
+    result = pd.DataFrame({"score": np.nan, "anomaly": np.nan}, index=df.index)
+    result.loc[complete, "score"] = scores
+    result.loc[complete, "anomaly"] = np.where(scores < 0, -1, 1)
+    return result
+
+def score_chunks(detector, chunks, batch_size=SCORE_BATCH_SIZE):
+    """Générateur : score chaque bloc (par exemple iter_clean_table) au fil de l'eau."""
+    for chunk in chunks:
+        yield chunk.join(score_detector(detector, chunk, batch_size))
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from detecteur import DEFAULT_PARAMS, tuned_params
+from instrumentation import instrumented
+
+###############################################################################
+# Détection d'anomalies par groupe (famille, saison, grille de tailles)
+###############################################################################
+# Un prix n'est anormal que par rapport aux produits comparables : les lignes sont
+# partitionnées par une clé de groupe et chaque groupe a son propre modèle.
+#   - groupes d'au moins MIN_GROUP_SIZE lignes : une petite Isolation Forest par groupe,
+#     les groupes étant répartis sur un pool de processus (matrice partagée en .npy
+#     mappé en mémoire, comme balayage_iforest.py) ;
+#   - petits groupes et lignes sans clé : z-score robuste (médiane / MAD), calculé pour
+#     tous ces groupes à la fois.
+# Les deux scores suivent la convention de decision_function : négatif = anomalie. Pour
+# le z-score robuste, score = MAD_THRESHOLD - max |z| sur les features.
+GROUPED_SPECS = {
+    # codebarre : clés issues de la dimension produit (dimension_produit.py)
+    "codebarre": {"features": ["Prix"], "groupes": ["sfamille_IDArFamille", "article_IDSaison", "taille_IDGrille"]},
+    "article": {"features": ["TauxTVA"], "groupes": ["IDArSousFamille", "IDSaison"]},
+}
+MIN_GROUP_SIZE = 256
+# Forêts plus petites que le modèle global : un groupe compte au plus quelques milliers de lignes
+GROUP_PARAMS = {"n_estimators": 50, "max_samples": "auto"}
+# Seuil du z-score modifié (Iglewicz et Hoaglin) : 0,6745 (x - médiane) / MAD > 3,5
+MAD_THRESHOLD = 3.5
+MAD_SCALE = 0.6745
+# Si MAD = 0 (plus de la moitié des valeurs identiques) : écart absolu moyen * MEAN_AD_SCALE
+MEAN_AD_SCALE = 1.2533
+
+_MATRICES = {}
+
+def _matrix(path):
+    # Une ouverture par processus ; les groupes suivants du même worker la réutilisent
+    if path not in _MATRICES:
+        _MATRICES[path] = np.load(path, mmap_mode="r")
+    return _MATRICES[path]
+
+def fit_group(path, positions, params, random_state=42):
+    """Isolation Forest apprise et appliquée sur les lignes `positions` de la matrice. Renvoie (scores, secondes)."""
+    from sklearn.ensemble import IsolationForest
+
+    start = time.perf_counter()
+    X = _matrix(path)[positions]
+    model = IsolationForest(n_jobs=1, random_state=random_state, **params).fit(X)
+    return model.decision_function(X), time.perf_counter() - start
+
+def robust_scores(X, codes, threshold=MAD_THRESHOLD):
+    """
+    Score robuste de chaque ligne dans son groupe (`codes`) : threshold - max |z|, avec
+    z = MAD_SCALE (x - médiane) / MAD par feature et par groupe. Calcul groupé en pandas,
+    sans boucle sur les groupes.
+    """
+    frame = pd.DataFrame(X)
+    deviations = (frame - frame.groupby(codes).transform("median")).abs()
+    mad = deviations.groupby(codes).transform("median")
+    mean_ad = deviations.groupby(codes).transform("mean")
+    z = deviations / (mad / MAD_SCALE).where(mad > 0, mean_ad * MEAN_AD_SCALE)
+    # Feature constante dans le groupe (0 / 0) : aucun écart
+    return threshold - z.fillna(0.0).max(axis=1).to_numpy()
+
+@instrumented("detection_groupee")
+def grouped_anomalies(df, features, group_key, table=None, min_group_size=MIN_GROUP_SIZE,
+                      max_workers=None, work_dir=None, **params):
+    """
+    Scores d'anomalie par groupe de `group_key` pour les lignes complètes de `features`.
+    Renvoie un DataFrame aligné sur ces lignes : groupe, methode ("iforest" ou "mad"),
+    score (négatif = anomalie) et anomaly (1 = normal, -1 = anomalie).
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    params = {**(tuned_params(table) if table else DEFAULT_PARAMS), **GROUP_PARAMS, **params}
+    # La clé de groupe peut aussi être une feature : chaque colonne n'est lue qu'une fois
+    data = df[list(dict.fromkeys(features + [group_key]))].dropna(subset=features)
+    X = StandardScaler().fit_transform(data[features].to_numpy(dtype="float64"))
+    codes, uniques = pd.factorize(data[group_key])
+    sizes = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    large = np.flatnonzero(sizes >= min_group_size)
+
+    scores = np.empty(len(data))
+    method = np.full(len(data), "mad", dtype=object)
+    # Petits groupes (et lignes sans clé, regroupées ensemble) : médiane / MAD
+    small = (codes < 0) | (sizes[np.maximum(codes, 0)] < min_group_size)
+    if small.any():
+        scores[small] = robust_scores(X[small], codes[small])
+
+    # Grands groupes : une Isolation Forest par groupe, en parallèle
+    if len(large):
+        # Lignes triées par groupe (les lignes sans clé, code -1, en tête)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        offset = int((codes < 0).sum())
+        work_dir = tempfile.mkdtemp(prefix="groupes_", dir=work_dir)
+        try:
+            path = os.path.join(work_dir, "X.npy")
+            np.save(path, X)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # Les plus grands groupes d'abord : la fin du pool n'attend pas un gros groupe isolé
+                futures = {}
+                for g in large[np.argsort(-sizes[large])]:
+                    positions = order[offset + bounds[g]:offset + bounds[g + 1]]
+                    futures[executor.submit(fit_group, path, positions, params)] = positions
+                for future, positions in futures.items():
+                    scores[positions], _ = future.result()
+                    method[positions] = "iforest"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return pd.DataFrame({
+        "groupe": data[group_key].to_numpy(),
+        "methode": method,
+        "score": scores,
+        "anomaly": np.where(scores < 0, -1, 1),
+    }, index=data.index)
+
+def load_table(engine, table):
+    """Table nettoyée portant les clés de groupe : la dimension produit pour codebarre."""
+    if table == "codebarre":
+        from dimension_produit import product_dimension
+        return product_dimension(engine)[0]
+    from cache_tables import cached_clean
+    return cached_clean(engine, table)
+
+if __name__ == '__main__':
+    from config import get_engine
+    from iso import detect_anomalies
+
+    parser = argparse.ArgumentParser(description="Détection d'anomalies par groupe (famille, saison, grille)")
+    parser.add_argument("--table", choices=list(GROUPED_SPECS), default="codebarre")
+    parser.add_argument("--groupe", help="clé de groupe (défaut : la première disponible de la table)")
+    parser.add_argument("--workers", type=int, default=None, help="processus (défaut : un par cœur)")
+    parser.add_argument("--taille-min", type=int, default=MIN_GROUP_SIZE,
+                        help="taille minimale d'un groupe pour avoir sa propre Isolation Forest")
+    parser.add_argument("--sortie", default=None, help="CSV des lignes et de leurs scores")
+    args = parser.parse_args()
+
+    spec = GROUPED_SPECS[args.table]
+    df = load_table(get_engine(), args.table)
+    # Clé par défaut : la première de la spécification présente dans la table
+    group_key = args.groupe or next((key for key in spec["groupes"] if key in df.columns), None)
+    if group_key not in df.columns:
+        parser.error(f"clé de groupe absente de {args.table} : {group_key or ', '.join(spec['groupes'])}")
+    features = [f for f in spec["features"] if f in df.columns]
+
+    start = time.perf_counter()
+    result = grouped_anomalies(df, features, group_key, table=args.table,
+                               min_group_size=args.taille_min, max_workers=args.workers)
+    elapsed = time.perf_counter() - start
+    n_groups = result["groupe"].nunique()
+    by_method = result.groupby("methode")["anomaly"].agg(lignes="size", anomalies=lambda a: int((a == -1).sum()))
+    print(f"{args.table} par {group_key} : {n_groups} groupes, {len(result)} lignes en {elapsed:.2f} s")
+    print(by_method.to_string())
+
+    # Comparaison avec le modèle global sur les mêmes features
+    data, _ = detect_anomalies(df, features, table=args.table)
+    common = result.index.intersection(data.index)
+    global_flags = data.loc[common, "anomaly"] == -1
+    group_flags = result.loc[common, "anomaly"] == -1
+    print(f"Modèle global : {int(global_flags.sum())} anomalies ; par groupe : {int(group_flags.sum())} ; "
+          f"communes : {int((global_flags & group_flags).sum())}")
+    if args.sortie:
+        df.loc[result.index, list(dict.fromkeys([group_key] + features))].join(result.drop(columns="groupe")).to_csv(args.sortie, index=False)
+        print(f"Scores écrits dans {args.sortie}")
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_engine
+from cache_tables import CACHE_DIR, _cache_files, _remove, cached_clean, evict, table_fingerprint, table_lock
+
+###############################################################################
+# Dimension produit : une ligne par code-barre, enrichie des tables liées
+###############################################################################
+# Jointures appliquées dans l'ordre : "colonne" désigne une colonne de la dimension en
+# cours de construction (déjà préfixée si elle vient d'une jointure précédente) ; les
+# colonnes de la table liée sont ajoutées avec "prefixe". Une relation dont une colonne
+# n'existe pas dans les tables nettoyées est ignorée (signalée à l'affichage).
+BASE_TABLE = "codebarre"
+RELATIONS = [
+    {"colonne": "IdTaille", "table": "tailles", "cle": "IdTaille", "prefixe": "taille_"},
+    # IdEntite : article auquel appartient le code-barre
+    {"colonne": "IdEntite", "table": "article", "cle": "IDArticle", "prefixe": "article_"},
+    {"colonne": "article_IDSaison", "table": "saison", "cle": "IDSaison", "prefixe": "saison_"},
+    {"colonne": "article_IDArSousFamille", "table": "ar_sfamille", "cle": "IDArSousFamille", "prefixe": "sfamille_"},
+    {"colonne": "sfamille_IDArFamille", "table": "arfamille", "cle": "IDArFamille", "prefixe": "famille_"},
+]
+DIMENSION_NAME = "dimension_produit"
+
+def _lookup_positions(keys, values):
+    """
+    Position de chaque valeur de `values` dans `keys` (triées, uniques) par recherche
+    dichotomique ; -1 si la valeur est absente ou manquante.
+    """
+    positions = np.searchsorted(keys, values)
+    positions[positions == len(keys)] = 0
+    found = (keys[positions] == values) if len(keys) else np.zeros(len(values), dtype=bool)
+    return np.where(found, positions, -1)
+
+def _nullable(df):
+    """Entiers numpy -> entiers nullables : une ligne sans correspondance garde le type."""
+    return df.astype({col: str(dtype).capitalize() for col, dtype in df.dtypes.items()
+                      if pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_extension_array_dtype(dtype)})
+
+def join_relation(dim, parent, relation):
+    """
+    Ajoute à `dim` les colonnes de `parent` correspondant à `relation`. Renvoie la dimension
+    enrichie, le masque des lignes orphelines (clé renseignée mais absente du parent) et le
+    nombre de clés du parent en double (seule la première occurrence est utilisée).
+    """
+    key = relation["cle"]
+    parent_keys = pd.to_numeric(parent[key], errors='coerce')
+    parent = parent[parent_keys.notna().to_numpy()]
+    parent_keys = parent_keys.dropna()
+    order = np.argsort(parent_keys.to_numpy(dtype="float64"), kind="stable")
+    parent = parent.iloc[order]
+    sorted_keys = parent_keys.to_numpy(dtype="float64")[order]
+    unique = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    n_duplicated = int((~unique).sum())
+    parent, sorted_keys = parent[unique], sorted_keys[unique]
+
+    values = pd.to_numeric(dim[relation["colonne"]], errors='coerce').to_numpy(dtype="float64", na_value=np.nan)
+    positions = _lookup_positions(sorted_keys, values)
+    orphan = (positions == -1) & ~np.isnan(values)
+
+    columns = _nullable(parent.drop(columns=[key]).reset_index(drop=True))
+    columns = columns.reindex(positions).add_prefix(relation["prefixe"])
+    columns.index = dim.index
+    return pd.concat([dim, columns], axis=1), orphan, n_duplicated
+
+def build_product_dimension(frames):
+    """
+    Construit la dimension produit à partir des tables nettoyées `frames` ({table: df}).
+    Chaque relation ajoute une colonne booléenne "orphelin_<table>" (signal d'anomalie :
+    clé étrangère renseignée sans ligne correspondante). Renvoie (dimension, intégrité),
+    intégrité donnant par relation les clés manquantes, orphelines et en double.
+    """
+    dim = frames[BASE_TABLE].reset_index(drop=True)
+    integrity = {}
+    for relation in RELATIONS:
+        name = f"{relation['colonne']} -> {relation['table']}.{relation['cle']}"
+        parent = frames.get(relation["table"])
+        if parent is None or relation["colonne"] not in dim.columns or relation["cle"] not in parent.columns:
+            integrity[name] = {"ignoree": True}
+            continue
+        dim, orphan, n_duplicated = join_relation(dim, parent, relation)
+        dim[f"orphelin_{relation['table']}"] = orphan
+        integrity[name] = {
+            "manquantes": int(dim[relation["colonne"]].isna().sum()),
+            "orphelines": int(orphan.sum()),
+            "cles_parent_dupliquees": n_duplicated,
+        }
+    return dim, integrity
+
+def _tables():
+    return [BASE_TABLE] + list(dict.fromkeys(relation["table"] for relation in RELATIONS))
+
+def product_dimension(engine, refresh=False):
+    """
+    Dimension produit persistée dans le cache (Parquet) : reconstruite seulement si l'une
+    des tables sources a changé. Renvoie (dimension, intégrité).
+    """
+    fingerprint = hashlib.sha1(repr([table_fingerprint(engine, table) for table in _tables()]
+                                    + [RELATIONS]).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{DIMENSION_NAME}-{fingerprint}.parquet")
+    integrity_path = os.path.splitext(path)[0] + "_integrite.json"
+    with table_lock(DIMENSION_NAME):
+        if os.path.exists(path) and os.path.exists(integrity_path) and not refresh:
+            try:
+                os.utime(path)  # date d'accès pour l'éviction LRU
+                with open(integrity_path, encoding="utf-8") as f:
+                    return pd.read_parquet(path, memory_map=True), json.load(f)
+            except FileNotFoundError:
+                pass  # évincée entre-temps par la mise en cache d'une autre table : reconstruite
+
+        dim, integrity = build_product_dimension({table: cached_clean(engine, table) for table in _tables()})
+        # Versions précédentes de la dimension (et leurs rapports d'intégrité) obsolètes
+        _remove(_cache_files(DIMENSION_NAME))
+        dim.to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        with open(integrity_path, "w", encoding="utf-8") as f:
+            json.dump(integrity, f, indent=2)
+        evict()
+    return dim, integrity
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Construction de la dimension produit (codebarre et tables liées)")
+    parser.add_argument("--reconstruire", action="store_true", help="ignorer la version en cache")
+    args = parser.parse_args()
+
+    dim, integrity = product_dimension(get_engine(), refresh=args.reconstruire)
+    print(f"Dimension produit : {len(dim)} lignes, {dim.shape[1]} colonnes, "
+          f"{dim.memory_usage(deep=True).sum() / 1024 ** 2:.1f} Mo")
+    for name, counts in integrity.items():
+        if counts.get("ignoree"):
+            print(f"  {name:<55} ignorée (colonne absente)")
+        else:
+            print(f"  {name:<55} {counts['manquantes']:>8} manquantes  {counts['orphelines']:>8} orphelines  "
+                  f"{counts['cles_parent_dupliquees']:>6} clés parent en double")
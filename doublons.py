@@ -0,0 +1,205 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # repli pandas pur dans normalize_text
+    pa = None
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from instrumentation import instrumented
+
+###############################################################################
+# Détection des doublons exacts et quasi-doublons (signal d'anomalie)
+###############################################################################
+# drop_duplicates() du nettoyage ne retire que les lignes identiques sur toutes les
+# colonnes. Ici, on cherche les enregistrements répétés sur une projection de clés :
+#   - doublons exacts : empreinte 64 bits des clés normalisées (casse, espaces), groupes
+#     obtenus en O(n) par factorisation des empreintes (même CodeBarre sous deux IDCodeBarre) ;
+#   - quasi-doublons : signatures MinHash des trigrammes de caractères, calculées en NumPy
+#     par blocs, puis LSH (bandes de signatures identiques) : seules les lignes d'un même
+#     seau sont comparées, jamais toutes les paires.
+# Les codes-barres sont des suites de chiffres : une faute de frappe y change trop de
+# trigrammes pour que la similarité soit utile, seule la recherche exacte leur est appliquée.
+DUPLICATE_SPECS = {
+    "codebarre": {"exacte": ["CodeBarre"], "proche": []},
+    "article": {"exacte": ["Code"], "proche": ["Code", "Designation"]},
+}
+NUM_HASHES = 32          # longueur des signatures MinHash
+BAND_ROWS = 4            # valeurs par bande LSH : 8 bandes, seuil de candidature ~0,6
+NEAR_THRESHOLD = 0.8     # similarité de Jaccard estimée minimale d'un quasi-doublon
+MAX_CHARS = 64           # texte tronqué au-delà (octets UTF-8)
+BLOCK_ROWS = 100_000
+_MERSENNE = np.uint64((1 << 31) - 1)
+
+def normalize_text(series):
+    """Texte en minuscules, espaces multiples réduits et retirés aux extrémités ; NA conservés."""
+    if pa is not None:
+        arr = pa.array(series.astype("string"), from_pandas=True, type=pa.string())
+        arr = pc.utf8_trim_whitespace(pc.replace_substring_regex(pc.utf8_lower(arr), r"\s+", " "))
+        return pd.Series(arr.to_pandas().to_numpy(), index=series.index, dtype="string")
+    return series.astype("string").str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+
+def _normalized_keys(df, columns):
+    keys = pd.DataFrame(index=df.index)
+    for col in columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            keys[col] = df[col]
+        else:
+            keys[col] = normalize_text(df[col]).replace("", pd.NA)
+    return keys
+
+def _groups(codes):
+    """(identifiant de groupe, taille) pour des codes de factorisation ; -1 et 1 hors groupe."""
+    sizes = np.bincount(codes[codes >= 0]) if (codes >= 0).any() else np.zeros(0, dtype=int)
+    size = np.where(codes >= 0, sizes[np.maximum(codes, 0)] if len(sizes) else 1, 1)
+    group = np.where(size > 1, codes, -1)
+    return group, size
+
+@instrumented("doublons_exacts")
+def exact_duplicate_groups(df, columns):
+    """
+    Groupes de lignes dont les clés `columns` normalisées sont identiques. Renvoie un
+    DataFrame aligné sur `df` : groupe_exact (-1 si la ligne est unique ou sans clé) et
+    taille_groupe_exact.
+    """
+    keys = _normalized_keys(df, columns)
+    present = keys.notna().all(axis=1).to_numpy()
+    codes = np.full(len(df), -1, dtype=np.int64)
+    if present.any():
+        digests = pd.util.hash_pandas_object(keys[present], index=False).to_numpy()
+        codes[present] = pd.factorize(digests)[0]
+    group, size = _groups(codes)
+    return pd.DataFrame({"groupe_exact": group, "taille_groupe_exact": size}, index=df.index)
+
+def _hash_params(n_hashes, seed=42):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, n_hashes, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, n_hashes, dtype=np.uint64)
+    return a, b
+
+def minhash_signatures(texts, n_hashes=NUM_HASHES, max_chars=MAX_CHARS, block_rows=BLOCK_ROWS):
+    """
+    Signatures MinHash (n, n_hashes) des trigrammes d'octets de chaque texte. Les textes
+    sont vus comme une matrice d'octets de largeur fixe (la plus longue chaîne du bloc) :
+    les trigrammes sont des décalages de colonnes, et chaque fonction de hachage
+    (multiplication-décalage, (a*x + b) >> 32 sur 64 bits) est un calcul matriciel.
+    Un texte de moins de 3 octets forme un seul trigramme.
+    """
+    a, b = _hash_params(n_hashes)
+    encoded = np.array(texts.fillna("").str.encode("utf-8").str[:max_chars].tolist(), dtype=f"S{max_chars}")
+    signatures = np.empty((len(encoded), n_hashes), dtype=np.uint32)
+    for start in range(0, len(encoded), block_rows):
+        lengths = np.char.str_len(encoded[start:start + block_rows])
+        width = max(int(lengths.max(initial=0)), 3)
+        block = encoded[start:start + block_rows].astype(f"S{width}")
+        octets = np.frombuffer(block.tobytes(), dtype=np.uint8).reshape(len(block), width).astype(np.uint64)
+        grams = (octets[:, :-2] << np.uint64(16)) | (octets[:, 1:-1] << np.uint64(8)) | octets[:, 2:]
+        invalid = np.arange(width - 2) >= np.maximum(lengths, 3)[:, None] - 2
+        for j in range(n_hashes):
+            hashed = ((a[j] * grams + b[j]) >> np.uint64(32)).astype(np.uint32)
+            hashed[invalid] = np.iinfo(np.uint32).max
+            signatures[start:start + block_rows, j] = hashed.min(axis=1)
+    return signatures
+
+@instrumented("quasi_doublons")
+def near_duplicate_groups(df, columns, threshold=NEAR_THRESHOLD, band_rows=BAND_ROWS, n_hashes=NUM_HASHES):
+    """
+    Groupes de quasi-doublons sur le texte normalisé des colonnes `columns` (concaténées).
+    Dans chaque bande LSH, les lignes d'un même seau sont comparées au premier élément du
+    seau (son représentant) et rattachées à lui si leur similarité estimée atteint
+    `threshold`. Les groupes sont des étoiles autour d'un représentant, sans fermeture
+    transitive : des libellés construits sur un même modèle (« ref 1 », « ref 2 », …) ne
+    s'enchaînent pas en un groupe géant. Renvoie groupe_proche (-1 si isolé),
+    taille_groupe_proche et similarite_proche (similarité estimée avec le représentant).
+    """
+    text = normalize_text(df[columns[0]].astype("string"))
+    for col in columns[1:]:
+        text = text.str.cat(normalize_text(df[col].astype("string")), sep=" ", na_rep="").str.strip()
+    present = np.flatnonzero(text.fillna("").to_numpy(dtype=object) != "")
+    signatures = minhash_signatures(text.iloc[present], n_hashes)
+
+    # leader[i] : représentant de la ligne i (elle-même si elle en est un), -1 si isolée
+    leader = np.full(len(present), -1, dtype=np.int64)
+    similarity = np.full(len(present), np.nan)
+    rng = np.random.default_rng(7)
+    for start in range(0, n_hashes - band_rows + 1, band_rows):
+        # Clé de bande : combinaison linéaire (modulo 2^64) des valeurs de la bande
+        multipliers = rng.integers(1, 1 << 62, band_rows, dtype=np.uint64) | np.uint64(1)
+        bucket_keys = (signatures[:, start:start + band_rows].astype(np.uint64) * multipliers).sum(axis=1)
+        buckets = pd.factorize(bucket_keys)[0]
+        in_bucket = np.flatnonzero(np.bincount(buckets)[buckets] > 1)
+        if not len(in_bucket):
+            continue
+        first = np.full(buckets.max() + 1, -1, dtype=np.int64)
+        first[buckets[in_bucket[::-1]]] = in_bucket[::-1]
+        rows, reps = in_bucket, first[buckets[in_bucket]]
+        # Seules les lignes encore libres se rattachent, et seulement à un représentant
+        # libre ou déjà représentant (pas à une ligne rattachée à un autre)
+        free = (rows != reps) & (leader[rows] == -1) & ((leader[reps] == -1) | (leader[reps] == reps))
+        rows, reps = rows[free], reps[free]
+        scores = (signatures[rows] == signatures[reps]).mean(axis=1)
+        similar = scores >= threshold
+        rows, reps, scores = rows[similar], reps[similar], scores[similar]
+        leader[rows] = reps
+        leader[reps] = reps
+        similarity[rows] = scores
+        similarity[reps] = 1.0
+
+    group = np.full(len(df), -1, dtype=np.int64)
+    size = np.ones(len(df), dtype=np.int64)
+    grouped = leader >= 0
+    if grouped.any():
+        codes = np.full(len(present), -1, dtype=np.int64)
+        codes[grouped] = pd.factorize(leader[grouped])[0]
+        group[present], size[present] = _groups(codes)
+    full_similarity = np.full(len(df), np.nan)
+    full_similarity[present] = similarity
+    return pd.DataFrame({"groupe_proche": group, "taille_groupe_proche": size,
+                         "similarite_proche": full_similarity}, index=df.index)
+
+def duplicate_clusters(df, table=None, exact_columns=None, near_columns=None, threshold=NEAR_THRESHOLD):
+    """
+    Doublons exacts et quasi-doublons de `df` (colonnes de DUPLICATE_SPECS[table] par
+    défaut ; les colonnes absentes sont ignorées). Renvoie un DataFrame aligné sur `df`
+    avec les groupes et la colonne booléenne "doublon", utilisable comme signal
+    d'anomalie à côté des scores des modèles.
+    """
+    spec = DUPLICATE_SPECS.get(table, {})
+    exact_columns = [c for c in (exact_columns or spec.get("exacte", [])) if c in df.columns]
+    near_columns = [c for c in (near_columns or spec.get("proche", [])) if c in df.columns]
+    parts = []
+    if exact_columns:
+        parts.append(exact_duplicate_groups(df, exact_columns))
+    if near_columns:
+        parts.append(near_duplicate_groups(df, near_columns, threshold))
+    result = pd.concat(parts, axis=1) if parts else pd.DataFrame(index=df.index)
+    flags = [result[col] >= 0 for col in ("groupe_exact", "groupe_proche") if col in result]
+    result["doublon"] = np.logical_or.reduce(flags) if flags else False
+    return result
+
+if __name__ == '__main__':
+    from config import get_engine
+    from cache_tables import cached_clean
+
+    parser = argparse.ArgumentParser(description="Doublons exacts et quasi-doublons par table")
+    parser.add_argument("--tables", nargs="+", choices=list(DUPLICATE_SPECS), default=list(DUPLICATE_SPECS))
+    parser.add_argument("--seuil", type=float, default=NEAR_THRESHOLD, help="similarité minimale des quasi-doublons")
+    args = parser.parse_args()
+
+    for table in args.tables:
+        df = cached_clean(get_engine(), table)
+        spec = DUPLICATE_SPECS[table]
+        clusters = duplicate_clusters(df, table, threshold=args.seuil)
+        print(f"{table:<12} {len(df):>10} lignes  "
+              f"{int((clusters.get('groupe_exact', pd.Series(-1)) >= 0).sum()):>8} en doublon exact  "
+              f"{int((clusters.get('groupe_proche', pd.Series(-1)) >= 0).sum()):>8} en quasi-doublon")
+        columns = list(dict.fromkeys(c for c in spec["exacte"] + spec["proche"] if c in df.columns))
+        flagged = df.loc[clusters["doublon"], columns].join(clusters[clusters["doublon"]])
+        sort_keys = [c for c in ("groupe_exact", "groupe_proche") if c in flagged]
+        flagged.sort_values(sort_keys).to_csv(f"doublons_{table}.csv", index=False)
+        print(f"  groupes écrits dans doublons_{table}.csv")
@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from anomalies_streaming import QuantileSketch
+from detection_groupes import MAD_SCALE, MAD_THRESHOLD, MEAN_AD_SCALE
+from instrumentation import instrumented
+
+###############################################################################
+# Filtre statistique rapide (z-score robuste, bornes IQR, règles de cohérence)
+###############################################################################
+# Première passe avant les modèles lourds : les valeurs extrêmes évidentes (un Prix ou un
+# Solde aberrant) sont repérées par des statistiques robustes calculées en une passe
+# vectorisée sur toutes les colonnes de mesure :
+#   - z-score modifié : MAD_SCALE (x - médiane) / MAD (écart absolu moyen si MAD = 0) ;
+#   - bornes de Tukey : [Q1 - IQR_FACTOR IQR, Q3 + IQR_FACTOR IQR] ;
+#   - règles de cohérence entre colonnes (Solde = Chiffre - Reglements pour fournisseur).
+# Une valeur n'est « extrême » que si les deux critères robustes sont d'accord : hors des
+# bornes ET |z| > MAD_THRESHOLD. Les lignes signalées sont classées anomalies sans passer
+# par l'Isolation Forest ou l'autoencodeur, qui ne voient que le reste.
+# Les statistiques sont un dict sérialisable (comme les détecteurs de detecteur.py). En
+# streaming, elles viennent de QuantileSketch fusionnables : passe 1 sur les valeurs
+# (médiane, quartiles), passe 2 sur les écarts à la médiane (MAD), à 1 % près.
+MEASURE_COLUMNS = {
+    "article": ["TauxTVA"],
+    "codebarre": ["Prix"],
+    "fournisseur": ["Chiffre", "Reglements", "Solde"],
+    "grille": ["LargeurVariante"],
+    "tailles": ["Ordre"],
+}
+# Règle : colonne cible = somme des colonnes "plus" - somme des colonnes "moins"
+CONSISTENCY_RULES = {
+    "fournisseur": {"solde": {"cible": "Solde", "plus": ["Chiffre"], "moins": ["Reglements"]}},
+}
+IQR_FACTOR = 3.0               # bornes « très éloignées » de Tukey
+CONSISTENCY_TOLERANCE = 0.01   # écart relatif toléré (par rapport au plus grand terme)
+CONSISTENCY_MIN_GAP = 1.0      # écart absolu toujours toléré (arrondis)
+# Une règle violée par plus de cette part des lignes ne décrit pas les données
+# (convention comptable différente) : elle reste calculée mais ne signale plus d'anomalie
+MAX_RULE_VIOLATION = 0.05
+# Colonnes retenues par défaut (table sans entrée dans MEASURE_COLUMNS) : au moins ce nombre
+# de valeurs distinctes. Sur un indicateur 0/1 ou un code (Etat), IQR et MAD sont nuls ou
+# presque : toute valeur minoritaire paraîtrait extrême.
+MIN_DISTINCT_VALUES = 10
+
+def measure_columns(df, table=None):
+    """
+    Colonnes de mesure de `table` présentes dans `df` ; à défaut, les colonnes numériques
+    continues : ni identifiants, ni booléens / Int8 (indicateurs compactés), ni colonnes de
+    moins de MIN_DISTINCT_VALUES valeurs distinctes.
+    """
+    if table in MEASURE_COLUMNS:
+        return [c for c in MEASURE_COLUMNS[table] if c in df.columns]
+    numeric = df.select_dtypes(include="number", exclude=["bool", "boolean", "Int8", "int8"]).columns
+    return [c for c in numeric if not c.lower().startswith(("id", "is")) and df[c].nunique() >= MIN_DISTINCT_VALUES]
+
+def _values(df, columns):
+    return df[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+
+def rule_residuals(df, table):
+    """
+    Écarts des règles de cohérence de `table` : DataFrame (une colonne par règle, aligné
+    sur `df`) des écarts relatifs cible - (plus - moins), rapportés au plus grand terme
+    (au moins CONSISTENCY_MIN_GAP / CONSISTENCY_TOLERANCE) ; NaN si un terme manque.
+    """
+    residuals = pd.DataFrame(index=df.index)
+    for name, rule in CONSISTENCY_RULES.get(table, {}).items():
+        terms = [rule["cible"]] + rule["plus"] + rule["moins"]
+        if not set(terms) <= set(df.columns):
+            continue
+        values = _values(df, terms)
+        n_plus = len(rule["plus"])
+        expected = values[:, 1:1 + n_plus].sum(axis=1) - values[:, 1 + n_plus:].sum(axis=1)
+        scale = np.maximum(np.abs(values).max(axis=1), CONSISTENCY_MIN_GAP / CONSISTENCY_TOLERANCE)
+        residuals[name] = (values[:, 0] - expected) / scale
+    return residuals
+
+def _rule_counts(residuals):
+    checked = residuals.notna().sum()
+    violated = (residuals.abs() > CONSISTENCY_TOLERANCE).sum()
+    return {name: {"verifiees": int(checked[name]), "violees": int(violated[name])} for name in residuals}
+
+def has_checks(baseline):
+    """Vrai si le filtre peut signaler quelque chose : au moins une colonne de mesure ou une règle active."""
+    return len(baseline["colonnes"]) > 0 or any(counts["active"] for counts in baseline["regles"].values())
+
+def _finalize(table, stats, rules):
+    """Dict des statistiques : échelle robuste et bornes IQR par colonne, règles actives."""
+    stats = stats.copy()
+    stats["echelle"] = (stats["mad"] / MAD_SCALE).where(stats["mad"] > 0, stats["ecart_moyen"] * MEAN_AD_SCALE)
+    iqr = stats["q3"] - stats["q1"]
+    stats["borne_basse"] = stats["q1"] - IQR_FACTOR * iqr
+    stats["borne_haute"] = stats["q3"] + IQR_FACTOR * iqr
+    for counts in rules.values():
+        counts["active"] = counts["violees"] <= MAX_RULE_VIOLATION * max(counts["verifiees"], 1)
+    return {"table": table, "colonnes": stats, "regles": rules, "fitted_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+@instrumented("filtre_statistique_apprentissage")
+def fit_baseline(df, table=None, columns=None):
+    """Statistiques exactes (médiane, quartiles, MAD, écart absolu moyen) des colonnes de mesure de `df`."""
+    columns = columns or measure_columns(df, table)
+    values = df[columns].apply(pd.to_numeric, errors="coerce")
+    median = values.median()
+    deviations = (values - median).abs()
+    stats = pd.DataFrame({
+        "mediane": median,
+        "q1": values.quantile(0.25),
+        "q3": values.quantile(0.75),
+        "mad": deviations.median(),
+        "ecart_moyen": deviations.mean(),
+    }, index=columns)
+    return _finalize(table, stats, _rule_counts(rule_residuals(df, table)))
+
+class StreamingBaseline:
+    """
+    Statistiques robustes fusionnables, alimentées bloc par bloc. Passe 1 (`update`) :
+    sketch des valeurs de chaque colonne. `freeze` fige les médianes. Passe 2
+    (`update_deviations`) : sketch des écarts à la médiane, somme des écarts et comptage
+    des règles. Deux objets d'une même passe (blocs traités en parallèle) se fusionnent
+    avec `merge`.
+    """
+    def __init__(self, columns, table=None, relative_accuracy=0.01):
+        self.columns = list(columns)
+        self.table = table
+        self.values = {c: QuantileSketch(relative_accuracy) for c in self.columns}
+        self.deviations = {c: QuantileSketch(relative_accuracy) for c in self.columns}
+        self.deviation_sums = dict.fromkeys(self.columns, 0.0)
+        self.rules = {}
+        self.median = None
+
+    def update(self, chunk):
+        values = _values(chunk, self.columns)
+        for j, col in enumerate(self.columns):
+            self.values[col].add(values[:, j])
+
+    def freeze(self):
+        self.median = np.array([self.values[c].quantile(0.5) for c in self.columns])
+
+    def update_deviations(self, chunk):
+        deviations = np.abs(_values(chunk, self.columns) - self.median)
+        for j, col in enumerate(self.columns):
+            self.deviations[col].add(deviations[:, j])
+            self.deviation_sums[col] += float(np.nansum(deviations[:, j]))
+        for name, counts in _rule_counts(rule_residuals(chunk, self.table)).items():
+            total = self.rules.setdefault(name, {"verifiees": 0, "violees": 0})
+            total["verifiees"] += counts["verifiees"]
+            total["violees"] += counts["violees"]
+
+    def merge(self, other):
+        for col in self.columns:
+            self.values[col].merge(other.values[col])
+            self.deviations[col].merge(other.deviations[col])
+            self.deviation_sums[col] += other.deviation_sums[col]
+        for name, counts in other.rules.items():
+            total = self.rules.setdefault(name, {"verifiees": 0, "violees": 0})
+            total["verifiees"] += counts["verifiees"]
+            total["violees"] += counts["violees"]
+
+    def result(self):
+        stats = pd.DataFrame({
+            "mediane": self.median,
+            "q1": [self.values[c].quantile(0.25) for c in self.columns],
+            "q3": [self.values[c].quantile(0.75) for c in self.columns],
+            "mad": [self.deviations[c].quantile(0.5) for c in self.columns],
+            "ecart_moyen": [self.deviation_sums[c] / max(self.deviations[c].count, 1) for c in self.columns],
+        }, index=self.columns)
+        return _finalize(self.table, stats, {name: dict(counts) for name, counts in self.rules.items()})
+
+@instrumented("filtre_statistique_apprentissage")
+def fit_baseline_streaming(engine, table, chunksize=100_000, columns=None):
+    """
+    Statistiques de `table` en deux passes de lecture par blocs (mémoire bornée par le bloc,
+    plus les empreintes de lignes du dédoublonnage de iter_clean_table).
+    """
+    from clean import iter_clean_table
+
+    baseline = None
+    for chunk in iter_clean_table(engine, table, chunksize):
+        if baseline is None:
+            baseline = StreamingBaseline(columns or measure_columns(chunk, table), table)
+        baseline.update(chunk)
+    if baseline is None:
+        raise ValueError(f"table {table} vide")
+    baseline.freeze()
+    for chunk in iter_clean_table(engine, table, chunksize):
+        baseline.update_deviations(chunk)
+    return baseline.result()
+
+@instrumented("filtre_statistique")
+def baseline_scores(df, baseline, threshold=MAD_THRESHOLD):
+    """
+    Scores du filtre pour chaque ligne de `df` (DataFrame aligné) : z_max (plus grand |z|
+    robuste), colonne_z_max, hors_iqr (nombre de colonnes hors bornes), un écart relatif
+    par règle de cohérence (ecart_<règle>), incoherence, score_stat (threshold - z_max,
+    négatif = extrême, comme decision_function) et anomalie_stat (valeur extrême ou règle
+    active violée).
+    """
+    stats = baseline["colonnes"]
+    stats = stats.loc[[c for c in stats.index if c in df.columns]]
+    X = _values(df, list(stats.index))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs(X - stats["mediane"].to_numpy()) / stats["echelle"].to_numpy()
+    # Colonne constante (échelle nulle) ou valeur manquante : aucun écart
+    z = np.where(np.isfinite(z), z, 0.0)
+    outside = (X < stats["borne_basse"].to_numpy()) | (X > stats["borne_haute"].to_numpy())
+    extreme = (outside & (z > threshold)).any(axis=1)
+
+    has_columns = z.shape[1] > 0
+    z_max = z.max(axis=1) if has_columns else np.zeros(len(df))
+    result = pd.DataFrame({
+        "z_max": z_max,
+        "colonne_z_max": stats.index.to_numpy(dtype=object)[z.argmax(axis=1)] if has_columns else None,
+        "hors_iqr": outside.sum(axis=1),
+    }, index=df.index)
+    residuals = rule_residuals(df, baseline["table"])
+    incoherent = np.zeros(len(df), dtype=bool)
+    for name in residuals:
+        result[f"ecart_{name}"] = residuals[name]
+        if baseline["regles"].get(name, {}).get("active", False):
+            incoherent |= (residuals[name].abs() > CONSISTENCY_TOLERANCE).to_numpy()
+    result["incoherence"] = incoherent
+    result["score_stat"] = threshold - z_max
+    result["anomalie_stat"] = extreme | incoherent
+    return result
+
+def describe_baseline(baseline):
+    """Affichage des statistiques et des règles d'un filtre."""
+    lines = [baseline["colonnes"].round(4).to_string()]
+    for name, counts in baseline["regles"].items():
+        state = "active" if counts["active"] else f"inactive (> {MAX_RULE_VIOLATION:.0%} de violations)"
+        lines.append(f"Règle {name} : {counts['violees']} violations sur {counts['verifiees']} lignes, {state}")
+    return "\n".join(lines)
+
+if __name__ == '__main__':
+    from config import get_engine
+    from cache_tables import cached_clean
+    from iso import TABLE_FEATURES, detect_anomalies
+
+    parser = argparse.ArgumentParser(description="Filtre statistique rapide avant les modèles d'anomalies")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLE_FEATURES), default=[t for t in MEASURE_COLUMNS if t in TABLE_FEATURES])
+    parser.add_argument("--streaming", action="store_true", help="statistiques calculées par blocs (deux passes)")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--comparer", action="store_true", help="comparer avec l'Isolation Forest seule")
+    args = parser.parse_args()
+
+    for table in args.tables:
+        df = cached_clean(get_engine(), table)
+        start = time.perf_counter()
+        if args.streaming:
+            baseline = fit_baseline_streaming(get_engine(), table, args.chunksize)
+        else:
+            baseline = fit_baseline(df, table)
+        scores = baseline_scores(df, baseline)
+        elapsed = time.perf_counter() - start
+        print(f"{table} : {int(scores['anomalie_stat'].sum())} anomalies évidentes sur {len(df)} lignes "
+              f"({int(scores['incoherence'].sum())} incohérences) en {elapsed:.3f} s")
+        print(describe_baseline(baseline))
+        if args.comparer:
+            features = [f for f in TABLE_FEATURES[table] if f in df.columns]
+            start = time.perf_counter()
+            full, _ = detect_anomalies(df, features, table=table)
+            full_time = time.perf_counter() - start
+            start = time.perf_counter()
+            filtered, _ = detect_anomalies(df, features, table=table, prefilter=True)
+            filtered_time = time.perf_counter() - start
+            print(f"  Isolation Forest seule : {int((full['anomaly'] == -1).sum())} anomalies en {full_time:.2f} s ; "
+                  f"avec filtre : {int((filtered['anomaly'] == -1).sum())} anomalies en {filtered_time:.2f} s")
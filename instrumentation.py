@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import argparse
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows : pas de getrusage
+    resource = None
+
+###############################################################################
+# Instrumentation des étapes du pipeline (temps, CPU, mémoire, lignes)
+###############################################################################
+# Chaque étape (context manager `stage` ou décorateur `instrumented`) ajoute une ligne
+# JSON à STAGE_LOG : durée murale, temps CPU du processus, mémoire, lignes en entrée et
+# en sortie, étape parente. On distingue ainsi une lecture MySQL lente d'une
+# transformation pandas lente, y compris en production.
+#   PFE_INSTRUMENT=1        active l'instrumentation (désactivée par défaut, coût nul hors appel de fonction)
+#   PFE_LOG_DIR             répertoire des journaux (défaut : journaux/ à côté de ce module)
+#   PFE_STAGE_LOG           fichier JSON lines (défaut : PFE_LOG_DIR/etapes_pipeline.jsonl)
+#   PFE_STAGE_LOG_MAX_BYTES taille au-delà de laquelle le journal est renommé en .1 (défaut : 50 Mo)
+#   PFE_TRACE_MEMORY=1      pic de mémoire Python/NumPy de chaque étape (tracemalloc, plus lent)
+#   PFE_PROFILE_DIR         écrit un profil cProfile (.prof) par étape dans ce répertoire
+#   PFE_PROFILE_STAGES      étapes à profiler, séparées par des virgules (défaut : toutes)
+# Le temps CPU est celui du processus : il inclut les threads des bibliothèques (BLAS,
+# n_jobs de scikit-learn) mais aussi les autres étapes exécutées en parallèle.
+# tracemalloc est global au processus : le pic d'une étape qui chevauche une étape d'un
+# autre thread (pipeline en threads, service) n'est pas mesurable. Il est alors noté None
+# avec pic_memoire_partage=True ; les étapes exécutées chacune dans leur processus
+# (pipeline --processus) sont mesurées séparément.
+ENABLED = os.environ.get("PFE_INSTRUMENT") == "1"
+LOG_DIR = os.environ.get("PFE_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "journaux"))
+STAGE_LOG = os.environ.get("PFE_STAGE_LOG", os.path.join(LOG_DIR, "etapes_pipeline.jsonl"))
+MAX_LOG_BYTES = int(os.environ.get("PFE_STAGE_LOG_MAX_BYTES", 50 * 1024 ** 2))
+TRACE_MEMORY = os.environ.get("PFE_TRACE_MEMORY") == "1"
+PROFILE_DIR = os.environ.get("PFE_PROFILE_DIR")
+PROFILE_STAGES = {name for name in os.environ.get("PFE_PROFILE_STAGES", "").split(",") if name}
+
+_write_lock = threading.Lock()
+_local = threading.local()
+# Piles d'étapes en cours de tous les threads, pour repérer les pics tracemalloc partagés
+_stacks_lock = threading.Lock()
+_stacks = {}
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def _push(stack, frame):
+    with _stacks_lock:
+        stack.append(frame)
+        _stacks[threading.get_ident()] = stack
+        # Plusieurs threads ont une étape en cours : aucun de leurs pics n'est isolable
+        if TRACE_MEMORY and len(_stacks) > 1:
+            for active in _stacks.values():
+                for other in active:
+                    other["partage"] = True
+
+def _pop(stack):
+    with _stacks_lock:
+        stack.pop()
+        if not stack:
+            _stacks.pop(threading.get_ident(), None)
+
+def rows(obj):
+    """Nombre de lignes d'un DataFrame, d'une Series ou d'un tableau (premier élément d'un tuple) ; None sinon."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    shape = getattr(obj, "shape", None)
+    return int(shape[0]) if shape else None
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss est en Ko sous Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def _rotate(size):
+    """Renomme STAGE_LOG en .1 (en écrasant l'ancien) s'il dépasserait MAX_LOG_BYTES."""
+    try:
+        if os.path.getsize(STAGE_LOG) + size > MAX_LOG_BYTES:
+            os.replace(STAGE_LOG, STAGE_LOG + ".1")
+    except FileNotFoundError:
+        # Journal absent, ou déjà renommé par un autre processus
+        pass
+
+def _write(record):
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        os.makedirs(os.path.dirname(os.path.abspath(STAGE_LOG)), exist_ok=True)
+        _rotate(len(line))
+        with open(STAGE_LOG, "a", encoding="utf-8") as f:
+            f.write(line)
+
+def _profiled(name):
+    return PROFILE_DIR is not None and (not PROFILE_STAGES or name in PROFILE_STAGES)
+
+@contextmanager
+def stage(name, rows_in=None, **info):
+    """
+    Mesure le bloc et écrit sa ligne dans STAGE_LOG. Le dict renvoyé peut être complété
+    dans le bloc (record["lignes_sortie"] = len(df), ou toute autre information).
+    """
+    record = {"etape": name, **info, "lignes_entree": rows_in, "lignes_sortie": None}
+    if not ENABLED:
+        yield record
+        return
+
+    stack = _stack()
+    record["parent"] = stack[-1]["etape"] if stack else None
+    frame = {"etape": name, "pic": 0, "partage": False}
+    if TRACE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Le pic de l'étape parente jusqu'ici est mis de côté avant de remettre le pic à zéro
+        if stack:
+            stack[-1]["pic"] = max(stack[-1]["pic"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+    _push(stack, frame)
+    # Un seul profileur actif par thread : les étapes imbriquées d'une étape profilée ne le sont pas
+    profiler = None
+    if _profiled(name) and not getattr(_local, "profiling", False):
+        profiler = cProfile.Profile()
+        _local.profiling = True
+        profiler.enable()
+
+    record["debut"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    except BaseException as exc:
+        record["erreur"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        record["mur_s"] = round(time.perf_counter() - wall, 6)
+        record["cpu_s"] = round(time.process_time() - cpu, 6)
+        if profiler is not None:
+            profiler.disable()
+            _local.profiling = False
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}-{time.time_ns()}.prof")
+            profiler.dump_stats(path)
+            record["profil"] = path
+        if TRACE_MEMORY:
+            # Pic de l'étape : le plus grand des pics mesurés entre ses étapes imbriquées
+            peak = max(frame["pic"], tracemalloc.get_traced_memory()[1])
+            record["pic_memoire_mo"] = None if frame["partage"] else round((peak - memory_start) / 2 ** 20, 1)
+            if frame["partage"]:
+                record["pic_memoire_partage"] = True
+            if len(stack) > 1:
+                stack[-2]["pic"] = max(stack[-2]["pic"], peak)
+        record["rss_max_mo"] = _max_rss_mb()
+        record["pid"] = os.getpid()
+        record["thread"] = threading.current_thread().name
+        _pop(stack)
+        _write(record)
+
+def instrumented(name=None, **info):
+    """
+    Décorateur : chaque appel est une étape `name` (nom qualifié de la fonction par
+    défaut). Les lignes en entrée sont celles du premier argument qui en a, les lignes en
+    sortie celles du résultat.
+    """
+    def decorate(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            rows_in = next((n for n in map(rows, (*args, *kwargs.values())) if n is not None), None)
+            with stage(stage_name, rows_in, **info) as record:
+                result = func(*args, **kwargs)
+                record["lignes_sortie"] = rows(result)
+            return result
+        return wrapper
+    return decorate
+
+def read_log(path=STAGE_LOG):
+    """DataFrame des étapes enregistrées dans `path`."""
+    import pandas as pd
+    return pd.read_json(path, lines=True)
+
+def summarize(log):
+    """Temps cumulés par étape (et par table si l'information est présente), du plus lent au plus rapide."""
+    keys = ["etape"] + (["table"] if "table" in log.columns else [])
+    summary = log.groupby(keys, dropna=False).agg(
+        appels=("etape", "size"), mur_s=("mur_s", "sum"), cpu_s=("cpu_s", "sum"),
+        lignes_entree=("lignes_entree", "sum"), lignes_sortie=("lignes_sortie", "sum"),
+        rss_max_mo=("rss_max_mo", "max"),
+    )
+    return summary.sort_values("mur_s", ascending=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Résumé des étapes instrumentées du pipeline")
+    parser.add_argument("--journal", default=STAGE_LOG)
+    parser.add_argument("--vider", action="store_true", help="supprimer le journal après le résumé")
+    args = parser.parse_args()
+
+    import pandas as pd
+    with pd.option_context("display.width", 200, "display.max_rows", 200, "display.max_columns", None):
+        print(summarize(read_log(args.journal)))
+    if args.vider:
+        os.remove(args.journal)
@@ -1,31 +1,76 @@
-import pandas as pd
-from sklearn.ensemble import IsolationForest
-import matplotlib.pyplot as plt
+# Engine créé à la première utilisation ; les tables nettoyées passent par le cache local
+from config import get_engine
+from cache_tables import cached_clean
+from detecteur import get_detector, score_detector, tuned_params
+from instrumentation import instrumented
 
-# Importer les fonctions de nettoyage et l'objet engine depuis clean.py
-from clean import (
-    clean_ar_sfamille,
-    clean_arfamille,
-    clean_article,
-    clean_codebarre,
-    clean_fournisseur,
-    clean_saison,
-    clean_tailles,
-    engine
-)
+# Features utilisées par table (voir aussi balayage_iforest.py)
+TABLE_FEATURES = {
+    "ar_sfamille": ["IDArSousFamille", "Etat", "IDArFamille"],
+    "arfamille": ["IDArFamille", "Etat", "SaisonObligatoire"],
+    "article": ["IDArticle", "Etat", "TauxTVA", "NumInterne", "IDSaison"],
+    "codebarre": ["IDCodeBarre", "IdEntite", "IdTaille", "IDAr_Couleur", "Prix", "isSynchronized", "isSynchronizedWeb"],
+    "fournisseur": ["IDFournisseur", "Chiffre", "Reglements", "Solde", "Etat", "FournitPF"],
+    "saison": ["IDSaison", "Etat", "IDTypeSaison"],
+    "tailles": ["IdTaille", "IDGrille", "Ordre", "isMilieu"],
+}
 
 # Fonction générique de détection d'anomalies via Isolation Forest
-def detect_anomalies(df, features, contamination=0.05):
+@instrumented()
+def detect_anomalies(df, features, contamination=None, table=None, group_key=None, prefilter=False):
+    # Paramètres retenus par le balayage pour cette table (à défaut contamination=0.05)
+    params = tuned_params(table)
+    if contamination is not None:
+        params["contamination"] = contamination
+    contamination = params["contamination"]
+    if group_key is not None:
+        # Un modèle par groupe de `group_key` (voir detection_groupes.py)
+        from detection_groupes import grouped_anomalies
+        scores = grouped_anomalies(df, features, group_key, table=table, contamination=contamination)
+        data = df.loc[scores.index, features].copy()
+        data["anomaly"] = scores["anomaly"]
+        return data, data[data["anomaly"] == -1]
     # Sélectionner les colonnes d'intérêt et supprimer les lignes avec des valeurs manquantes
     data = df[features].dropna().copy()
-    # Instanciation d'Isolation Forest
-    iso = IsolationForest(contamination=contamination, random_state=42)
-    # Appliquer le modèle et ajouter la colonne "anomaly" (1 = normal, -1 = anomalie)
-    data["anomaly"] = iso.fit_predict(data)
+    if prefilter:
+        # Filtre statistique (voir filtre_statistique.py) : les valeurs extrêmes évidentes
+        # sont des anomalies d'office, le modèle n'est appris et appliqué que sur le reste,
+        # avec la part de `contamination` qu'elles n'ont pas déjà prise. Sans colonne de
+        # mesure ni règle pour la table, le filtre est ignoré.
+        from filtre_statistique import baseline_scores, fit_baseline, has_checks
+        baseline = fit_baseline(df, table)
+        if not has_checks(baseline):
+            return detect_anomalies(df, features, contamination, table)
+        obvious = baseline_scores(df.loc[data.index], baseline)["anomalie_stat"].to_numpy()
+        data["anomaly"] = -1
+        n_rest = int((~obvious).sum())
+        remaining = (contamination * len(data) - obvious.sum()) / max(n_rest, 1)
+        data.loc[~obvious, "anomaly"] = 1
+        if n_rest and remaining > 0:
+            # Modèle du sous-ensemble filtré : sauvegardé comme variante "filtre", pas comme modèle de la table
+            rest = data.loc[~obvious, features]
+            params["contamination"] = min(remaining, 0.5)
+            data.loc[rest.index, "anomaly"] = _fit_predict(rest, table, features, params, variant="filtre")
+        return data, data[data["anomaly"] == -1]
+    data["anomaly"] = _fit_predict(data, table, features, params)
     return data, data[data["anomaly"] == -1]
 
+def _fit_predict(data, table, features, params, variant=None):
+    """Labels (1 = normal, -1 = anomalie) d'une Isolation Forest sur les lignes complètes `data`."""
+    if table is None:
+        from sklearn.ensemble import IsolationForest
+        # Instanciation d'Isolation Forest
+        iso = IsolationForest(contamination=params["contamination"], n_jobs=-1, random_state=42)
+        # Appliquer le modèle (1 = normal, -1 = anomalie)
+        return iso.fit_predict(data[features])
+    # Modèle sauvegardé par table : réutilisé tant que les données n'ont pas changé
+    detector = get_detector(data, table, features, variant=variant, **params)
+    return score_detector(detector, data)["anomaly"].astype(int).to_numpy()
+
 # Fonction générique pour visualiser les anomalies
+@instrumented("visualisation")
 def plot_anomalies(data, x_feature, y_feature, title):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(8, 6))
     plt.scatter(data[x_feature], data[y_feature], c=data["anomaly"], cmap="coolwarm", alpha=0.6)
     plt.xlabel(x_feature)
@@ -36,9 +81,9 @@ def plot_anomalies(data, x_feature, y_feature, title):
 
 # Détection d'anomalies pour la table ar_sfamille
 def anomaly_ar_sfamille():
-    df = clean_ar_sfamille(engine)
-    features = ["IDArSousFamille", "Etat", "IDArFamille"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "ar_sfamille")
+    features = TABLE_FEATURES["ar_sfamille"]
+    data, anomalies = detect_anomalies(df, features, table="ar_sfamille")
     print("Table ar_sfamille - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : par défaut, tracer IDArSousFamille vs Etat
     plot_anomalies(data, "IDArSousFamille", "Etat", "Anomalies dans ar_sfamille")
@@ -46,9 +91,9 @@ def anomaly_ar_sfamille():
 
 # Détection d'anomalies pour la table arfamille
 def anomaly_arfamille():
-    df = clean_arfamille(engine)
-    features = ["IDArFamille", "Etat", "SaisonObligatoire"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "arfamille")
+    features = TABLE_FEATURES["arfamille"]
+    data, anomalies = detect_anomalies(df, features, table="arfamille")
     print("Table arfamille - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : tracer IDArFamille vs Etat
     plot_anomalies(data, "IDArFamille", "Etat", "Anomalies dans arfamille")
@@ -56,9 +101,9 @@ def anomaly_arfamille():
 
 # Détection d'anomalies pour la table article
 def anomaly_article():
-    df = clean_article(engine)
-    features = ["IDArticle", "Etat", "TauxTVA", "NumInterne", "IDSaison"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "article")
+    features = TABLE_FEATURES["article"]
+    data, anomalies = detect_anomalies(df, features, table="article")
     print("Table article - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : tracer TauxTVA vs Etat
     plot_anomalies(data, "TauxTVA", "Etat", "Anomalies dans article")
@@ -66,9 +111,9 @@ def anomaly_article():
 
 # Détection d'anomalies pour la table codebarre
 def anomaly_codebarre():
-    df = clean_codebarre(engine)
-    features = ["IDCodeBarre", "IdEntite", "IdTaille", "IDAr_Couleur", "Prix", "NumInterne", "isSynchronized", "isSynchronizedWeb"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "codebarre")
+    features = TABLE_FEATURES["codebarre"]
+    data, anomalies = detect_anomalies(df, features, table="codebarre")
     print("Table codebarre - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : tracer Prix vs IDCodeBarre (à adapter ultérieurement)
     plot_anomalies(data, "Prix", "IDCodeBarre", "Anomalies dans codebarre")
@@ -76,9 +121,9 @@ def anomaly_codebarre():
 
 # Détection d'anomalies pour la table fournisseur
 def anomaly_fournisseur():
-    df = clean_fournisseur(engine)
-    features = ["IDFournisseur", "Chiffre", "Reglements", "Solde", "Etat", "FournitPF"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "fournisseur")
+    features = TABLE_FEATURES["fournisseur"]
+    data, anomalies = detect_anomalies(df, features, table="fournisseur")
     print("Table fournisseur - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : tracer Chiffre vs Solde
     plot_anomalies(data, "Chiffre", "Solde", "Anomalies dans fournisseur")
@@ -86,9 +131,9 @@ def anomaly_fournisseur():
 
 # Détection d'anomalies pour la table saison
 def anomaly_saison():
-    df = clean_saison(engine)
-    features = ["IDSaison", "Etat", "IDTypeSaison"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "saison")
+    features = TABLE_FEATURES["saison"]
+    data, anomalies = detect_anomalies(df, features, table="saison")
     print("Table saison - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : tracer IDSaison vs Etat
     plot_anomalies(data, "IDSaison", "Etat", "Anomalies dans saison")
@@ -96,9 +141,9 @@ def anomaly_saison():
 
 # Détection d'anomalies pour la table tailles
 def anomaly_tailles():
-    df = clean_tailles(engine)
-    features = ["IdTaille", "IDGrille", "Ordre", "isMilieu"]
-    data, anomalies = detect_anomalies(df, features, contamination=0.05)
+    df = cached_clean(get_engine(), "tailles")
+    features = TABLE_FEATURES["tailles"]
+    data, anomalies = detect_anomalies(df, features, table="tailles")
     print("Table tailles - Nombre d'anomalies détectées :", anomalies.shape[0])
     # Visualisation : tracer Ordre vs isMilieu
     plot_anomalies(data, "Ordre", "isMilieu", "Anomalies dans tailles")
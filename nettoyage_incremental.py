@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import argparse
+import pandas as pd
+from sqlalchemy import or_, column as sa_column
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_engine
+from clean import TABLE_SPECS, build_select, clean_chunk, compact_dtypes, _table_columns
+from cache_tables import INCREMENTAL_DIR, table_lock
+
+###############################################################################
+# Nettoyage incrémental : seules les lignes modifiées depuis le dernier passage
+###############################################################################
+# Clé d'upsert de chaque table prise en charge
+INCREMENTAL_KEYS = {
+    "article": "IDArticle",
+    "codebarre": "IDCodeBarre",
+    "fournisseur": "IDFournisseur",
+}
+# Colonnes d'horodatage utilisées si elles existent dans la table
+TIMESTAMP_COLUMNS = ["ModifieLe", "SaisiLe"]
+
+# Instantanés dans le cache : invalidés et évincés comme les tables nettoyées (cache_tables.py)
+SNAPSHOT_DIR = INCREMENTAL_DIR
+STATE_FILE = os.path.join(SNAPSHOT_DIR, "high_water_marks.json")
+
+def _load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_state(state):
+    tmp_path = STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+def _timestamp_columns(engine, table):
+    dropped = set(TABLE_SPECS[table]["drop"])
+    columns = _table_columns(engine, table)
+    return [col for col in TIMESTAMP_COLUMNS if col in columns and col not in dropped]
+
+def _high_water_mark(raw, key, ts_cols, previous=None):
+    """
+    Plus grands horodatage et identifiant vus, calculés sur les lignes brutes lues (avant
+    nettoyage) : une ligne rejetée par le nettoyage fait quand même avancer la marque.
+    """
+    previous = previous or {}
+    times = [pd.to_datetime(raw[col], errors='coerce').max() for col in ts_cols]
+    times.append(pd.Timestamp(previous["hwm_time"]) if previous.get("hwm_time") else pd.NaT)
+    keys = [pd.to_numeric(raw[key], errors='coerce').max(), previous.get("hwm_key")]
+    hwm_time = max((t for t in times if pd.notna(t)), default=None)
+    hwm_key = max((k for k in keys if k is not None and pd.notna(k)), default=None)
+    return {
+        "hwm_time": hwm_time.isoformat() if hwm_time is not None else None,
+        "hwm_key": int(hwm_key) if hwm_key is not None else None,
+    }
+
+def _delta_condition(previous, key, ts_cols):
+    """
+    Lignes modifiées depuis la marque (>= : une ligne modifiée dans la même seconde que
+    la marque est relue, l'upsert rend la relecture sans effet) ou nouvelles lignes par ID
+    (seul critère si la table n'a pas d'horodatage : les mises à jour ne sont alors pas vues).
+    """
+    conditions = []
+    if previous.get("hwm_time"):
+        since = pd.Timestamp(previous["hwm_time"]).to_pydatetime()
+        conditions += [sa_column(col) >= since for col in ts_cols]
+    if previous.get("hwm_key") is not None:
+        conditions.append(sa_column(key) > previous["hwm_key"])
+    return or_(*conditions) if conditions else None
+
+def clean_incremental(engine, table, full=False):
+    """
+    Renvoie la table nettoyée complète en ne lisant que les lignes modifiées depuis le
+    dernier passage. Ces lignes sont nettoyées puis fusionnées dans l'instantané précédent
+    (upsert sur la clé : l'ancienne version est remplacée, ou retirée si la nouvelle ne
+    passe plus le nettoyage). Les suppressions côté MySQL ne sont vues qu'avec `full`.
+    """
+    key = INCREMENTAL_KEYS[table]
+    spec = TABLE_SPECS[table]
+    snapshot_path = os.path.join(SNAPSHOT_DIR, f"{table}.parquet")
+    # Même verrou que le cache de la table : invalidate() n'efface pas l'instantané en cours de mise à jour
+    with table_lock(table):
+        state = _load_state()
+        previous = state.get(table, {})
+        ts_cols = _timestamp_columns(engine, table)
+
+        # Instantané lu avant la requête : s'il a été invalidé ou évincé, relecture complète
+        snapshot = None
+        if not full:
+            try:
+                snapshot = pd.read_parquet(snapshot_path)
+            except FileNotFoundError:
+                pass
+
+        # Projection SQL des colonnes conservées, sans les filtres métier : une ligne qui ne
+        # passe plus les règles doit être lue pour être retirée de l'instantané
+        query = build_select(engine, table, filters=False)
+        condition = None if snapshot is None else _delta_condition(previous, key, ts_cols)
+        if condition is not None:
+            query = query.where(condition)
+
+        raw = pd.read_sql(query, con=engine)
+        hwm = _high_water_mark(raw, key, ts_cols, previous if condition is not None else None)
+        changed_keys = pd.to_numeric(raw[key], errors='coerce').dropna()
+        delta = clean_chunk(raw, spec)
+
+        if condition is None:
+            df = delta.drop_duplicates()
+        else:
+            snapshot = snapshot[~snapshot[key].isin(changed_keys)]
+            df = pd.concat([snapshot, delta]).drop_duplicates()
+        del snapshot
+        df = compact_dtypes(df.reset_index(drop=True), spec)
+
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        df.to_parquet(snapshot_path + ".tmp")
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+        state[table] = hwm
+        _save_state(state)
+
+    mode = "complet" if condition is None else "delta"
+    print(f"{table:<12} ({mode}) {len(raw):>10} lignes lues, {len(df):>10} lignes dans l'instantané")
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rafraîchissement incrémental des tables nettoyées")
+    parser.add_argument("--tables", nargs="+", choices=list(INCREMENTAL_KEYS), default=list(INCREMENTAL_KEYS))
+    parser.add_argument("--complet", action="store_true", help="relire toute la table et reconstruire l'instantané")
+    args = parser.parse_args()
+
+    for table in args.tables:
+        clean_incremental(get_engine(), table, full=args.complet)
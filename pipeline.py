@@ -0,0 +1,375 @@
+import os
+import ast
+import sys
+import json
+import time
+import inspect
+import textwrap
+import hashlib
+import argparse
+import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_engine
+from instrumentation import stage
+
+###############################################################################
+# Pipeline complet : graphe de dépendances, exécution parallèle, reprise sur points de contrôle
+###############################################################################
+# extraction -> nettoyage -> caractéristiques -> modèles -> rapports, un nœud par table et
+# par étape. Les nœuds dont les dépendances sont terminées s'exécutent en même temps
+# (threads par défaut, processus avec --processus).
+# Chaque nœud écrit sa sortie dans PIPELINE_DIR/<nœud>/ puis est enregistré dans
+# STATE_FILE avec sa signature : fonction (son code source et celui des modules du projet
+# qu'elle utilise, directement ou par leurs imports), paramètres et empreintes du
+# contenu des sorties de ses dépendances. À la relance, un nœud dont la signature n'a pas
+# changé et dont la sortie existe est sauté ; un arrêt brutal reprend donc après le dernier
+# nœud terminé. Les nœuds d'extraction (empreinte de la table source, voir
+# cache_tables.table_fingerprint) s'exécutent toujours : ce sont eux qui détectent un
+# changement de données. Un nœud réexécuté dont la sortie est identique ne relance pas la suite.
+PIPELINE_DIR = os.environ.get("PFE_PIPELINE_DIR", "pipeline")
+STATE_FILE = "etat_pipeline.json"
+SUMMARY_FILE = "synthese_anomalies.json"
+AUTOENC_QUANTILE = 0.95
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+###############################################################################
+# --- Nœuds : fonction(inputs, output_dir, **params) -> chemin de la sortie
+###############################################################################
+# `inputs` associe à chaque dépendance le chemin de sa sortie.
+def extract_node(inputs, output_dir, table):
+    """Empreinte de l'état de la table source."""
+    from cache_tables import table_fingerprint
+
+    path = os.path.join(output_dir, "empreinte.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"table": table, "empreinte": table_fingerprint(get_engine(), table)}, f)
+    return path
+
+def clean_node(inputs, output_dir, table):
+    """Table nettoyée (via le cache Parquet de cache_tables.py)."""
+    from cache_tables import cached_clean
+
+    path = os.path.join(output_dir, f"{table}.parquet")
+    cached_clean(get_engine(), table).to_parquet(path)
+    return path
+
+def profile_node(inputs, output_dir, table):
+    """Rapport exploratoire minimal (statistiques exactes par colonne)."""
+    from profilage import profile_table
+
+    profile_table(pd.read_parquet(inputs[f"nettoyage:{table}"]), table, "minimal", output_dir)
+    return os.path.join(output_dir, f"rapport_{table}.html")
+
+def iforest_node(inputs, output_dir, table, prefilter=False):
+    """Isolation Forest sur les features de iso.py, après le filtre statistique si `prefilter`."""
+    from iso import TABLE_FEATURES, detect_anomalies
+
+    df = pd.read_parquet(inputs[f"nettoyage:{table}"])
+    features = [f for f in TABLE_FEATURES[table] if f in df.columns]
+    data, _ = detect_anomalies(df, features, table=table, prefilter=prefilter)
+    path = os.path.join(output_dir, f"iforest_{table}.parquet")
+    data.to_parquet(path)
+    return path
+
+def features_node(inputs, output_dir, table):
+    """Matrice numérique de l'autoencodeur (même prétraitement que anomalie_autoencoder.py)."""
+    df = pd.read_parquet(inputs[f"nettoyage:{table}"])
+    df = df.drop(columns=["Indice", "IDSerieArticle"], errors='ignore').dropna()
+    df = df.select_dtypes(include=[np.number]).drop_duplicates()
+    path = os.path.join(output_dir, f"caracteristiques_{table}.parquet")
+    df.to_parquet(path)
+    return path
+
+def autoencoder_node(inputs, output_dir, table, quantile=AUTOENC_QUANTILE):
+    """Erreur de reconstruction et label de l'autoencodeur (poids réutilisés tant que les données ne changent pas)."""
+    from sklearn.preprocessing import StandardScaler
+    from autoencodeur import get_autoencoder, reconstruction_errors
+
+    df = pd.read_parquet(inputs[f"caracteristiques:{table}"])
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(df)
+    autoenc = get_autoencoder(X_scaled, table, df.columns.tolist(), scaler=scaler)
+    mse = reconstruction_errors(autoenc, X_scaled)
+    result = pd.DataFrame({"autoenc_mse": mse}, index=df.index)
+    result["anomaly"] = np.where(mse > np.quantile(mse, quantile), -1, 1)
+    path = os.path.join(output_dir, f"autoencodeur_{table}.parquet")
+    result.to_parquet(path)
+    return path
+
+def comparative_report_node(inputs, output_dir, table, autoencoder=True):
+    """Rapport comparatif Isolation Forest / autoencodeur (rapport_comparatif_anomalies.py)."""
+    from rapport_comparatif_anomalies import build_comparative_report
+
+    path = os.path.join(output_dir, "rapport_comparatif_anomalies.html")
+    build_comparative_report(pd.read_parquet(inputs[f"nettoyage:{table}"]), path, table, autoencoder)
+    return path
+
+def summary_node(inputs, output_dir):
+    """Nombre de lignes et d'anomalies de chaque modèle."""
+    summary = {}
+    for name, path in sorted(inputs.items()):
+        labels = pd.read_parquet(path, columns=["anomaly"])["anomaly"]
+        summary[name] = {"lignes": len(labels), "anomalies": int((labels == -1).sum())}
+    path = os.path.join(output_dir, SUMMARY_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+###############################################################################
+# --- Graphe
+###############################################################################
+def build_dag(tables=None, autoencoder=True, report=True, prefilter=False):
+    """
+    Nœuds du pipeline : {nom: {"fonction", "depend", "params", "toujours"}}. Par défaut,
+    toutes les tables ayant des features dans iso.py ; `prefilter` passe le filtre
+    statistique avant chaque Isolation Forest.
+    """
+    from iso import TABLE_FEATURES
+
+    tables = list(tables or TABLE_FEATURES)
+    nodes = {}
+
+    def add(name, function, depend=(), always=False, **params):
+        nodes[name] = {"fonction": function, "depend": list(depend), "params": params, "toujours": always}
+
+    for table in tables:
+        add(f"extraction:{table}", extract_node, always=True, table=table)
+        add(f"nettoyage:{table}", clean_node, [f"extraction:{table}"], table=table)
+        add(f"profil:{table}", profile_node, [f"nettoyage:{table}"], table=table)
+        if table in TABLE_FEATURES:
+            add(f"iforest:{table}", iforest_node, [f"nettoyage:{table}"], table=table, prefilter=prefilter)
+    models = [name for name in nodes if name.startswith("iforest:")]
+    if "codebarre" in tables:
+        if autoencoder:
+            add("caracteristiques:codebarre", features_node, ["nettoyage:codebarre"], table="codebarre")
+            add("autoencodeur:codebarre", autoencoder_node, ["caracteristiques:codebarre"], table="codebarre")
+            models.append("autoencodeur:codebarre")
+        if report:
+            add("rapport_comparatif", comparative_report_node, ["nettoyage:codebarre"],
+                table="codebarre", autoencoder=autoencoder)
+    if models:
+        add("synthese", summary_node, models)
+    return nodes
+
+def topological_order(nodes):
+    """Noms des nœuds, chaque nœud après ses dépendances (ValueError si cycle ou dépendance inconnue)."""
+    order, visiting = [], set()
+
+    def visit(name, path=()):
+        if name in order:
+            return
+        if name not in nodes:
+            raise ValueError(f"dépendance inconnue : {name} (requise par {path[-1]})")
+        if name in visiting:
+            raise ValueError(f"cycle dans le pipeline : {' -> '.join(path + (name,))}")
+        visiting.add(name)
+        for dep in nodes[name]["depend"]:
+            visit(dep, path + (name,))
+        order.append(name)
+
+    for name in nodes:
+        visit(name)
+    return order
+
+def _project_module(name):
+    path = os.path.join(PROJECT_DIR, f"{name}.py")
+    return path if os.path.exists(path) else None
+
+def _local_imports(source):
+    """Modules du projet importés par `source`, y compris dans le corps des fonctions."""
+    names = set()
+    for node in ast.walk(ast.parse(textwrap.dedent(source))):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return {name for name in names if _project_module(name)}
+
+def code_modules(function):
+    """
+    Modules du projet dont dépend `function` : ceux qu'elle importe, ceux des objets
+    globaux qu'elle utilise (get_engine -> config), puis leurs propres imports.
+    """
+    pending = _local_imports(inspect.getsource(function))
+    for name in function.__code__.co_names:
+        module = getattr(function.__globals__.get(name), "__module__", None)
+        if module and module != function.__module__ and _project_module(module):
+            pending.add(module)
+    modules = set()
+    while pending:
+        name = pending.pop()
+        if name in modules:
+            continue
+        modules.add(name)
+        with open(_project_module(name), encoding="utf-8") as f:
+            pending |= _local_imports(f.read())
+    return sorted(modules)
+
+def node_signature(name, node, input_digests):
+    """
+    Empreinte de ce qui détermine la sortie du nœud : code de la fonction et des modules du
+    projet qu'elle utilise (voir code_modules), paramètres, entrées.
+    """
+    function = node["fonction"]
+    parts = [
+        name,
+        f"{function.__module__}.{function.__qualname__}",
+        hashlib.sha1(inspect.getsource(function).encode("utf-8")).hexdigest(),
+        [(module, _file_digest(_project_module(module))) for module in code_modules(function)],
+        sorted(node["params"].items()),
+        [(dep, input_digests[dep]) for dep in node["depend"]],
+    ]
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+###############################################################################
+# --- Exécution
+###############################################################################
+def _node_dir(output_dir, name):
+    return os.path.join(output_dir, name.replace(":", "_"))
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_state(state, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _run_node(name, function, inputs, output_dir, params):
+    """Exécute un nœud (dans un thread ou un processus) : (chemin de sortie, empreinte, secondes)."""
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    with stage(name, pipeline=True) as record:
+        path = function(inputs, output_dir, **params)
+        record["sortie"] = path
+    return path, _file_digest(path), round(time.perf_counter() - start, 3)
+
+def run_pipeline(nodes, output_dir=PIPELINE_DIR, max_workers=None, force=(), use_processes=False):
+    """
+    Exécute le graphe `nodes` (voir build_dag). Les nœuds de `force` (ou tous si "tout" en
+    fait partie) sont réexécutés même à jour. L'état est enregistré après chaque nœud
+    terminé. Renvoie {nom: statut}, statut parmi "execute", "a_jour", "echec", "bloque".
+    Un échec n'arrête pas les branches indépendantes ; les nœuds qui en dépendent sont bloqués.
+    """
+    order = topological_order(nodes)
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILE)
+    state = _load_state(state_path)
+    force = set(order) if "tout" in force else set(force)
+
+    status, outputs, digests, running = {}, {}, {}, {}
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        while len(status) < len(order):
+            # Nœuds prêts (toutes les dépendances terminées) : sautés s'ils sont à jour, lancés sinon
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in order:
+                    node = nodes[name]
+                    if name in status or name in running.values():
+                        continue
+                    if any(status.get(dep) in ("echec", "bloque") for dep in node["depend"]):
+                        status[name] = "bloque"
+                        progressed = True
+                        continue
+                    if not all(dep in digests for dep in node["depend"]):
+                        continue
+                    signature = node_signature(name, node, digests)
+                    previous = state.get(name, {})
+                    if (not node["toujours"] and name not in force and previous.get("signature") == signature
+                            and os.path.exists(previous.get("sortie", ""))):
+                        outputs[name], digests[name] = previous["sortie"], previous["empreinte"]
+                        status[name] = "a_jour"
+                        print(f"  {name:<30} à jour")
+                        progressed = True
+                        continue
+                    inputs = {dep: outputs[dep] for dep in node["depend"]}
+                    future = executor.submit(_run_node, name, node["fonction"], inputs,
+                                             _node_dir(output_dir, name), node["params"])
+                    running[future] = name
+                    state[name] = {"signature": signature}
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    path, digest, seconds = future.result()
+                except Exception as exc:
+                    status[name] = "echec"
+                    state.pop(name, None)
+                    print(f"  {name:<30} ÉCHEC : {type(exc).__name__}: {exc}")
+                else:
+                    outputs[name], digests[name] = path, digest
+                    status[name] = "execute"
+                    state[name].update({"sortie": path, "empreinte": digest, "secondes": seconds,
+                                        "termine_le": time.strftime("%Y-%m-%dT%H:%M:%S")})
+                    print(f"  {name:<30} exécuté en {seconds:8.2f} s")
+                # Point de contrôle : seuls les nœuds terminés ont une sortie enregistrée
+                _save_state({n: s for n, s in state.items() if "sortie" in s}, state_path)
+    return {name: status[name] for name in order}
+
+def _seconds_until(hour_minute):
+    hour, minute = map(int, hour_minute.split(":"))
+    now = datetime.datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pipeline complet : nettoyage, modèles et rapports, avec reprise")
+    parser.add_argument("--tables", nargs="+", help="tables à traiter (défaut : celles de iso.py)")
+    parser.add_argument("--workers", type=int, default=None, help="nœuds exécutés en même temps")
+    parser.add_argument("--processus", action="store_true", help="pool de processus au lieu de threads")
+    parser.add_argument("--repertoire", default=PIPELINE_DIR, help="sorties et état du pipeline")
+    parser.add_argument("--forcer", nargs="+", default=[], help="nœuds à réexécuter même à jour (\"tout\" pour tous)")
+    parser.add_argument("--sans-autoencodeur", action="store_true", help="sans TensorFlow")
+    parser.add_argument("--sans-rapport", action="store_true", help="sans le rapport comparatif HTML")
+    parser.add_argument("--filtre", action="store_true", help="filtre statistique avant chaque Isolation Forest")
+    parser.add_argument("--liste", action="store_true", help="afficher les nœuds et leurs dépendances sans exécuter")
+    parser.add_argument("--chaque-jour", metavar="HH:MM", help="exécuter chaque jour à cette heure (sans fin)")
+    args = parser.parse_args()
+
+    nodes = build_dag(args.tables, autoencoder=not args.sans_autoencodeur, report=not args.sans_rapport,
+                      prefilter=args.filtre)
+    unknown = set(args.forcer) - set(nodes) - {"tout"}
+    if unknown:
+        parser.error(f"nœuds inconnus : {', '.join(sorted(unknown))}")
+    if args.liste:
+        state = _load_state(os.path.join(args.repertoire, STATE_FILE))
+        for name in topological_order(nodes):
+            done = state.get(name, {}).get("termine_le", "jamais")
+            print(f"{name:<30} <- {', '.join(nodes[name]['depend']) or '-':<45} dernier passage : {done}")
+        sys.exit(0)
+
+    while True:
+        if args.chaque_jour:
+            delay = _seconds_until(args.chaque_jour)
+            print(f"Prochaine exécution dans {delay / 3600:.1f} h")
+            time.sleep(delay)
+        print(f"=== Pipeline ({len(nodes)} nœuds) ===")
+        start = time.perf_counter()
+        status = run_pipeline(nodes, args.repertoire, args.workers, args.forcer, args.processus)
+        counts = pd.Series(status).value_counts()
+        print(f"=== Terminé en {time.perf_counter() - start:.2f} s : "
+              + ", ".join(f"{n} {s}" for s, n in counts.items()) + " ===")
+        if not args.chaque_jour:
+            sys.exit(1 if {"echec", "bloque"} & set(status.values()) else 0)
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from instrumentation import LOG_DIR
+
+try:
+    import resource
+except ImportError:  # Windows : pas de mesure du pic mémoire
+    resource = None
+
+###############################################################################
+# Profilage des tables : modes "minimal", "sampled" et "full"
+###############################################################################
+#   minimal : statistiques exactes par colonne, calculées en une passe vectorisée
+#   sampled : rapport ydata_profiling sur un échantillon stratifié + statistiques exactes
+#   full    : rapport ydata_profiling explorative sur toute la table (comportement historique)
+PROFILE_MODES = ("minimal", "sampled", "full")
+SAMPLE_SIZE = 100_000
+# Colonne de stratification de l'échantillon (à défaut "Etat" si présente)
+STRATA_COLUMNS = {
+    "codebarre": "isSynchronized",
+    "tailles": "isMilieu",
+}
+# Journal des mesures de chaque rapport (répertoire des journaux, PFE_LOG_DIR)
+PROFILE_LOG = os.path.join(LOG_DIR, "rapports_profilage.jsonl")
+
+def _frequencies(df):
+    """
+    Valeur la plus fréquente et nombre de valeurs distinctes de chaque colonne, en une passe
+    pour toute la table : les colonnes sont mises bout à bout et factorisées ensemble, puis
+    les couples (colonne, valeur) sont comptés. En cas d'égalité, la première valeur rencontrée.
+    """
+    n_rows, n_cols = df.shape
+    codes, uniques = pd.factorize(df.to_numpy(dtype=object).ravel(order='F'))
+    valid = codes >= 0
+    pairs = np.repeat(np.arange(n_cols), n_rows)[valid] * len(uniques) + codes[valid]
+    pair_codes, pair_values = pd.factorize(pairs)
+    counts = np.bincount(pair_codes)
+    columns = pair_values // len(uniques)
+    order = np.lexsort((-counts, columns))
+    first = order[np.r_[True, columns[order][1:] != columns[order][:-1]]] if len(order) else order
+    most_frequent = pd.Series(None, index=df.columns, dtype=object)
+    most_frequent.iloc[columns[first]] = uniques[pair_values[first] % len(uniques)]
+    return most_frequent, pd.Series(np.bincount(columns, minlength=n_cols), index=df.columns)
+
+def column_stats(df):
+    """
+    Statistiques exactes par colonne : type, valeurs manquantes, distinctes, et pour les
+    colonnes numériques moyenne / écart-type / min / max ; valeur la plus fréquente sinon.
+    """
+    missing = df.isna().sum()
+    numeric = df.select_dtypes(include="number")
+    others = df.columns.difference(numeric.columns, sort=False)
+    most_frequent, distinct = _frequencies(df[others]) if len(others) else (None, pd.Series(dtype="int64"))
+    stats = pd.DataFrame({
+        "type": df.dtypes.astype(str),
+        "non_nuls": len(df) - missing,
+        "manquants": missing,
+        "manquants_%": (100 * missing / max(len(df), 1)).round(2),
+        "distincts": pd.concat([numeric.nunique(), distinct]).reindex(df.columns),
+    })
+    if not numeric.empty:
+        stats = stats.join(numeric.agg(["mean", "std", "min", "max"]).T)
+    if len(others):
+        stats["plus_frequente"] = most_frequent
+    return stats
+
+def stratified_sample(df, table, size=SAMPLE_SIZE, random_state=42):
+    """Échantillon de `size` lignes environ, chaque strate gardant sa proportion."""
+    if len(df) <= size:
+        return df
+    strata = STRATA_COLUMNS.get(table, "Etat")
+    frac = size / len(df)
+    if strata not in df.columns:
+        return df.sample(frac=frac, random_state=random_state)
+    return df.groupby(strata, dropna=False, group_keys=False).sample(frac=frac, random_state=random_state)
+
+def _rss_mb(field="VmRSS"):
+    """Mémoire résidente du processus (Mo) : actuelle (VmRSS) ou pic (VmHWM) ; ru_maxrss hors Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss est en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+
+def _reset_peak_rss():
+    """Remet le pic de mémoire résidente (VmHWM) au niveau actuel ; False si le noyau ne le permet pas."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _write_stats_html(stats, title, path, n_rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<html><head><meta charset='utf-8'><title>{title}</title></head><body>")
+        f.write(f"<h2>{title}</h2><p><strong>Lignes :</strong> {n_rows}</p>")
+        f.write(stats.to_html(border=1, float_format=lambda x: f"{x:.4g}"))
+        f.write("</body></html>")
+
+def profile_table(df, table, mode="minimal", output_dir=".", sample_size=SAMPLE_SIZE):
+    """
+    Génère le rapport de `table` selon `mode` et renvoie son temps de calcul, son pic
+    mémoire (Mo) et la taille du fichier produit. Le pic est mesuré au-delà de la mémoire
+    résidente au départ : un worker forké hérite de celle du processus parent, qui n'est
+    pas due au rapport.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Mode de profilage inconnu : {mode} (attendu : {', '.join(PROFILE_MODES)})")
+    os.makedirs(output_dir, exist_ok=True)
+    _reset_peak_rss()
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    title = f"Rapport Exploratoire - {table}"
+    output_file = os.path.join(output_dir, f"rapport_{table}.html")
+
+    if mode == "full":
+        from ydata_profiling import ProfileReport
+        ProfileReport(df, title=title, explorative=True).to_file(output_file)
+    else:
+        stats = column_stats(df)
+        if mode == "minimal":
+            _write_stats_html(stats, title, output_file, len(df))
+        else:
+            from ydata_profiling import ProfileReport
+            sample = stratified_sample(df, table, sample_size)
+            description = f"Échantillon stratifié de {len(sample)} lignes sur {len(df)} ; statistiques exactes : rapport_{table}_stats.html"
+            ProfileReport(sample, title=f"{title} (échantillon)", explorative=True,
+                          dataset={"description": description}).to_file(output_file)
+            _write_stats_html(stats, f"{title} - statistiques exactes", os.path.join(output_dir, f"rapport_{table}_stats.html"), len(df))
+
+    # Pic remis à zéro au départ (VmHWM) ; à défaut, pic depuis le démarrage du processus
+    peak_rss = _rss_mb("VmHWM")
+    peak_mb = max(peak_rss - rss_start, 0.0) if peak_rss is not None and rss_start is not None else None
+    return {
+        "table": table,
+        "mode": mode,
+        "lignes": len(df),
+        "secondes": round(time.perf_counter() - start, 3),
+        "pic_memoire_mo": round(peak_mb, 1) if peak_mb is not None else None,
+        "taille_fichier_ko": round(os.path.getsize(output_file) / 1024, 1),
+    }
+
+def profile_tables(frames, mode="minimal", max_workers=None, output_dir="."):
+    """
+    Profile plusieurs tables ({nom: DataFrame}) en parallèle, un processus neuf (spawn)
+    par rapport : le pic mémoire mesuré est donc celui du rapport. Chaque mesure est affichée et
+    ajoutée au journal JSON lines PROFILE_LOG.
+    """
+    metrics = []
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(profile_table, df, table, mode, output_dir) for table, df in frames.items()]
+        for future in as_completed(futures):
+            m = future.result()
+            metrics.append(m)
+            print(f"  rapport {m['table']:<12} ({m['mode']}) {m['secondes']:8.2f} s  "
+                  f"{m['pic_memoire_mo']} Mo  {m['taille_fichier_ko']} Ko")
+    os.makedirs(os.path.dirname(PROFILE_LOG), exist_ok=True)
+    with open(PROFILE_LOG, "a", encoding="utf-8") as f:
+        for m in metrics:
+            f.write(json.dumps({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), **m}) + "\n")
+    return metrics
@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from detecteur import latest_detector, SCORE_BATCH_SIZE
+
+###############################################################################
+# Service de scoring d'anomalies : Isolation Forest + autoencodeur + score d'ensemble
+###############################################################################
+# Les modèles sauvegardés (detecteur.py, autoencodeur.py) sont chargés une seule fois au
+# démarrage. Les requêtes HTTP arrivent sur plusieurs threads ; leurs lignes sont
+# regroupées en micro-lots (jusqu'à MAX_BATCH_ROWS lignes ou MAX_WAIT_SECONDS d'attente)
+# et scorées en un seul appel par table.
+#
+#   POST /score/<table>   {"lignes": [{colonne: valeur, ...}, ...]}
+#   GET  /sante           modèles chargés et compteurs
+#
+# Scores renvoyés pour chaque ligne (null s'il manque une feature) :
+#   score_iforest  : decision_function (négatif = anomalie)
+#   ratio_iforest  : score_samples / seuil du modèle (> 1 = anomalie)
+#   mse_autoenc    : erreur de reconstruction ; ratio_autoenc = mse / seuil (> 1 = anomalie)
+#   score_ensemble : moyenne des ratios disponibles ; anomalie = score_ensemble > 1
+SERVICE_TABLES = ["codebarre", "fournisseur"]
+MAX_BATCH_ROWS = SCORE_BATCH_SIZE
+MAX_WAIT_SECONDS = 0.01
+HOST = os.environ.get("PFE_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.environ.get("PFE_SERVICE_PORT", 8765))
+
+def _fit_autoencoder(table, detector):
+    """
+    Autoencodeur appris sur les features du détecteur (table nettoyée actuelle, même
+    standardisation que lui) ; rechargé sans réapprentissage si ces données n'ont pas changé.
+    """
+    from config import get_engine
+    from cache_tables import cached_clean
+    from autoencodeur import get_autoencoder
+
+    X = cached_clean(get_engine(), table)[detector["features"]].apply(pd.to_numeric, errors='coerce').dropna()
+    if len(X) == 0:
+        return None
+    print(f"{table:<12} aucun autoencodeur sur les features du détecteur : apprentissage")
+    X_scaled = detector["scaler"].transform(X.to_numpy(dtype="float64"))
+    return get_autoencoder(X_scaled, table, detector["features"], scaler=detector["scaler"])
+
+def load_models(tables=SERVICE_TABLES, autoencoder=True, current_data=False):
+    """
+    {table: {"detector", "autoencoder"}} pour les tables qui ont un détecteur sauvegardé :
+    celui de la table entière, sur les features de iso.py conservées par le nettoyage et
+    les paramètres retenus. Avec `current_data`, seul le détecteur appris sur l'état
+    actuel de la table nettoyée (même empreinte de données) est accepté. L'autoencodeur
+    est celui des features du détecteur ; s'il n'existe pas, il est appris au démarrage.
+    """
+    from iso import TABLE_FEATURES
+    from clean import TABLE_SPECS
+
+    models = {}
+    for table in tables:
+        # Les colonnes retirées par le nettoyage ne font partie d'aucun détecteur sauvegardé
+        dropped = set(TABLE_SPECS[table]["drop"])
+        features, fingerprint = [f for f in TABLE_FEATURES[table] if f not in dropped], None
+        if current_data:
+            from config import get_engine
+            from cache_tables import cached_clean
+            from detecteur import data_fingerprint
+            df = cached_clean(get_engine(), table)
+            features = [f for f in features if f in df.columns]
+            fingerprint = data_fingerprint(df[features].dropna())
+        detector = latest_detector(table, features, fingerprint)
+        if detector is None:
+            print(f"{table:<12} aucun détecteur sauvegardé : table non servie")
+            continue
+        autoenc = None
+        if autoencoder:
+            from autoencodeur import latest_autoencoder
+            autoenc = latest_autoencoder(table, detector["features"])
+            if autoenc is not None and not {"seuil", "scaler"} <= set(autoenc):
+                autoenc = None  # poids antérieurs à l'enregistrement du seuil ou du scaler
+            if autoenc is None:
+                autoenc = _fit_autoencoder(table, detector)
+        models[table] = {"detector": detector, "autoencoder": autoenc}
+        print(f"{table:<12} Isolation Forest ({len(detector['features'])} features, appris le "
+              f"{detector.get('fitted_at', '?')})" + (" + autoencodeur" if autoenc is not None else ""))
+    return models
+
+def score_rows(models, table, df):
+    """Scores de chaque modèle et score d'ensemble pour les lignes de `df` (index conservé)."""
+    detector, autoenc = models[table]["detector"], models[table]["autoencoder"]
+    X = df.reindex(columns=detector["features"]).apply(pd.to_numeric, errors='coerce')
+    complete = X.notna().all(axis=1).to_numpy()
+    X_complete = X.to_numpy(dtype="float64")[complete]
+    X_scaled = detector["scaler"].transform(X_complete)
+
+    result = pd.DataFrame(index=df.index, columns=["score_iforest", "ratio_iforest"], dtype="float64")
+    model = detector["model"]
+    samples = model.score_samples(X_scaled) if len(X_scaled) else np.empty(0)
+    result.loc[complete, "score_iforest"] = samples - model.offset_
+    result.loc[complete, "ratio_iforest"] = samples / model.offset_
+    ratios = ["ratio_iforest"]
+    if autoenc is not None:
+        from autoencodeur import reconstruction_errors, scale_inputs
+        # Standardisation propre à l'autoencodeur : celle de son apprentissage, pas celle du détecteur
+        mse = reconstruction_errors(autoenc, scale_inputs(autoenc, X_complete), log=False) if len(X_complete) else np.empty(0)
+        result["mse_autoenc"] = np.nan
+        result["ratio_autoenc"] = np.nan
+        result.loc[complete, "mse_autoenc"] = mse
+        result.loc[complete, "ratio_autoenc"] = mse / autoenc["seuil"]
+        ratios.append("ratio_autoenc")
+    result["score_ensemble"] = result[ratios].mean(axis=1, skipna=False)
+    result["anomalie"] = (result["score_ensemble"] > 1).where(result["score_ensemble"].notna())
+    return result
+
+class MicroBatcher:
+    """
+    File d'attente partagée par les threads HTTP : un thread de scoring regroupe les
+    requêtes en attente, score chaque table en un seul appel et rend à chaque requête
+    ses lignes (Future).
+    """
+    def __init__(self, models, max_rows=MAX_BATCH_ROWS, max_wait=MAX_WAIT_SECONDS):
+        self.models = models
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        self.stats = {"requetes": 0, "lots": 0, "lignes": 0, "secondes_scoring": 0.0}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, table, df):
+        future = Future()
+        self.pending.put((table, df, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        n_rows = len(batch[0][1])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_rows:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_rows += len(item[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            for table in {item[0] for item in batch}:
+                items = [item for item in batch if item[0] == table]
+                try:
+                    frames = pd.concat([df for _, df, _ in items], keys=range(len(items)))
+                    scores = score_rows(self.models, table, frames)
+                    for i, (_, _, future) in enumerate(items):
+                        future.set_result(scores.xs(i, level=0))
+                except Exception as exc:  # l'erreur est rendue à chaque requête du lot
+                    for _, _, future in items:
+                        future.set_exception(exc)
+            self.stats["requetes"] += len(batch)
+            self.stats["lots"] += 1
+            self.stats["lignes"] += sum(len(df) for _, df, _ in batch)
+            self.stats["secondes_scoring"] += time.perf_counter() - start
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/sante":
+            return self._send(404, {"erreur": "chemin inconnu"})
+        models = self.batcher.models
+        self._send(200, {
+            "tables": {table: {"features": m["detector"]["features"], "autoencodeur": m["autoencoder"] is not None}
+                       for table, m in models.items()},
+            **self.batcher.stats,
+        })
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "score":
+            return self._send(404, {"erreur": "chemin inconnu (POST /score/<table>)"})
+        table = parts[1]
+        if table not in self.batcher.models:
+            return self._send(404, {"erreur": f"table non servie : {table}"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            rows = payload["lignes"] if isinstance(payload, dict) else payload
+            df = pd.DataFrame.from_records(rows)
+        except (ValueError, KeyError, TypeError) as exc:
+            return self._send(400, {"erreur": f"corps JSON invalide : {exc}"})
+        if df.empty:
+            return self._send(200, {"resultats": []})
+        scores = self.batcher.submit(table, df).result()
+        self._send(200, {"resultats": _records(scores)})
+
+    def log_message(self, format, *args):
+        pass  # pas de ligne de log par requête
+
+class ScoringServer(ThreadingHTTPServer):
+    # File d'attente des connexions assez longue pour des rafales de petites requêtes
+    request_queue_size = 128
+    daemon_threads = True
+
+def serve(host=HOST, port=PORT, tables=SERVICE_TABLES, autoencoder=True, current_data=False):
+    ScoringHandler.batcher = MicroBatcher(load_models(tables, autoencoder, current_data))
+    server = ScoringServer((host, port), ScoringHandler)
+    print(f"Service de scoring sur http://{host}:{port} (POST /score/<table>, GET /sante)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Service de scoring d'anomalies (HTTP ou fichier CSV)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--tables", nargs="+", default=SERVICE_TABLES)
+    parser.add_argument("--sans-autoencodeur", action="store_true", help="Isolation Forest seul (sans TensorFlow)")
+    parser.add_argument("--fichier", help="scorer ce CSV une fois au lieu de démarrer le service")
+    parser.add_argument("--table", default="codebarre", help="table des lignes du fichier (avec --fichier)")
+    parser.add_argument("--sortie", default="scores.csv", help="résultat du scoring du fichier")
+    parser.add_argument("--donnees-actuelles", action="store_true",
+                        help="n'accepter que les détecteurs appris sur l'état actuel des tables")
+    args = parser.parse_args()
+
+    if args.fichier:
+        models = load_models([args.table], not args.sans_autoencodeur, args.donnees_actuelles)
+        if args.table not in models:
+            sys.exit(1)
+        with open(args.sortie, "w", encoding="utf-8", newline="") as out:
+            for i, chunk in enumerate(pd.read_csv(args.fichier, chunksize=MAX_BATCH_ROWS)):
+                chunk.join(score_rows(models, args.table, chunk)).to_csv(out, header=(i == 0), index=False)
+        print(f"Scores écrits dans {args.sortie}")
+    else:
+        serve(args.host, args.port, args.tables, not args.sans_autoencodeur, args.donnees_actuelles)
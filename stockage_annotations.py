@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+###############################################################################
+# Stockage des annotations manuelles (SQLite)
+###############################################################################
+# Une ligne par élément annoté, clé primaire = identifiant (index B-tree) : annoter est
+# un INSERT, pas une réécriture du fichier. La file d'annotation garde la priorité de
+# chaque élément (indexée) : l'élément suivant est lu par une requête indexée.
+ANNOTATION_DB = os.environ.get("PFE_ANNOTATION_DB", "annotations_fournisseur.db")
+# Ancien format (réécrit à chaque clic), importé une fois dans la base si elle est vide
+LEGACY_CSV = "annotations_fournisseur.csv"
+KEY = "IDFournisseur"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS annotations (
+    {KEY} INTEGER PRIMARY KEY,
+    annotation INTEGER NOT NULL,
+    annote_le TEXT NOT NULL,
+    donnees TEXT
+);
+CREATE TABLE IF NOT EXISTS file_annotation (
+    {KEY} INTEGER PRIMARY KEY,
+    priorite REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_file_priorite ON file_annotation (priorite);
+"""
+
+def connect(path=ANNOTATION_DB, check_same_thread=True):
+    """
+    Ouvre la base et crée son schéma. `with conn:` ne fait que valider la transaction :
+    fermer la connexion avec conn.close() (ou contextlib.closing). check_same_thread=False
+    permet de partager une connexion entre threads (reruns Streamlit).
+    """
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    if os.path.exists(LEGACY_CSV) and conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0] == 0:
+        import_csv(conn, LEGACY_CSV)
+    return conn
+
+def import_csv(conn, path):
+    """Importe un fichier d'annotations CSV (colonnes de la table + annotation)."""
+    legacy = pd.read_csv(path).drop_duplicates(KEY, keep="last")
+    rows = [(int(row[KEY]), int(row["annotation"]), time.strftime("%Y-%m-%dT%H:%M:%S"),
+             json.dumps(row.drop(labels=["annotation"]).to_dict(), default=str))
+            for _, row in legacy.iterrows()]
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+def annotate(conn, key, label, row=None):
+    """Enregistre (ou remplace) l'annotation de `key` : 1 = anomalie, 0 = normal."""
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?)",
+                     (int(key), int(label), time.strftime("%Y-%m-%dT%H:%M:%S"),
+                      json.dumps(row, default=str) if row is not None else None))
+
+def load_annotations(conn):
+    """DataFrame (IDFournisseur, annotation) de toutes les annotations."""
+    return pd.read_sql(f"SELECT {KEY}, annotation FROM annotations", conn)
+
+def set_queue(conn, keys, priorities):
+    """Remplace la file d'annotation : les plus petites priorités sortent en premier."""
+    with conn:
+        conn.execute("DELETE FROM file_annotation")
+        conn.executemany("INSERT INTO file_annotation VALUES (?, ?)",
+                         zip(map(int, keys), map(float, priorities)))
+
+def next_to_annotate(conn):
+    """Identifiant suivant de la file non encore annoté (requête indexée), ou None."""
+    row = conn.execute(f"""
+        SELECT f.{KEY} FROM file_annotation f
+        WHERE NOT EXISTS (SELECT 1 FROM annotations a WHERE a.{KEY} = f.{KEY})
+        ORDER BY f.priorite LIMIT 1
+    """).fetchone()
+    return row[0] if row else None
+
+def progress(conn):
+    """(annotés, total de la file)."""
+    annotated = conn.execute(f"""
+        SELECT COUNT(*) FROM file_annotation f JOIN annotations a ON a.{KEY} = f.{KEY}
+    """).fetchone()[0]
+    return annotated, conn.execute("SELECT COUNT(*) FROM file_annotation").fetchone()[0]
+
+def uncertainty_priorities(scores):
+    """
+    Apprentissage actif : les lignes dont le score Isolation Forest est le plus proche du
+    seuil (decision_function ~ 0) sont les plus incertaines et passent en premier ; les
+    lignes sans score passent en dernier.
+    """
+    scores = np.asarray(scores, dtype="float64")
+    return np.where(np.isnan(scores), np.inf, np.abs(scores))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stockage des annotations fournisseur")
+    parser.add_argument("--importer", help="importer un CSV d'annotations")
+    parser.add_argument("--exporter", help="exporter les annotations en CSV")
+    args = parser.parse_args()
+
+    with closing(connect()) as conn:
+        if args.importer:
+            print(f"{import_csv(conn, args.importer)} annotation(s) importée(s)")
+        if args.exporter:
+            load_annotations(conn).to_csv(args.exporter, index=False)
+        annotated, total = progress(conn)
+        print(f"{len(load_annotations(conn))} annotation(s) dans {ANNOTATION_DB} ({annotated}/{total} de la file)")
@@ -1,50 +1,48 @@
-import mysql.connector
+import os
+import sys
 import pandas as pd
-from ydata_profiling import ProfileReport
 
-# Configuration de la connexion MySQL
-config = {
-    'host': 'localhost',           # Adresse du serveur MySQL
-    'user': 'root',                # Nom d'utilisateur MySQL (modifiez si nécessaire)
-    'password': 'louzisql',                # Mot de passe MySQL (modifiez si nécessaire)
-    'database': 'pfe'  # Nom de votre base de données (modifiez si nécessaire)
-}
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import get_engine
+from profilage import profile_tables, PROFILE_MODES
 
-# Connexion à la base de données
-try:
-    conn = mysql.connector.connect(**config)
-    print("Connexion réussie à la base de données.")
-except mysql.connector.Error as err:
-    print(f"Erreur lors de la connexion : {err}")
-    exit(1)
+# Les rapports sont générés dans des processus neufs (contexte spawn de profile_tables) :
+# code principal protégé
+if __name__ == '__main__':
+    # Mode de profilage : minimal (défaut), sampled ou full (rapport ydata complet)
+    mode = sys.argv[1] if len(sys.argv) > 1 else "minimal"
+    if mode not in PROFILE_MODES:
+        print(f"Mode inconnu : {mode} (attendu : {', '.join(PROFILE_MODES)})")
+        sys.exit(1)
 
-# Liste des tables connues dans votre projet
-tables = [
-    'ar_sfamille',
-    'arfamille',
-    'article',
-    'codebarre',
-    'fournisseur',
-    'grille',
-    'saison',
-    'tailles'
-]
+    # Connexion à la base de données (paramètres de config.py : pfe.ini ou variables PFE_DB_*)
+    engine = get_engine()
 
-# Génération des rapports exploratoires pour chaque table
-for table_name in tables:
-    try:
-        print(f"Traitement de la table '{table_name}'...")
-        # Lecture des données de la table dans un DataFrame
-        df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        
-        # Génération du rapport exploratoire
-        report = ProfileReport(df, title=f"Rapport Exploratoire - {table_name}", explorative=True)
-        output_file = f"rapport_{table_name}.html"
-        report.to_file(output_file)
-        print(f"Rapport généré pour '{table_name}' : {output_file}\n")
-    except Exception as e:
-        print(f"Erreur lors du traitement de la table '{table_name}' : {e}\n")
+    # Liste des tables connues dans votre projet
+    tables = [
+        'ar_sfamille',
+        'arfamille',
+        'article',
+        'codebarre',
+        'fournisseur',
+        'grille',
+        'saison',
+        'tailles'
+    ]
 
-# Fermeture de la connexion
-conn.close()
-print("Connexion fermée.")
+    # Lecture des tables brutes (non nettoyées), puis génération des rapports exploratoires
+    # en parallèle ; chaque mesure est ajoutée au journal PROFILE_LOG de profilage.py
+    frames = {}
+    for table_name in tables:
+        try:
+            print(f"Lecture de la table '{table_name}'...")
+            frames[table_name] = pd.read_sql(f"SELECT * FROM {table_name}", engine)
+        except Exception as e:
+            print(f"Erreur lors de la lecture de la table '{table_name}' : {e}\n")
+
+    profile_tables(frames, mode=mode)
+    print(f"Rapports générés : {', '.join(f'rapport_{name}.html' for name in frames)}\n")
+
+    # Libération des connexions
+    engine.dispose()
+    print("Connexions fermées.")
@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("PFE_INSTRUMENT", "0")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filtre_statistique import baseline_scores, fit_baseline, has_checks, measure_columns
+from iso import detect_anomalies
+
+def saison_like(n=1000, seed=0):
+    # Table sans colonne de mesure : identifiants, indicateur 0/1 déséquilibré, code à 3 valeurs
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "IDSaison": np.arange(n),
+        "Etat": (rng.random(n) < 0.9).astype("int64"),
+        "IDTypeSaison": rng.integers(1, 4, n),
+        "Code": rng.integers(0, 3, n),
+    })
+
+def test_fallback_ignores_flags_and_codes():
+    df = saison_like()
+    assert measure_columns(df) == []
+    baseline = fit_baseline(df)
+    assert not has_checks(baseline)
+    assert not baseline_scores(df, baseline)["anomalie_stat"].any()
+
+def test_fallback_keeps_continuous_columns():
+    df = saison_like().assign(Montant=np.random.default_rng(1).normal(100, 10, 1000))
+    assert measure_columns(df) == ["Montant"]
+
+def test_prefilter_does_not_flag_minority_flag_values():
+    df = saison_like()
+    features = ["IDSaison", "Etat", "IDTypeSaison"]
+    plain, _ = detect_anomalies(df, features)
+    filtered, _ = detect_anomalies(df, features, prefilter=True)
+    pd.testing.assert_series_equal(plain["anomaly"], filtered["anomaly"])
+    assert (filtered.loc[filtered["Etat"] == 0, "anomaly"] == -1).sum() < (df["Etat"] == 0).sum()